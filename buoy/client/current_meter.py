@@ -5,9 +5,11 @@ import logging.config
 
 import buoy.client.utils.argsparse as args_parse
 import buoy.client.utils.config as load_config
+from buoy.client.device.common.base import RUNTIME_THREADS
 from buoy.client.device.common.database import DeviceDB
+from buoy.client.device.common.item import set_numeric_backend, NUMERIC_FLOAT
 from buoy.client.device.currentmeter.acmplus import ACMPlus, ACMPlusItem
-from buoy.client.service.daemon import Daemon, get_config
+from buoy.client.service.daemon import Daemon, get_config, get_device_options
 
 DEVICE_NAME = 'ACMPlus'
 DAEMON_NAME = 'current-meter'
@@ -18,10 +20,16 @@ logger = logging.getLogger(__name__)
 class CurrentMeterDaemon(ACMPlus, Daemon):
     def __init__(self, name, buoy_config):
         serial_config, mqtt_config, db_config, service_config = get_config(name, buoy_config=buoy_config)
+        set_numeric_backend(buoy_config['device'][name].get('numeric', NUMERIC_FLOAT))
         db = DeviceDB(db_config=db_config, db_tablename=name, cls_item=ACMPlusItem)
 
         Daemon.__init__(self, daemon_name=DAEMON_NAME, daemon_config=service_config)
-        ACMPlus.__init__(self, serial_config=serial_config, db=db, mqtt=mqtt_config)
+        ACMPlus.__init__(self, serial_config=serial_config, db=db, mqtt=mqtt_config,
+                         reader=get_device_options(name, buoy_config, 'reader'),
+                         save=get_device_options(name, buoy_config, 'save'),
+                         metrics=get_device_options(name, buoy_config, 'metrics'),
+                         tracing=get_device_options(name, buoy_config, 'tracing'),
+                         runtime=buoy_config['device'][name].get('runtime', RUNTIME_THREADS))
 
     def before_stop(self):
         self.disconnect()
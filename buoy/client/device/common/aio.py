@@ -0,0 +1,553 @@
+# -*- coding: utf-8 -*-
+
+import asyncio
+import logging
+from concurrent.futures import ThreadPoolExecutor
+from typing import List
+
+import paho.mqtt.client as mqtt
+
+from buoy.client.device.common.bandwidth import BandwidthBudget
+from buoy.client.device.common.base import DeviceReader, READ_MODE_POLLING, group_ids_by_class, pack_items, \
+    create_codec, has_binary_batches, check_batch_topic, backlog_message_size, register_budget_metrics, report_budget
+from buoy.client.device.common.database import create_backlog, DRAIN_OLDEST
+from buoy.client.device.common.exceptions import LostConnectionException
+from buoy.client.device.common.item import BaseItem
+from buoy.client.device.common.metrics import MetricsRegistry
+from buoy.client.device.common.outbox import Outbox
+from buoy.client.device.common.tracing import Tracer, STAGE_COMMITTED, STAGE_PUBLISHED, STAGE_ACKED
+from buoy.client.internet_connection import is_connected_to_internet
+
+logger = logging.getLogger(__name__)
+
+
+class AsyncMQTTClient(object):
+    """
+    Integra el cliente paho en un bucle asyncio, sin hilo propio. El socket del cliente se registra
+    en el bucle y cada publicación retorna un futuro que se resuelve con la confirmación del broker.
+    """
+
+    def __init__(self, client: mqtt.Client, loop: asyncio.AbstractEventLoop):
+        self.client = client
+        self.loop = loop
+        self._acks = {}
+        self._misc = None
+
+        client.on_socket_open = self._on_socket_open
+        client.on_socket_close = self._on_socket_close
+        client.on_socket_register_write = self._on_socket_register_write
+        client.on_socket_unregister_write = self._on_socket_unregister_write
+        client.on_publish = self._on_publish
+
+    async def connect(self, host: str, port: int, keepalive: int):
+        """ Conecta con el broker. La resolución DNS y la conexión TCP se hacen fuera del bucle """
+        await self.loop.run_in_executor(None, self.client.connect, host, port, keepalive)
+
+    def disconnect(self):
+        self.client.disconnect()
+
+    def publish(self, topic: str, payload, qos: int = 0, retain: bool = False) -> asyncio.Future:
+        """
+        Publica el mensaje sin bloquear
+
+        :return: Futuro con el código de resultado de la publicación
+        """
+        future = self.loop.create_future()
+        info = self.client.publish(topic, payload, qos=qos, retain=retain)
+        if info.rc != mqtt.MQTT_ERR_SUCCESS or info.is_published():
+            future.set_result(info.rc)
+        else:
+            self._acks[info.mid] = future
+            # Si se cancela la espera (p. ej. por publish_timeout) se olvida la confirmación pendiente
+            future.add_done_callback(lambda f, mid=info.mid: f.cancelled() and self._acks.pop(mid, None))
+
+        return future
+
+    @property
+    def pending_acks(self) -> int:
+        """ Publicaciones pendientes de confirmación del broker """
+        return len(self._acks)
+
+    def fail_pending(self, rc=mqtt.MQTT_ERR_CONN_LOST):
+        """ Resuelve con error las publicaciones pendientes de confirmación """
+        acks, self._acks = self._acks, {}
+        for future in acks.values():
+            if not future.done():
+                future.set_result(rc)
+
+    def _on_publish(self, client, userdata, mid):
+        future = self._acks.pop(mid, None)
+        if future and not future.done():
+            future.set_result(mqtt.MQTT_ERR_SUCCESS)
+
+    def _on_socket_open(self, client, userdata, sock):
+        self.loop.call_soon_threadsafe(self._register, sock)
+
+    def _on_socket_close(self, client, userdata, sock):
+        self.loop.call_soon_threadsafe(self._unregister, sock)
+
+    def _on_socket_register_write(self, client, userdata, sock):
+        self.loop.call_soon_threadsafe(self.loop.add_writer, sock, client.loop_write)
+
+    def _on_socket_unregister_write(self, client, userdata, sock):
+        self.loop.call_soon_threadsafe(self.loop.remove_writer, sock)
+
+    def _register(self, sock):
+        self.loop.add_reader(sock, self.client.loop_read)
+        self._misc = self.loop.create_task(self._loop_misc())
+
+    def _unregister(self, sock):
+        self.loop.remove_reader(sock)
+        self.loop.remove_writer(sock)
+        if self._misc:
+            self._misc.cancel()
+            self._misc = None
+        self.fail_pending()
+
+    async def _loop_misc(self):
+        """ Mantiene el keepalive y los reintentos de paho """
+        while self.client.loop_misc() == mqtt.MQTT_ERR_SUCCESS:
+            await asyncio.sleep(1)
+
+
+class AsyncItemSender(object):
+    """
+    Versión asyncio de ItemSendThread. Publica los datos que llegan del guardado y, cuando no hay,
+    los pendientes de la base de datos, con hasta max_inflight mensajes esperando confirmación.
+
+    Con batch_publish, los pendientes de la base de datos se agrupan en mensajes de como máximo
+    batch_max_bytes, con el formato y la compresión de la configuración, igual que en ItemSendThread.
+    """
+
+    def __init__(self, db, queue_send_data: asyncio.Queue, loop: asyncio.AbstractEventLoop,
+                 executor: ThreadPoolExecutor, **kwargs):
+        self.db = db
+        self.queue_send_data = queue_send_data
+        self.loop = loop
+        self.executor = executor
+        self.connected_to_mqtt = False
+        self._connected = asyncio.Event()
+
+        self.client_id = kwargs.pop("client_id", "")
+        self.clean_session = kwargs.pop("clean_session", True)
+        self.broker_url = kwargs.pop("broker_url", "iot.eclipse.org")
+        self.broker_port = kwargs.pop("broker_port", 1883)
+        self.topic_data = kwargs.pop("topic_data", "buoy")
+        self.topics = kwargs.pop("topics", None) or {}
+        self.batch_publish = kwargs.pop("batch_publish", False)
+        self.batch_max_bytes = kwargs.pop("batch_max_bytes", 8192)
+        self.topic_batch = kwargs.pop("topic_batch", self.topic_data)
+        self.codec = create_codec(kwargs)
+        self.binary_batches = has_binary_batches(self.codec)
+        check_batch_topic(self)
+        self.keepalive = kwargs.pop("keepalive", 60)
+        self.qos = kwargs.pop("qos", 0)
+        self.publish_timeout = kwargs.pop("publish_timeout", 60)
+        self.backlog_interval = kwargs.pop("backlog_interval", 10)
+        self.reconnect_interval = kwargs.pop("reconnect_interval", 10)
+        self.max_inflight = kwargs.pop("max_inflight", 1)
+        self._window = asyncio.Semaphore(self.max_inflight)
+        # Publicaciones en curso, cada una ocupa un hueco de la ventana hasta que termina
+        self._publishing = set()
+
+        client = mqtt.Client(client_id=self.client_id, protocol=mqtt.MQTTv311, clean_session=self.clean_session)
+        if "username" in kwargs:
+            client.username_pw_set(kwargs.pop("username", "username"), kwargs.pop("password", None))
+        client.on_connect = self.on_connect
+        client.on_disconnect = self.on_disconnect
+        # La ventana la controla max_inflight, como en ItemSendThread
+        client.max_inflight_messages_set(0)
+        self.client = AsyncMQTTClient(client, loop)
+
+        self.budget = BandwidthBudget(**(kwargs.pop("budget", None) or {}))
+        self._next_budget_report = 0
+        self.from_backlog = False
+        self.item_in_queue = set()
+        self.outbox = kwargs.pop("outbox", None) or Outbox()
+        # Orden de vaciado del backlog: oldest (más antiguos primero) o newest (más recientes primero con backfill)
+        self.backlog = create_backlog(db, drain_policy=kwargs.pop("drain_policy", DRAIN_OLDEST),
+                                      backfill_interval=kwargs.pop("backfill_interval", 10),
+                                      size=kwargs.pop("backlog_page_size", 100), outbox=self.outbox,
+                                      reconcile_interval=kwargs.pop("reconcile_interval", 300))
+
+        metrics = kwargs.pop("metrics", None) or MetricsRegistry()
+        self.tracer = kwargs.pop("tracer", None) or Tracer()
+        self._messages_published = metrics.counter('messages_published', "Mensajes publicados en el broker")
+        self._items_sent = metrics.counter('items_sent', "Registros confirmados por el broker")
+        self._items_failed = metrics.counter('items_failed', "Registros cuyo envío ha fallado")
+        self._publish_latency = metrics.histogram('publish_seconds', "Tiempo entre la publicación y la confirmación")
+        self._items_deferred = metrics.counter('items_deferred', "Registros aplazados por falta de presupuesto")
+        self._backlog_items = metrics.counter('backlog_items', "Registros leídos del backlog de la base de datos")
+        metrics.gauge('inflight_messages', "Mensajes publicados pendientes de confirmación",
+                      function=lambda: self.client.pending_acks)
+        metrics.gauge('outbox_pending', "Registros pendientes de reenviar desde la base de datos",
+                      function=lambda: self.outbox.pending)
+        register_budget_metrics(self, metrics)
+
+    async def run(self):
+        while True:
+            if not self.connected_to_mqtt:
+                await self.connect()
+                continue
+
+            self.report_budget()
+            items = await self.waiting_data()
+            if self.batch_publish and len(items) > 1:
+                await self.send_batch(items)
+                continue
+
+            for index, item in enumerate(items):
+                # Hasta max_inflight publicaciones esperando confirmación a la vez
+                await self._window.acquire()
+                if not self.connected_to_mqtt:
+                    self._window.release()
+                    self.requeue_items(items[index:])
+                    break
+                self.item_in_queue.add((type(item), item.id))
+                self.start_publishing(self.send(item, live=not self.from_backlog))
+
+    async def connect(self):
+        connected = await self.loop.run_in_executor(None, lambda: is_connected_to_internet(
+            max_attempts=1, time_between_attempts=1))
+        if connected:
+            logger.info("Connected to internet")
+            try:
+                await self.client.connect(self.broker_url, self.broker_port, self.keepalive)
+                await asyncio.wait_for(self._connected.wait(), timeout=self.reconnect_interval)
+                return
+            except asyncio.TimeoutError:
+                logger.warning("Timeout waiting connection to broker")
+            except Exception as ex:
+                logger.error(ex, exc_info=True)
+                logger.warning("Trying connect to broker, but there isn't internet connection")
+
+        await asyncio.sleep(self.reconnect_interval)
+
+    async def waiting_data(self) -> List[BaseItem]:
+        """
+        Espera por los datos, los datos que envía el dispositivo tienen
+        preferencia a los de la base de datos.
+
+        :return Retorna una lista de datos
+        :rtype Lista de tipo BaseItem
+        """
+        self.from_backlog = False
+        if not self.queue_send_data.empty():
+            return [self.queue_send_data.get_nowait()]
+
+        if self.budget.backlog_allowed(backlog_message_size(self), topic=self.topic_batch) and \
+                self.backlog.is_pending():
+            try:
+                items = await self.loop.run_in_executor(self.executor, self.backlog.next_page,
+                                                        set(self.item_in_queue))
+                self.from_backlog = True
+                self._backlog_items.inc(len(items))
+                return items
+            except Exception as ex:
+                # Se vuelve a intentar en la siguiente vuelta, mientras tanto se esperan los datos en directo
+                logger.error("Error reading items to send from database - %s", ex, exc_info=True)
+
+        try:
+            item = await asyncio.wait_for(self.queue_send_data.get(), timeout=self.backlog_interval)
+            return [item]
+        except asyncio.TimeoutError:
+            return []
+
+    async def send(self, item: BaseItem, live: bool = True):
+        topic = self.topics.get(type(item).__name__, self.topic_data)
+        payload = self.codec.encode(item)
+        if not self.budget.acquire(len(payload), live=live, topic=topic):
+            self.defer_items([item])
+            return
+
+        await self.publish([item], payload, topic)
+
+    async def send_batch(self, items: List[BaseItem]):
+        """
+        Publica los registros agrupados en mensajes, cada uno con registros de una sola clase, con
+        hasta max_inflight mensajes esperando confirmación
+        """
+        groups = pack_items(self.codec, items, self.batch_max_bytes)
+        for index, (group, payload) in enumerate(groups):
+            # La conexión se comprueba con la ventana ya conseguida, mientras se espera se puede perder
+            await self._window.acquire()
+            remaining = [item for pending, _ in groups[index:] for item in pending]
+            if not self.connected_to_mqtt:
+                self._window.release()
+                self.requeue_items(remaining)
+                break
+
+            topic = self.topic_batch if self.binary_batches else \
+                self.topics.get(type(group[0]).__name__, self.topic_batch)
+            if not self.budget.acquire(len(payload), live=False, topic=topic):
+                self._window.release()
+                self.defer_items(remaining)
+                break
+
+            for item in group:
+                self.item_in_queue.add((type(item), item.id))
+            self.start_publishing(self.publish(group, payload, topic))
+
+    def start_publishing(self, coroutine):
+        """ Ejecuta la publicación en su propia tarea, que libera su hueco de la ventana al terminar """
+        task = self.loop.create_task(coroutine)
+        self._publishing.add(task)
+
+        def done(_):
+            self._publishing.discard(task)
+            self._window.release()
+
+        task.add_done_callback(done)
+
+    async def close(self):
+        """
+        Espera a las publicaciones en curso, como máximo publish_timeout segundos, para no perder sus
+        confirmaciones, y desconecta del broker
+        """
+        if self._publishing:
+            _, pending = await asyncio.wait(self._publishing, timeout=self.publish_timeout)
+            for task in pending:
+                task.cancel()
+            await asyncio.gather(*pending, return_exceptions=True)
+        self.stop()
+
+    def defer_items(self, items: List[BaseItem]):
+        """ Deja en la base de datos los registros sin presupuesto de envío, se enviarán con el backlog """
+        logger.info("No bandwidth budget, deferring %i items", len(items))
+        self._items_deferred.inc(len(items))
+        for item in items:
+            self.item_in_queue.discard((type(item), item.id))
+        self.outbox.notify(len(items))
+
+    def requeue_items(self, items: List[BaseItem]):
+        """ Registros sin publicar por una desconexión, el outbox hace que se vuelvan a buscar en la base de datos """
+        logger.warning("Disconnected from broker, %i items left to send", len(items))
+        self.outbox.notify(len(items))
+
+    async def publish(self, items: List[BaseItem], payload, topic: str):
+        """ Publica el mensaje, espera la confirmación y marca el estado de sus registros """
+        logger.info("Publish %i items to topic '%s'", len(items), topic)
+        start = self.loop.time()
+        try:
+            ack = self.client.publish(topic, payload, qos=self.qos)
+            if not ack.done() or ack.result() == mqtt.MQTT_ERR_SUCCESS:
+                self._messages_published.inc()
+            for item in items:
+                self.tracer.mark(item, STAGE_PUBLISHED)
+            rc = await asyncio.wait_for(ack, timeout=self.publish_timeout)
+        except asyncio.TimeoutError:
+            rc = mqtt.MQTT_ERR_NO_CONN
+        except Exception as ex:
+            logger.error(ex, exc_info=True)
+            rc = mqtt.MQTT_ERR_UNKNOWN
+        finally:
+            for item in items:
+                self.item_in_queue.discard((type(item), item.id))
+
+        sent = rc == mqtt.MQTT_ERR_SUCCESS
+        if sent:
+            self._publish_latency.observe(self.loop.time() - start)
+            self._items_sent.inc(len(items))
+            for item in items:
+                self.tracer.mark(item, STAGE_ACKED)
+        else:
+            logger.warning("Error sended %i items", len(items))
+            self._items_failed.inc(len(items))
+            self.outbox.notify(len(items))
+
+        for cls, ids in group_ids_by_class(items).items():
+            try:
+                await self.loop.run_in_executor(self.executor, self.db.update_status, ids, sent, cls)
+            except Exception as ex:
+                # Sin actualizar, los registros siguen pendientes y se vuelven a enviar desde el backlog
+                logger.error("Error updating status of %i items - %s", len(ids), ex, exc_info=True)
+
+    def on_connect(self, client, userdata, flags, rc):
+        if rc == 0:
+            logger.info("Connected to broker %s with client_id %s", self.broker_url, self.client_id)
+            self.loop.call_soon_threadsafe(self._set_connected, True)
+        else:
+            logger.error("Connection refused - %s", mqtt.connack_string(rc))
+
+    def on_disconnect(self, client, userdata, rc):
+        self.loop.call_soon_threadsafe(self._set_connected, False)
+        if rc != 0:
+            logger.error("Unexpected disconnection to broker")
+        logger.info("Disconnected to broker with result code %s" % str(rc))
+
+    def _set_connected(self, connected: bool):
+        self.connected_to_mqtt = connected
+        if connected:
+            self._connected.set()
+        else:
+            self._connected.clear()
+
+    def report_budget(self):
+        report_budget(self)
+
+    def stop(self):
+        logger.info("Disconnecting to broker")
+        self.budget.save()
+        self.client.disconnect()
+
+
+class AsyncDeviceRunner(object):
+    """
+    Ejecuta la lectura, escritura, guardado y envío de un Device como corrutinas de un único bucle
+    asyncio, en lugar de un hilo por etapa. Se mantienen los mismos puntos de extensión del Device:
+    la clase lectora (cls_reader) con su parser, configure() y write().
+    """
+
+    def __init__(self, device, loop: asyncio.AbstractEventLoop = None):
+        self.device = device
+        self.loop = loop or asyncio.new_event_loop()
+        # Un único hilo para la base de datos, las operaciones sobre la conexión se serializan
+        self.executor = ThreadPoolExecutor(max_workers=1)
+        self.queues = {}
+        self.sender = None
+        self._main = None
+
+    def run(self):
+        asyncio.set_event_loop(self.loop)
+        try:
+            self._main = self.loop.create_task(self.main())
+            self.loop.run_until_complete(self._main)
+        except asyncio.CancelledError:
+            logger.info("Stopped asyncio runtime of device %s", self.device.name)
+        finally:
+            if self.device.db:
+                # La conexión de la base de datos es la del hilo del executor, se devuelve al pool desde él
+                self.executor.submit(self.device.db.release_connection).result()
+            self.executor.shutdown(wait=True)
+            self.loop.close()
+
+    async def main(self):
+        self._create_queues()
+        reader = self._create_reader()
+
+        tasks = [self.loop.create_task(self.read(reader))]
+        if self.device.cls_writer:
+            tasks.append(self.loop.create_task(self.write()))
+        if self.device.cls_save:
+            tasks.append(self.loop.create_task(self.save()))
+        if self.device.cls_send:
+            self.sender = AsyncItemSender(db=self.device.db, queue_send_data=self.queues['send_data'],
+                                          loop=self.loop, executor=self.executor, outbox=self.device.outbox,
+                                          metrics=self.device.metrics, tracer=self.device.tracer,
+                                          **(self.device.mqtt or {}))
+            tasks.append(self.loop.create_task(self.sender.run()))
+
+        self.device.configure()
+
+        try:
+            done, _ = await asyncio.wait(tasks, return_when=asyncio.FIRST_EXCEPTION)
+            for task in done:
+                if not task.cancelled() and task.exception():
+                    raise task.exception()
+        finally:
+            for task in tasks:
+                task.cancel()
+            await asyncio.gather(*tasks, return_exceptions=True)
+            if self.sender:
+                await self.sender.close()
+
+    def _create_queues(self):
+        for queue_name in ['notice', 'write_data', 'save_data', 'send_data']:
+            qsize = 0
+            if queue_name == 'send_data':
+                qsize = self.device.qsize_send_data
+            self.queues[queue_name] = asyncio.Queue(maxsize=qsize)
+
+        # Device.write() encola en el bucle, las métricas de las colas leen las nuevas
+        self.device.queues = self.queues
+
+    def _create_reader(self) -> DeviceReader:
+        """ Crea la clase lectora del dispositivo, que se usa sin arrancar su hilo """
+        reader_config = dict(self.device.reader_config, read_mode=READ_MODE_POLLING)
+
+        return self.device.cls_reader(device=self.device._dev_connection, queue_save_data=self.queues['save_data'],
+                                      queue_notice=self.queues['notice'], metrics=self.device.metrics,
+                                      tracer=self.device.tracer, **reader_config)
+
+    async def read(self, reader: DeviceReader):
+        """ Lee del puerto cuando el descriptor está listo, sin esperas activas """
+        serial = self.device._dev_connection
+        fd = serial.fileno()
+        failure = self.loop.create_future()
+
+        def on_readable():
+            try:
+                # Si el puerto está listo pero no hay datos, read(1) lanza la excepción de dispositivo desconectado
+                reader.feed(serial.read(serial.in_waiting or 1))
+            except Exception as ex:
+                logger.error("Device disconnected")
+                self.loop.remove_reader(fd)
+                if not failure.done():
+                    failure.set_exception(LostConnectionException(exception=ex))
+
+        self.loop.add_reader(fd, on_readable)
+        try:
+            await failure
+        finally:
+            self.loop.remove_reader(fd)
+
+    async def write(self):
+        queue = self.queues['write_data']
+        serial = self.device._dev_connection
+        while True:
+            data = await queue.get()
+            try:
+                serial.write(data.encode())
+            except Exception as ex:
+                logger.error("Device disconnected")
+                raise LostConnectionException(exception=ex)
+            logger.info("Send - " + data)
+
+    async def save(self):
+        queue_send_data = self.queues['send_data']
+        batch_size = self.device.save_config.get('batch_size', 1)
+        metrics = self.device.metrics
+        items_saved = metrics.counter('items_saved', "Registros guardados en la base de datos")
+        insert_latency = metrics.histogram('db_insert_seconds', "Duración de cada inserción en la base de datos")
+        while True:
+            items = await self.get_batch(batch_size)
+            start = self.loop.time()
+            if batch_size > 1:
+                items = await self.loop.run_in_executor(self.executor, self.device.db.save_many, items)
+            else:
+                items = [await self.loop.run_in_executor(self.executor, self.device.db.save, items[0])]
+            insert_latency.observe(self.loop.time() - start)
+            for item in items:
+                if getattr(item, 'id', None) is not None:
+                    items_saved.inc()
+                    self.device.tracer.mark(item, STAGE_COMMITTED)
+
+            for item in items:
+                if item:
+                    try:
+                        queue_send_data.put_nowait(item)
+                    except asyncio.QueueFull:
+                        logger.warning("Data queue is full")
+                        self.device.outbox.notify()
+
+    async def get_batch(self, batch_size: int) -> List[BaseItem]:
+        """ Espera el primer registro y agrupa los siguientes durante linger_ms milisegundos como máximo """
+        queue_save_data = self.queues['save_data']
+        items = [await queue_save_data.get()]
+        deadline = self.loop.time() + self.device.save_config.get('linger_ms', 0) / 1000
+        while len(items) < batch_size:
+            remaining = deadline - self.loop.time()
+            try:
+                if remaining > 0:
+                    items.append(await asyncio.wait_for(queue_save_data.get(), timeout=remaining))
+                else:
+                    items.append(queue_save_data.get_nowait())
+            except (asyncio.TimeoutError, asyncio.QueueEmpty):
+                break
+
+        return items
+
+    def stop(self):
+        """ Para el bucle, se puede llamar desde otro hilo o desde un manejador de señales """
+        if self._main and not self.loop.is_closed():
+            self.loop.call_soon_threadsafe(self._main.cancel)
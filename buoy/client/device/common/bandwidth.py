@@ -0,0 +1,203 @@
+# -*- coding: utf-8 -*-
+
+import json
+import logging
+import os
+import time
+from threading import Lock
+
+logger = logging.getLogger(__name__)
+
+# Bytes del identificador del mensaje (QoS 1 y 2) y del prefijo con la longitud del topic en un PUBLISH
+PACKET_ID_SIZE = 2
+TOPIC_LENGTH_SIZE = 2
+
+
+def publish_size(topic: str, size: int) -> int:
+    """
+    Bytes de un PUBLISH de MQTT 3.1.1 con size bytes de contenido: cabecera fija (tipo y longitud restante
+    en 1 a 4 bytes), topic con su longitud e identificador del mensaje
+    """
+    remaining = TOPIC_LENGTH_SIZE + len(topic.encode('utf-8')) + PACKET_ID_SIZE + size
+    length_size = 1 if remaining < 128 else 2 if remaining < 16384 else 3 if remaining < 2097152 else 4
+
+    return 1 + length_size + remaining
+
+
+class TokenBucket(object):
+    """ Cubo de fichas: se rellena a rate fichas por segundo hasta capacity """
+
+    def __init__(self, rate: float, capacity: float):
+        self.rate = rate
+        self.capacity = capacity
+        self.tokens = capacity
+        self._updated = time.monotonic()
+
+    def refill(self):
+        now = time.monotonic()
+        self.tokens = min(self.capacity, self.tokens + (now - self._updated) * self.rate)
+        self._updated = now
+
+    def can_consume(self, amount: float, reserve: float = 0) -> bool:
+        self.refill()
+        return self.tokens - reserve >= amount
+
+    def consume(self, amount: float):
+        self.tokens -= amount
+
+
+class BandwidthBudget(object):
+    """
+    Presupuesto de envío de un dispositivo: como máximo max_bytes y max_messages por cada period segundos.
+
+    Cada límite es un cubo de fichas que se rellena de forma uniforme a lo largo del periodo y acumula
+    como máximo burst_seconds de presupuesto, para que un periodo sin envíos no se gaste de golpe.
+    Los datos en directo pueden usar todo el cubo; el backlog solo lo que queda por encima de
+    backlog_reserve (fracción de la capacidad), que queda reservado para los datos en directo.
+
+    Sin max_bytes ni max_messages el presupuesto es ilimitado. El estado se publica cada report_interval
+    segundos en topic, si se indica.
+
+    Con state_file, el consumo del periodo y las fichas de los cubos se guardan en ese fichero cada
+    report_interval segundos y al parar, y se recuperan al arrancar. Sin él, cada arranque empieza un
+    periodo nuevo con los cubos llenos.
+    """
+
+    def __init__(self, max_bytes: int = None, max_messages: int = None, period: float = 30 * 86400,
+                 burst_seconds: float = 3600, backlog_reserve: float = 0.2, topic: str = None,
+                 report_interval: float = 300, state_file: str = None):
+        self.topic = topic
+        self.report_interval = report_interval
+        self.state_file = state_file
+        self.period = period
+        self.backlog_reserve = backlog_reserve
+        self.limits = {'bytes': max_bytes, 'messages': max_messages}
+        self.buckets = {}
+        for name, limit in self.limits.items():
+            if limit:
+                rate = limit / period
+                self.buckets[name] = TokenBucket(rate, min(limit, rate * burst_seconds))
+        self.used = {'bytes': 0, 'messages': 0}
+        self.payload_bytes = 0
+        self.period_start = time.time()
+        self.denied = {'live': 0, 'backlog': 0}
+        self._lock = Lock()
+        self._next_save = time.monotonic() + report_interval
+        if state_file and os.path.exists(state_file):
+            self.load()
+
+    @property
+    def unlimited(self) -> bool:
+        return not self.buckets
+
+    def acquire(self, size: int, live: bool = True, topic: str = '') -> bool:
+        """
+        Descuenta del presupuesto una publicación de size bytes en topic, con las cabeceras de MQTT
+
+        :param live: Datos en directo, que pueden usar la reserva
+        :return: Si hay presupuesto para publicar
+        """
+        amounts = {'bytes': publish_size(topic, size), 'messages': 1}
+        with self._lock:
+            self._roll_period()
+            for name, bucket in self.buckets.items():
+                reserve = 0 if live else bucket.capacity * self.backlog_reserve
+                if not bucket.can_consume(amounts[name], reserve):
+                    self.denied['live' if live else 'backlog'] += 1
+                    logger.debug("No %s budget to publish %i bytes", name, size)
+                    return False
+
+            for name, bucket in self.buckets.items():
+                bucket.consume(amounts[name])
+            self.used['bytes'] += amounts['bytes']
+            self.used['messages'] += 1
+            self.payload_bytes += size
+
+        if self.state_file and time.monotonic() >= self._next_save:
+            self.save()
+
+        return True
+
+    @property
+    def average_size(self) -> float:
+        """ Tamaño medio en bytes del contenido de las publicaciones del periodo, 0 si aún no hay ninguna """
+        return self.payload_bytes / self.used['messages'] if self.used['messages'] else 0
+
+    def backlog_allowed(self, size: int = 0, topic: str = '') -> bool:
+        """ Si queda presupuesto para publicar del backlog un mensaje de size bytes en topic, sin descontarlo """
+        amounts = {'bytes': publish_size(topic, size), 'messages': 1}
+        with self._lock:
+            return all(bucket.can_consume(amounts[name], bucket.capacity * self.backlog_reserve)
+                       for name, bucket in self.buckets.items())
+
+    def _roll_period(self):
+        now = time.time()
+        if now - self.period_start >= self.period:
+            logger.info("Bandwidth period finished, used %(bytes)i bytes in %(messages)i messages", self.used)
+            self.period_start = now
+            self.used = {'bytes': 0, 'messages': 0}
+            self.payload_bytes = 0
+
+    def state(self) -> dict:
+        """ Estado del presupuesto, para publicarlo """
+        with self._lock:
+            self._roll_period()
+            state = {
+                'period': self.period,
+                'period_start': int(self.period_start),
+                'bytes_used': self.used['bytes'],
+                'messages_used': self.used['messages'],
+                'denied_live': self.denied['live'],
+                'denied_backlog': self.denied['backlog']
+            }
+            for name, bucket in self.buckets.items():
+                bucket.refill()
+                state[name + '_limit'] = self.limits[name]
+                state[name + '_available'] = int(bucket.tokens)
+                state[name + '_used_ratio'] = round(self.used[name] / self.limits[name], 4)
+
+        return state
+
+    def save(self):
+        """ Guarda el consumo del periodo y las fichas de los cubos en state_file, de forma atómica """
+        if not self.state_file:
+            return
+
+        with self._lock:
+            self._next_save = time.monotonic() + self.report_interval
+            for bucket in self.buckets.values():
+                bucket.refill()
+            state = {
+                'saved_at': time.time(),
+                'period_start': self.period_start,
+                'used': self.used,
+                'payload_bytes': self.payload_bytes,
+                'tokens': {name: bucket.tokens for name, bucket in self.buckets.items()}
+            }
+
+        tmp_path = '%s.%i.tmp' % (self.state_file, os.getpid())
+        try:
+            with open(tmp_path, 'w') as fh:
+                json.dump(state, fh)
+            os.replace(tmp_path, self.state_file)
+        except OSError as ex:
+            logger.warning("Error saving bandwidth budget state - %s", ex)
+
+    def load(self):
+        """ Recupera el estado guardado: las fichas se rellenan con el tiempo transcurrido desde que se guardó """
+        try:
+            with open(self.state_file, 'r') as fh:
+                state = json.load(fh)
+        except (OSError, ValueError) as ex:
+            logger.warning("Error loading bandwidth budget state - %s", ex)
+            return
+
+        elapsed = max(time.time() - state['saved_at'], 0)
+        self.period_start = state['period_start']
+        self.used = {'bytes': state['used']['bytes'], 'messages': state['used']['messages']}
+        self.payload_bytes = state.get('payload_bytes', 0)
+        for name, tokens in state['tokens'].items():
+            bucket = self.buckets.get(name)
+            if bucket:
+                bucket.tokens = min(bucket.capacity, tokens + elapsed * bucket.rate)
+        logger.info("Loaded bandwidth budget state, used %(bytes)i bytes in %(messages)i messages", self.used)
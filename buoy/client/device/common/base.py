@@ -1,17 +1,30 @@
 # -*- coding: utf-8 -*-
 
+import json
 import logging
+import os
+import select
+from collections import deque
+from datetime import datetime, timezone
 from queue import Queue, Empty, Full
-from threading import Thread
+from threading import Thread, Event
 from typing import List
 
 import paho.mqtt.client as mqtt
 import time
 from serial import Serial, SerialException
 
-from buoy.client.device.common.database import DeviceDB
+from buoy.client.device.common.bandwidth import BandwidthBudget
+from buoy.client.device.common.buffer import LineBuffer
+from buoy.client.device.common.database import DeviceDB, create_backlog, DRAIN_OLDEST
+from buoy.client.device.common.metrics import MetricsRegistry, MetricsExporter
 from buoy.client.device.common.exceptions import LostConnectionException, DeviceNoDetectedException, \
     ProcessDataExecption
+from buoy.client.device.common.compression import CompressedCodec, COMPRESSION_NONE
+from buoy.client.device.common.outbox import Outbox
+from buoy.client.device.common.tracing import Tracer, STAGE_ENQUEUED, STAGE_COMMITTED, STAGE_PUBLISHED, \
+    STAGE_ACKED
+from buoy.client.device.common.payload import get_codec, PAYLOAD_JSON
 from buoy.client.internet_connection import is_connected_to_internet
 from buoy.client.notification.common import BaseItem
 
@@ -27,9 +40,16 @@ class BaseThread(Thread):
 
     def run(self):
         self.active = True
-        while self.is_active():
-            self.activity()
-            time.sleep(self.timeout_wait)
+        try:
+            while self.is_active():
+                self.activity()
+                self.wait()
+        finally:
+            self.release()
+
+    def release(self):
+        """ Libera los recursos del hilo al terminar, se ejecuta desde el propio hilo """
+        pass
 
     def is_active(self) -> bool:
         """
@@ -46,6 +66,10 @@ class BaseThread(Thread):
         """
         pass
 
+    def wait(self):
+        """ Espera entre una ejecución de activity y la siguiente """
+        time.sleep(self.timeout_wait)
+
     def stop(self):
         """ Para el hilo """
         self.active = False
@@ -65,15 +89,69 @@ class DeviceBaseThread(BaseThread):
         return super().is_active() and self.device.is_open
 
 
+READ_MODE_POLLING = 'polling'
+READ_MODE_SELECT = 'select'
+
+
 class DeviceReader(DeviceBaseThread):
-    """ Clase encargada de leer y parsear los datos que devuelve el dispositivo """
+    """
+    Clase encargada de leer y parsear los datos que devuelve el dispositivo
+
+    Modos de lectura:
+        * polling: lee los datos disponibles cada timeout_wait segundos
+        * select: bloquea el hilo sobre el descriptor del puerto hasta que llegan datos
+
+    arrival guarda la hora (UTC) a la que se leyeron del puerto los últimos datos, para que el parser
+    pueda fechar los registros sin contar el tiempo de espera en el buffer.
+
+    Con decode_lines a falso el parser recibe los bytes de cada línea tal como llegaron del puerto.
+    """
+
+    decode_lines = True
 
     def __init__(self, device: Serial, queue_save_data: Queue, queue_notice: Queue, **kwargs):
         self.char_splitter = kwargs.pop('char_splitter', '\n')
+        buffer_size = kwargs.pop('buffer_size', 4096)
+        self.read_mode = kwargs.pop('read_mode', READ_MODE_POLLING)
+        self.read_timeout = kwargs.pop('read_timeout', 1.0)
+        self.metrics = kwargs.pop('metrics', None) or MetricsRegistry()
+        self.tracer = kwargs.pop('tracer', None) or Tracer()
         super(DeviceReader, self).__init__(device, queue_notice)
         self.first_item = False
         self.queue_save_data = queue_save_data
-        self.buffer = ''
+        self.arrival = None
+        self.received_at = None
+        self._buffer = LineBuffer(splitter=self.char_splitter.encode(), size=buffer_size)
+
+        if self.read_mode not in (READ_MODE_POLLING, READ_MODE_SELECT):
+            raise ValueError("Read mode %s not supported" % (self.read_mode,))
+
+        self._wakeup_r, self._wakeup_w = None, None
+        if self.read_mode == READ_MODE_SELECT:
+            self._wakeup_r, self._wakeup_w = os.pipe()
+
+        self.register_metrics(self.metrics)
+
+    def register_metrics(self, metrics: MetricsRegistry):
+        """ Crea las métricas de la lectura, las clases hijas pueden añadir las suyas """
+        self._bytes_read = metrics.counter('bytes_read', "Bytes leídos del puerto serie")
+        self._lines_read = metrics.counter('lines_read', "Líneas leídas del dispositivo")
+        self._parse_failures = metrics.counter('parse_failures', "Líneas descartadas por el parser")
+        self._items_read = metrics.counter('items_read', "Registros obtenidos de las líneas leídas")
+
+    @property
+    def buffer(self) -> str:
+        """
+        Retorna los datos pendientes de procesar, decodificados
+
+        :return: Datos pendientes
+        """
+        return self._buffer.peek().strip()
+
+    @buffer.setter
+    def buffer(self, value: str):
+        self._buffer.clear()
+        self._buffer.write(value.encode())
 
     def activity(self):
         try:
@@ -86,29 +164,90 @@ class DeviceReader(DeviceBaseThread):
             logger.error("Device disconnected")
             self.error(LostConnectionException(exception=ex))
 
+    def run(self):
+        try:
+            super(DeviceReader, self).run()
+        finally:
+            self._close_wakeup()
+
+    def wait(self):
+        if self.read_mode == READ_MODE_POLLING:
+            super(DeviceReader, self).wait()
+
     def read_data(self):
-        self.buffer += self.device.read(self.device.in_waiting).decode()
+        if self.read_mode == READ_MODE_SELECT:
+            if not self.wait_for_data():
+                return
+            # Si el puerto está listo pero no hay datos, read(1) lanza la excepción de dispositivo desconectado
+            self.receive(self.device.read(self.device.in_waiting or 1))
+        else:
+            self.receive(self.device.read(self.device.in_waiting))
+
+    def receive(self, data: bytes):
+        """ Añade datos leídos del dispositivo al buffer y anota la hora de llegada """
+        if data:
+            self.arrival = datetime.now(tz=timezone.utc)
+            self.received_at = time.monotonic()
+            self._buffer.write(data)
+            self._bytes_read.inc(len(data))
+
+    def feed(self, data: bytes):
+        """ Añade datos leídos del dispositivo al buffer y procesa las líneas completas """
+        self.receive(data)
+        if not self.is_buffer_empty():
+            self.process_data()
+
+    def wait_for_data(self) -> bool:
+        """
+        Bloquea el hilo hasta que llegan datos al puerto, se para el hilo o vence read_timeout
+
+        :return: Si hay datos para leer en el puerto
+        """
+        fd = self.device.fileno()
+        readable, _, _ = select.select([fd, self._wakeup_r], [], [], self.read_timeout)
+
+        return fd in readable
+
+    def stop(self):
+        super(DeviceReader, self).stop()
+        if self._wakeup_w is not None:
+            try:
+                os.write(self._wakeup_w, b'\0')
+            except OSError:
+                pass
+
+    def _close_wakeup(self):
+        wakeup_r, wakeup_w = self._wakeup_r, self._wakeup_w
+        self._wakeup_r, self._wakeup_w = None, None
+        for fd in (wakeup_r, wakeup_w):
+            if fd is not None:
+                os.close(fd)
 
     def is_buffer_empty(self):
-        return self.char_splitter not in self.buffer
+        return not self._buffer.has_line()
 
     def process_data(self):
-        logger.debug("Proccessing data: %s", self.buffer)
-        buffer = self.buffer.rsplit(self.char_splitter, 1)
-        try:
-            self.buffer = buffer[1].strip()
-        except IndexError as ex:
-            raise ProcessDataExecption(message="Proccesing data without char split", exception=ex)
-        for line in self.split_by_lines(buffer[0]):
+        logger.debug("Proccessing %i bytes", len(self._buffer))
+        lines = self._buffer.read_lines(decode=self.decode_lines)
+        if not lines:
+            raise ProcessDataExecption(message="Proccesing data without char split",
+                                       exception=ValueError("Buffer without char split"))
+        for line in lines:
+            line = line.strip()
+            if not line:
+                continue
+
+            self._lines_read.inc()
             item = self.parser(line)
             if item:
+                self._items_read.inc()
+                self.tracer.start(item, self.received_at)
                 self.queue_save_data.put_nowait(item)
-                logger.info("Received line with data - " + line)
-            logger.debug("Received data - " + line)
-
-    def split_by_lines(self, buffer: str) -> List[str]:
-        lines = buffer.split(self.char_splitter)
-        return [l.strip() for l in lines if len(l.strip())]
+                self.tracer.mark(item, STAGE_ENQUEUED)
+                logger.info("Received line with data - %s", line)
+            else:
+                self._parse_failures.inc()
+            logger.debug("Received data - %s", line)
 
     def parser(self, data) -> BaseItem:
         pass
@@ -137,42 +276,256 @@ class DeviceWriter(DeviceBaseThread):
 class ItemSaveThread(BaseThread):
     """
     Clase encargada de guardar los datos en la base de datos
+
+    Con batch_size mayor que 1 se agrupan hasta batch_size registros, esperando como máximo
+    linger_ms milisegundos desde el primero, y se insertan en una única transacción.
+
+    Los registros que no caben en la cola de envío se anotan en el outbox para que el envío
+    los busque en la base de datos.
     """
 
-    def __init__(self, db: DeviceDB, queue_save_data: Queue, queue_send_data: Queue, queue_notice: Queue):
+    def __init__(self, db: DeviceDB, queue_save_data: Queue, queue_send_data: Queue, queue_notice: Queue,
+                 **kwargs):
+        self.batch_size = kwargs.pop('batch_size', 1)
+        self.linger = kwargs.pop('linger_ms', 0) / 1000
+        self.outbox = kwargs.pop('outbox', None) or Outbox()
+        metrics = kwargs.pop('metrics', None) or MetricsRegistry()
+        self.tracer = kwargs.pop('tracer', None) or Tracer()
         super(ItemSaveThread, self).__init__(queue_notice)
         self.db = db
         self.queue_save_data = queue_save_data
         self.queue_send_data = queue_send_data
+        self._items_saved = metrics.counter('items_saved', "Registros guardados en la base de datos")
+        self._save_failures = metrics.counter('save_failures', "Registros que no se han podido guardar")
+        self._insert_latency = metrics.histogram('db_insert_seconds', "Duración de cada inserción en la base de datos")
+
+    def release(self):
+        if self.db:
+            self.db.release_connection()
 
     def activity(self):
+        if self.batch_size > 1:
+            self.activity_batch()
+            return
+
         try:
             item = self.queue_save_data.get(timeout=self.timeout_wait)
             item = self.save(item)
 
-            if item and not self.queue_send_data.full():
-                try:
-                    self.queue_send_data.put_nowait(item)
-                except Full:
-                    logger.warning("Data queue is full")
+            if item:
+                self.queue_item_to_send(item)
 
             self.queue_save_data.task_done()
 
         except Empty:
             pass
 
+    def activity_batch(self):
+        items = self.get_batch()
+        if not items:
+            return
+
+        for item in self.save_batch(items):
+            if item:
+                self.queue_item_to_send(item)
+
+        for _ in items:
+            self.queue_save_data.task_done()
+
+    def wait(self):
+        # En modo lotes la espera se hace al leer de la cola
+        if self.batch_size <= 1:
+            super(ItemSaveThread, self).wait()
+
+    def get_batch(self) -> List[BaseItem]:
+        """
+        Espera el primer registro y agrupa los siguientes hasta completar el lote o agotar el tiempo de espera
+
+        :return: Lista de registros a guardar
+        """
+        try:
+            items = [self.queue_save_data.get(timeout=self.timeout_wait)]
+        except Empty:
+            return []
+
+        deadline = time.monotonic() + self.linger
+        while len(items) < self.batch_size:
+            remaining = deadline - time.monotonic()
+            try:
+                if remaining > 0:
+                    items.append(self.queue_save_data.get(timeout=remaining))
+                else:
+                    items.append(self.queue_save_data.get_nowait())
+            except Empty:
+                break
+
+        return items
+
+    def queue_item_to_send(self, item: BaseItem):
+        try:
+            self.queue_send_data.put_nowait(item)
+        except Full:
+            logger.warning("Data queue is full")
+            self.outbox.notify()
+
     def save(self, item):
         """ Guarda el registro en la base de datos """
-        return self.db.save(item)
+        start = time.monotonic()
+        item = self.db.save(item)
+        self._insert_latency.observe(time.monotonic() - start)
+        self.count_saved([item])
+
+        return item
+
+    def save_batch(self, items: List[BaseItem]) -> List[BaseItem]:
+        """ Guarda los registros en la base de datos en una única transacción """
+        start = time.monotonic()
+        items = self.db.save_many(items)
+        self._insert_latency.observe(time.monotonic() - start)
+        self.count_saved(items)
+
+        return items
+
+    def count_saved(self, items: List[BaseItem]):
+        saved = 0
+        for item in items:
+            if getattr(item, 'id', None) is not None:
+                saved += 1
+                self.tracer.mark(item, STAGE_COMMITTED)
+        self._items_saved.inc(saved)
+        self._save_failures.inc(len(items) - saved)
 
 
 def loop(client):
     client.loop_start()
 
 
+def group_ids_by_class(items: List[BaseItem]) -> dict:
+    """ Agrupa los identificadores de los registros por clase, cada clase tiene su tabla """
+    groups = {}
+    for item in items:
+        groups.setdefault(type(item), []).append(item.id)
+
+    return groups
+
+
+def create_codec(config: dict):
+    """
+    Codificador de los mensajes con las opciones de la configuración de envío, que se retiran de config:
+    formato (payload_format: json, binary o timeseries) y compresión de los agrupados (compression: none,
+    zlib o zstd, compression_level, compression_threshold y compression_dictionaries)
+    """
+    return get_codec(config.pop("payload_format", PAYLOAD_JSON),
+                     compression=config.pop("compression", COMPRESSION_NONE),
+                     level=config.pop("compression_level", 6),
+                     threshold=config.pop("compression_threshold", 256),
+                     dictionaries=config.pop("compression_dictionaries", None))
+
+
+def has_binary_batches(codec) -> bool:
+    """ Indica si los mensajes agrupados no son JSON: formato binario o de series temporales, o comprimidos """
+    return codec.name != PAYLOAD_JSON or isinstance(codec, CompressedCodec)
+
+
+def check_batch_topic(sender):
+    """
+    Los mensajes agrupados binarios o comprimidos no son JSON, por lo que solo se publican en un topic_batch
+    propio, distinto de topic_data y de los topics por clase en los que los consumidores esperan un objeto JSON
+    """
+    if sender.batch_publish and sender.binary_batches and \
+            sender.topic_batch in [sender.topic_data] + list(sender.topics.values()):
+        raise ValueError("Binary or compressed batches require a topic_batch different from topic_data and topics")
+
+
+def backlog_message_size(sender) -> int:
+    """
+    Tamaño estimado del siguiente mensaje del backlog, para consultar la base de datos solo si cabe en el
+    presupuesto: batch_max_bytes con mensajes agrupados y, si no, el tamaño medio de lo publicado
+    (batch_max_bytes mientras no se ha publicado nada)
+    """
+    if sender.batch_publish:
+        return sender.batch_max_bytes
+    return int(sender.budget.average_size) or sender.batch_max_bytes
+
+
+def register_budget_metrics(sender, metrics: MetricsRegistry):
+    """ Métricas de la compresión y del presupuesto de envío, comunes a ItemSendThread y AsyncItemSender """
+    stats = getattr(sender.codec, 'stats', None)
+    if stats:
+        metrics.counter('compression_bytes_in', "Bytes de los mensajes agrupados antes de comprimir",
+                        function=lambda: stats.bytes_in)
+        metrics.counter('compression_bytes_out', "Bytes de los mensajes agrupados tras comprimir",
+                        function=lambda: stats.bytes_out)
+        metrics.gauge('compression_ratio', "Tamaño comprimido entre tamaño original", function=lambda: stats.ratio)
+
+    budget = sender.budget
+    metrics.counter('budget_bytes_used', "Bytes publicados en el periodo del presupuesto",
+                    function=lambda: budget.used['bytes'])
+    metrics.counter('budget_messages_used', "Mensajes publicados en el periodo del presupuesto",
+                    function=lambda: budget.used['messages'])
+    for kind in ('live', 'backlog'):
+        metrics.counter('budget_denied', "Publicaciones denegadas por falta de presupuesto", labels={'data': kind},
+                        function=lambda kind=kind: budget.denied[kind])
+
+
+def report_budget(sender):
+    """ Publica periódicamente el estado del presupuesto como mensaje retenido, si tiene topic """
+    budget = sender.budget
+    now = time.monotonic()
+    if not budget.topic or now < sender._next_budget_report:
+        return
+
+    sender._next_budget_report = now + budget.report_interval
+    payload = json.dumps(budget.state(), sort_keys=True)
+    logger.info("Bandwidth budget %s", payload)
+    if budget.acquire(len(payload), topic=budget.topic):
+        try:
+            sender.client.publish(budget.topic, payload, qos=0, retain=True)
+        except Exception as ex:
+            logger.error(ex, exc_info=True)
+
+
+def pack_items(codec, items: List[BaseItem], max_bytes: int) -> List[tuple]:
+    """
+    Agrupa los registros en mensajes de como máximo max_bytes, cada uno con registros de una
+    misma clase, en el formato del codec. Con compresión, el límite se aplica al tamaño
+    estimado tras comprimir. Un registro que por sí solo supera el límite va en su propio mensaje.
+
+    :return: Lista de tuplas (registros, payload)
+    """
+    max_bytes = codec.batch_limit(max_bytes)
+    groups = []
+    group, records, size = [], [], codec.header_size
+    for item in items:
+        record = codec.record(item)
+        if group and (size + len(record) + codec.separator_size > max_bytes or
+                      type(item) is not type(group[0])):
+            groups.append((group, codec.join(group, records)))
+            group, records, size = [], [], codec.header_size
+        group.append(item)
+        records.append(record)
+        size += len(record) + codec.separator_size
+
+    if group:
+        groups.append((group, codec.join(group, records)))
+
+    return groups
+
+
 class ItemSendThread(BaseThread):
     """
     Clase base encargada de enviar los datos al servidor
+
+    Con max_inflight mayor que 1 no se espera la confirmación de cada publicación: se mantienen hasta
+    max_inflight mensajes en vuelo, que se marcan en bloque como enviados al llegar la confirmación
+    del broker (on_publish) o como fallidos si no llega en publish_timeout segundos. Con max_inflight 1
+    se espera cada confirmación con el mismo límite.
+
+    Con batch_publish, los registros pendientes de la base de datos se agrupan en mensajes con un array
+    JSON de como máximo batch_max_bytes. Los datos en directo se siguen publicando de uno en uno.
+
+    Mientras no hay datos se espera en la cola de envío. La base de datos solo se consulta cuando el
+    outbox avisa de registros pendientes o en el barrido periódico de reconciliación.
     """
 
     def __init__(self, db: DeviceDB, queue_send_data: Queue, queue_notice: Queue, **kwargs):
@@ -204,14 +557,72 @@ class ItemSendThread(BaseThread):
 
         self.qos = kwargs.pop("qos", 0)
         self.item_in_queue = set()
+        self.outbox = kwargs.pop("outbox", None) or Outbox()
+        # Orden de vaciado del backlog: oldest (más antiguos primero) o newest (más recientes primero con backfill)
+        self.backlog = create_backlog(db, drain_policy=kwargs.pop("drain_policy", DRAIN_OLDEST),
+                                      backfill_interval=kwargs.pop("backfill_interval", 10),
+                                      size=kwargs.pop("backlog_page_size", 100), outbox=self.outbox,
+                                      reconcile_interval=kwargs.pop("reconcile_interval", 300))
+
+        self.max_inflight = kwargs.pop("max_inflight", 1)
+        self.publish_timeout = kwargs.pop("publish_timeout", 60)
+        # La ventana la controla max_inflight. Un mensaje sin confirmación seguiría ocupando la ventana
+        # de paho hasta la siguiente reconexión aunque haya superado publish_timeout, por eso se desactiva
+        self.client.max_inflight_messages_set(0)
+        self.batch_publish = kwargs.pop("batch_publish", False)
+        self.batch_max_bytes = kwargs.pop("batch_max_bytes", 8192)
+        self.topic_batch = kwargs.pop("topic_batch", self.topic_data)
+        # Topic por clase de registro, p. ej. {'WIMWV': 'buoy/pb200/wind'}
+        self.topics = kwargs.pop("topics", None) or {}
+        self.codec = create_codec(kwargs)
+        self.binary_batches = has_binary_batches(self.codec)
+        check_batch_topic(self)
+        # Presupuesto de envío por periodo, ilimitado si no se configura
+        self.budget = BandwidthBudget(**(kwargs.pop("budget", None) or {}))
+        self._next_budget_report = 0
+        self.from_backlog = False
+        self.inflight = {}
+        self._acked = deque()
+        self._ack_event = Event()
+        self.client.on_publish = self.on_publish
+        self.tracer = kwargs.pop("tracer", None) or Tracer()
+        self.register_metrics(kwargs.pop("metrics", None) or MetricsRegistry())
+
+    def register_metrics(self, metrics: MetricsRegistry):
+        """ Crea las métricas del envío, incluidas las de la compresión y el presupuesto """
+        self._messages_published = metrics.counter('messages_published', "Mensajes publicados en el broker")
+        self._items_sent = metrics.counter('items_sent', "Registros confirmados por el broker")
+        self._items_failed = metrics.counter('items_failed', "Registros cuyo envío ha fallado")
+        self._items_deferred = metrics.counter('items_deferred', "Registros aplazados por falta de presupuesto")
+        self._backlog_items = metrics.counter('backlog_items', "Registros leídos del backlog de la base de datos")
+        self._mqtt_connections = metrics.counter('mqtt_connections', "Conexiones con el broker")
+        self._mqtt_disconnections = metrics.counter('mqtt_disconnections', "Desconexiones inesperadas del broker")
+        self._publish_latency = metrics.histogram('publish_seconds', "Tiempo entre la publicación y la confirmación")
+        metrics.gauge('inflight_messages', "Mensajes publicados pendientes de confirmación",
+                      function=lambda: len(self.inflight))
+        metrics.gauge('outbox_pending', "Registros pendientes de reenviar desde la base de datos",
+                      function=lambda: self.outbox.pending)
+        register_budget_metrics(self, metrics)
+
+    def release(self):
+        if self.db:
+            self.db.release_connection()
 
     def activity(self):
+        self.process_acks()
         if self.connected_to_mqtt:
+            self.report_budget()
             items = self.waiting_data()
-            for item in items:
-                if self.connected_to_mqtt:
-                    self.add_item_in_queue(item)
-                    self.send(item)
+            if self.batch_publish and len(items) > 1:
+                self.send_batch(items)
+                return
+
+            for index, item in enumerate(items):
+                if not self.connected_to_mqtt:
+                    self.requeue_items(items[index:])
+                    break
+                self.add_item_in_queue(item)
+                self.send(item, live=not self.from_backlog)
         elif is_connected_to_internet(max_attempts=1, time_between_attempts=1):
             logger.info("Connected to internet")
             try:
@@ -227,52 +638,276 @@ class ItemSendThread(BaseThread):
                 logger.warning("Trying connect to broker, but there isn't internet connection")
                 pass
 
+    def wait(self):
+        # Con conexión la espera se hace al leer de la cola de envío
+        if not self.connected_to_mqtt:
+            super(ItemSendThread, self).wait()
+
     def waiting_data(self) -> List[BaseItem]:
         """
         Espera por los datos, los datos que envía el dispositivo tienen
-        preferencia a los de la base de datos.
+        preferencia a los de la base de datos. Solo se consulta la base de datos
+        si queda presupuesto de envío para el backlog.
 
         :return Retorna una lista de datos
         :rtype Lista de tipo BaseItem
         """
         items = None
         while self.is_active() and (not items or not len(items)):
+            self.from_backlog = False
             try:
-                item = self.queue_send_data.get_nowait()
-                items = [item]
+                items = [self.queue_send_data.get_nowait()]
                 self.queue_send_data.task_done()
             except Empty:
-                items = self.db.get_items_to_send(discard=list(self.item_in_queue))
-            time.sleep(self.timeout_wait)
+                items = None
+                if self.budget.backlog_allowed(self.backlog_message_size(), topic=self.topic_batch) and \
+                        self.backlog.is_pending():
+                    items = self.read_backlog()
+                if items is None:
+                    items = self.wait_live_data()
+            self.process_acks()
+
+        return items
 
+    def read_backlog(self) -> List[BaseItem]:
+        """ Siguiente página del backlog, None si falla la consulta: se vuelve a intentar en la siguiente vuelta """
+        try:
+            items = self.backlog.next_page(skip=self.item_in_queue)
+        except Exception as ex:
+            logger.error("Error reading items to send from database - %s", ex, exc_info=True)
+            return None
+
+        self.from_backlog = True
+        self._backlog_items.inc(len(items))
         return items
 
+    def wait_live_data(self) -> List[BaseItem]:
+        """ Espera como máximo timeout_wait segundos a que llegue un dato del dispositivo """
+        try:
+            item = self.queue_send_data.get(timeout=self.timeout_wait)
+            self.queue_send_data.task_done()
+            return [item]
+        except Empty:
+            return []
+
     def add_item_in_queue(self, item: BaseItem):
-        self.item_in_queue.add(item.id)
+        # Los identificadores son por tabla, la clave incluye la clase
+        self.item_in_queue.add((type(item), item.id))
 
     def remove_item_the_queue(self, item: BaseItem):
-        self.item_in_queue.discard(item.id)
-
-    def send(self, item):
-        logger.info("Publish datagi '%s' to topic '%s'" % (self.topic_data, str(item.to_json())))
+        self.item_in_queue.discard((type(item), item.id))
+
+    def topic_for(self, cls: type) -> str:
+        """ Topic de los datos de la clase, por defecto topic_data """
+        return self.topics.get(cls.__name__, self.topic_data)
+
+    def send(self, item, live: bool = True):
+        payload = self.codec.encode(item)
+        topic = self.topic_for(type(item))
+        if not self.budget.acquire(len(payload), live=live, topic=topic):
+            self.defer_items([item])
+            return
+
+        if self.max_inflight > 1:
+            self.publish([item], payload, topic=topic)
+            return
+
+        logger.info("Publish data %s to topic '%s'", item.id, topic)
+        acked = False
+        start = time.monotonic()
         try:
-            result = self.client.publish(self.topic_data, str(item.to_json()), qos=self.qos)
-            result.wait_for_publish()
+            result = self.client.publish(topic, payload, qos=self.qos)
+            if result.rc == mqtt.MQTT_ERR_SUCCESS:
+                self._messages_published.inc()
+                self.tracer.mark(item, STAGE_PUBLISHED)
+            acked = self.wait_for_ack(result)
         except Exception as ex:
             logger.error(ex, exc_info=True)
-            pass
 
         self.remove_item_the_queue(item)
-        if result and result.rc == 0:
+        if acked:
             logger.debug("Update item in db %i", item.id)
-            self.db.set_sent(item.id)
+            self._publish_latency.observe(time.monotonic() - start)
+            self._items_sent.inc()
+            self.tracer.mark(item, STAGE_ACKED)
+            self.db.set_sent(item.id, cls=type(item))
         else:
             logger.warning("Error sended item %i", item.id)
-            self.db.set_failed(item.id)
+            self._items_failed.inc()
+            self.db.set_failed(item.id, cls=type(item))
+            self.outbox.notify()
+
+    def send_batch(self, items: List[BaseItem]):
+        """
+        Publica los registros agrupados en mensajes, marcando el estado de cada grupo de una vez.
+        Cada mensaje contiene registros de una sola clase; las clases con topic propio lo usan también
+        para los mensajes agrupados y el resto usa topic_batch. Los binarios o comprimidos usan siempre
+        topic_batch.
+        """
+        groups = self.pack_items(items)
+        for index, (group, payload) in enumerate(groups):
+            if not self.connected_to_mqtt:
+                self.requeue_items([item for pending, _ in groups[index:] for item in pending])
+                break
+
+            topic = self.topic_batch_for(type(group[0]))
+            if not self.budget.acquire(len(payload), live=False, topic=topic):
+                self.defer_items([item for pending, _ in groups[index:] for item in pending])
+                break
+
+            for item in group:
+                self.add_item_in_queue(item)
+
+            if self.max_inflight > 1:
+                self.publish(group, payload, topic=topic)
+            else:
+                self.publish_and_wait(group, payload, topic=topic)
+
+    def backlog_message_size(self) -> int:
+        return backlog_message_size(self)
+
+    def topic_batch_for(self, cls: type) -> str:
+        """ Los agrupados binarios o comprimidos van siempre a topic_batch, el resto al topic de su clase """
+        if self.binary_batches:
+            return self.topic_batch
+        return self.topics.get(cls.__name__, self.topic_batch)
+
+    def pack_items(self, items: List[BaseItem]) -> List[tuple]:
+        """ Agrupa los registros en mensajes de como máximo batch_max_bytes, ver pack_items """
+        return pack_items(self.codec, items, self.batch_max_bytes)
+
+    def publish_and_wait(self, items: List[BaseItem], payload, topic: str = None):
+        """ Publica el mensaje y espera la confirmación del broker """
+        topic = topic or self.topic_data
+        logger.info("Publish %i items to topic '%s'", len(items), topic)
+        acked = False
+        start = time.monotonic()
+        try:
+            result = self.client.publish(topic, payload, qos=self.qos)
+            if result.rc == mqtt.MQTT_ERR_SUCCESS:
+                self._messages_published.inc()
+                self.mark_items(items, STAGE_PUBLISHED)
+            acked = self.wait_for_ack(result)
+        except Exception as ex:
+            logger.error(ex, exc_info=True)
+
+        if acked:
+            self._publish_latency.observe(time.monotonic() - start)
+            self.finish_items(sent=items, failed=[])
+        else:
+            self.finish_items(sent=[], failed=items)
+
+    def wait_for_ack(self, result) -> bool:
+        """
+        Espera la confirmación del broker como mucho publish_timeout segundos. Igual que en la ventana
+        de mensajes en vuelo, si no llega a tiempo el mensaje se da por fallido.
+        """
+        if result.rc != mqtt.MQTT_ERR_SUCCESS:
+            return False
+
+        result.wait_for_publish(timeout=self.publish_timeout)
+        if not result.is_published():
+            logger.warning("Message %i not acknowledged in %i seconds", result.mid, self.publish_timeout)
+            return False
+        return True
+
+    def publish(self, items: List[BaseItem], payload, topic: str = None):
+        """
+        Publica el mensaje sin esperar la confirmación del broker. Si ya hay max_inflight mensajes
+        en vuelo, espera a que se confirme alguno.
+        """
+        self.wait_window()
+        topic = topic or self.topic_data
+        logger.info("Publish %i items to topic '%s'", len(items), topic)
+        try:
+            result = self.client.publish(topic, payload, qos=self.qos)
+        except Exception as ex:
+            logger.error(ex, exc_info=True)
+            result = None
+
+        if result and result.rc == mqtt.MQTT_ERR_SUCCESS:
+            self._messages_published.inc()
+            self.mark_items(items, STAGE_PUBLISHED)
+            self.inflight[result.mid] = (items, time.monotonic())
+        else:
+            logger.warning("Error publishing %i items", len(items))
+            self.finish_items(sent=[], failed=items)
+
+    def wait_window(self):
+        """ Espera mientras la ventana de mensajes en vuelo esté llena """
+        self.process_acks()
+        while len(self.inflight) >= self.max_inflight and self.is_active():
+            self._ack_event.wait(timeout=self.timeout_wait)
+            self._ack_event.clear()
+            self.process_acks()
+
+    def process_acks(self):
+        """ Marca en bloque los mensajes confirmados por el broker y los que han superado publish_timeout """
+        sent, failed = [], []
+        now = time.monotonic()
+        while self._acked:
+            entry = self.inflight.pop(self._acked.popleft(), None)
+            if entry:
+                sent.extend(entry[0])
+                self._publish_latency.observe(now - entry[1])
+
+        for mid, (items, published_at) in list(self.inflight.items()):
+            if now - published_at > self.publish_timeout:
+                del self.inflight[mid]
+                failed.extend(items)
+
+        if sent or failed:
+            self.finish_items(sent=sent, failed=failed)
+
+    def finish_items(self, sent: List[BaseItem], failed: List[BaseItem]):
+        for item in sent + failed:
+            self.remove_item_the_queue(item)
+
+        self._items_sent.inc(len(sent))
+        self._items_failed.inc(len(failed))
+        self.mark_items(sent, STAGE_ACKED)
+        if sent:
+            logger.debug("Update %i items in db as sent", len(sent))
+            for cls, ids in group_ids_by_class(sent).items():
+                self.db.update_status(ids, status=True, cls=cls)
+        if failed:
+            logger.warning("Error sended %i items", len(failed))
+            for cls, ids in group_ids_by_class(failed).items():
+                self.db.update_status(ids, status=False, cls=cls)
+            self.outbox.notify(len(failed))
+
+    def mark_items(self, items: List[BaseItem], stage: int):
+        for item in items:
+            self.tracer.mark(item, stage)
+
+    def defer_items(self, items: List[BaseItem]):
+        """ Deja en la base de datos los registros sin presupuesto de envío, se enviarán con el backlog """
+        logger.info("No bandwidth budget, deferring %i items", len(items))
+        self._items_deferred.inc(len(items))
+        for item in items:
+            self.remove_item_the_queue(item)
+        self.outbox.notify(len(items))
+
+    def requeue_items(self, items: List[BaseItem]):
+        """
+        Registros sin publicar por una desconexión: siguen pendientes en la base de datos y el outbox
+        hace que se vuelvan a buscar, sin esperar a reconcile_interval
+        """
+        logger.warning("Disconnected from broker, %i items left to send", len(items))
+        self.outbox.notify(len(items))
+
+    def report_budget(self):
+        report_budget(self)
+
+    def on_publish(self, client, userdata, mid):
+        # Se ejecuta en el hilo de paho, el procesado se hace en el hilo de envío
+        self._acked.append(mid)
+        self._ack_event.set()
 
     def on_connect(self, client, userdata, flags, rc):
         if rc == 0:
             logger.info("Connected to broker %s with client_id %s", self.broker_url, client)
+            self._mqtt_connections.inc()
             self.connected_to_mqtt = True
             if flags["session present"]:
                 logger.info("Connected to broker using existing session")
@@ -297,6 +932,7 @@ class ItemSendThread(BaseThread):
         self.connected_to_mqtt = False
         if rc != 0:
             logger.error("Unexpected disconnection to broker")
+            self._mqtt_disconnections.inc()
         else:
             client.loop_stop()
             super().stop()
@@ -304,10 +940,27 @@ class ItemSendThread(BaseThread):
 
     def stop(self):
         logger.info("Disconnecting to broker")
+        self.budget.save()
         self.client.disconnect()
 
 
+RUNTIME_THREADS = 'threads'
+RUNTIME_ASYNCIO = 'asyncio'
+
+
 class Device(object):
+    """
+    Dispositivo conectado por puerto serie
+
+    Entornos de ejecución:
+        * threads: un hilo para cada etapa (lectura, escritura, guardado y envío)
+        * asyncio: todas las etapas como corrutinas de un único bucle asyncio
+
+    Las métricas de todas las etapas se recogen en metrics y, según la sección de configuración
+    metrics, se exportan a un fichero para node_exporter (textfile) o por HTTP (port). Con la sección
+    tracing, tracer sigue cada lectura por las etapas y añade sus latencias a las métricas.
+    """
+
     def __init__(self, *args, **kwargs):
         self.serial_config = kwargs.pop('serial_config', None)
         self.db = kwargs.pop('db')
@@ -317,6 +970,13 @@ class Device(object):
         self.cls_save = kwargs.pop('cls_save', ItemSaveThread)
         self.cls_send = kwargs.pop('cls_send', ItemSendThread)
         self.mqtt = kwargs.pop('mqtt', None)
+        self.reader_config = kwargs.pop('reader', None) or {}
+        self.save_config = kwargs.pop('save', None) or {}
+        self.metrics_config = kwargs.pop('metrics', None) or {}
+        self.tracing_config = kwargs.pop('tracing', None) or {}
+        self.runtime = kwargs.pop('runtime', RUNTIME_THREADS)
+        self._runner = None
+        self.outbox = Outbox()
 
         self.qsize_send_data = kwargs.pop('qsize_send_data', 1000)
 
@@ -327,6 +987,30 @@ class Device(object):
         self.name = kwargs.pop('device_name')
         self._dev_connection = None
 
+        self.metrics = MetricsRegistry(labels={'device': self.name})
+        self.tracer = Tracer(self.metrics, **self.tracing_config)
+        self._exporter = None
+        self._register_metrics()
+
+    def _register_metrics(self):
+        for queue_name in self.queues:
+            self.metrics.gauge('queue_size', "Registros en cada cola entre etapas", labels={'queue': queue_name},
+                               function=lambda queue_name=queue_name: self.queues[queue_name].qsize())
+        self.metrics.counter('db_reconnections', "Reconexiones con la base de datos",
+                             function=lambda: getattr(self.db, 'reconnections', 0))
+
+    def start_metrics(self):
+        """ Arranca la exportación de las métricas si está configurada """
+        if self._exporter is None and (self.metrics_config.get('textfile') or
+                                       self.metrics_config.get('port') is not None):
+            self._exporter = MetricsExporter(self.metrics, **self.metrics_config)
+            self._exporter.start()
+
+    def stop_metrics(self):
+        if self._exporter:
+            self._exporter.stop()
+            self._exporter = None
+
     def _create_queues(self):
         for queue_name in ['notice', 'write_data', 'save_data', 'send_data']:
             qsize = 0
@@ -335,6 +1019,11 @@ class Device(object):
             self.queues[queue_name] = Queue(maxsize=qsize)
 
     def run(self):
+        self.start_metrics()
+        if self.runtime == RUNTIME_ASYNCIO:
+            self._run_asyncio()
+            return
+
         try:
             self.connect()
             self._create_threads()
@@ -344,6 +1033,14 @@ class Device(object):
         except Exception as ex:
             raise ex
 
+    def _run_asyncio(self):
+        # Importación local, el módulo aio depende de este
+        from buoy.client.device.common.aio import AsyncDeviceRunner
+
+        self.connect()
+        self._runner = AsyncDeviceRunner(device=self)
+        self._runner.run()
+
     def connect(self):
         logger.info("Connecting to device")
         try:
@@ -360,16 +1057,19 @@ class Device(object):
         if self.cls_reader:
             self._thread_reader = self.cls_reader(device=self._dev_connection,
                                                   queue_save_data=self.queues['save_data'],
-                                                  queue_notice=self.queues['notice'])
+                                                  queue_notice=self.queues['notice'],
+                                                  metrics=self.metrics, tracer=self.tracer, **self.reader_config)
         if self.cls_save:
             self._thread_save = self.cls_save(queue_save_data=self.queues['save_data'],
                                               queue_send_data=self.queues['send_data'],
                                               queue_notice=self.queues['notice'],
-                                              db=self.db)
+                                              db=self.db, outbox=self.outbox, metrics=self.metrics,
+                                              tracer=self.tracer, **self.save_config)
         if self.cls_send:
             self._thread_send = self.cls_send(queue_send_data=self.queues['send_data'],
                                               queue_notice=self.queues['notice'],
-                                              db=self.db, **self.mqtt)
+                                              db=self.db, outbox=self.outbox, metrics=self.metrics,
+                                              tracer=self.tracer, **self.mqtt)
 
     def _start_threads(self):
         self._run_action_threads(action='start')
@@ -397,7 +1097,10 @@ class Device(object):
 
     def disconnect(self):
         logger.info("Disconnecting to device")
+        if self._runner:
+            self._runner.stop()
         self._stop_threads()
+        self.stop_metrics()
         if self.is_open():
             self._dev_connection.close()
         logger.info("Disconnected to device")
@@ -0,0 +1,169 @@
+# -*- coding: utf-8 -*-
+
+import logging
+from typing import List, Union
+
+logger = logging.getLogger(__name__)
+
+
+class LineBuffer(object):
+    """
+    Buffer circular de bytes preasignado donde se acumulan los datos leídos del dispositivo.
+
+    Solo se busca el separador en los bytes nuevos y solo se decodifican las líneas completas,
+    de una sola vez. El resto de la línea pendiente se queda en el buffer sin copiarse.
+    """
+
+    def __init__(self, splitter: bytes = b'\n', size: int = 4096, encoding: str = 'utf-8'):
+        self.splitter = splitter
+        self.encoding = encoding
+        self._splitter_text = splitter.decode(encoding)
+        self._size = size
+        self._data = bytearray(size)
+        self._view = memoryview(self._data)
+        self._head = 0
+        self._length = 0
+        self._scanned = 0
+
+    def __len__(self) -> int:
+        return self._length
+
+    @property
+    def size(self) -> int:
+        return self._size
+
+    def write(self, data: bytes):
+        """ Añade los bytes al final del buffer, ampliándolo si no caben """
+        num = len(data)
+        if not num:
+            return
+
+        if self._length + num > self._size:
+            self._grow(self._length + num)
+
+        tail = self._head + self._length
+        if tail >= self._size:
+            tail -= self._size
+
+        if tail + num <= self._size:
+            self._view[tail:tail + num] = data
+        else:
+            first = self._size - tail
+            self._view[tail:] = data[:first]
+            self._view[:num - first] = data[first:]
+        self._length += num
+
+    def has_line(self) -> bool:
+        """ Retorna si existe al menos una línea completa en el buffer """
+        return self._rfind() >= 0
+
+    def read_lines(self, decode: bool = True) -> List[Union[str, bytes]]:
+        """
+        Extrae y decodifica todas las líneas completas del buffer, sin el separador.
+        Los datos posteriores al último separador se mantienen en el buffer.
+
+        :param decode: Si es falso se retornan los bytes recibidos, sin decodificar
+        :return: Lista de líneas
+        """
+        pos = self._rfind()
+        if pos < 0:
+            return []
+
+        if decode:
+            lines = self._decode(pos).split(self._splitter_text)
+        else:
+            lines = self._bytes(pos).split(self.splitter)
+        self._consume(pos + len(self.splitter))
+
+        return lines
+
+    def peek(self) -> str:
+        """ Retorna los datos pendientes decodificados, sin consumirlos """
+        return self._decode(self._length)
+
+    def clear(self):
+        self._head = 0
+        self._length = 0
+        self._scanned = 0
+
+    def _rfind(self) -> int:
+        """
+        Busca el último separador en los bytes que aún no se han revisado.
+
+        :return: Posición relativa al inicio de los datos pendientes o -1 si no se encuentra
+        """
+        begin = self._head + self._scanned
+        end = self._head + self._length
+
+        if end <= self._size:
+            pos = self._data.rfind(self.splitter, begin, end)
+        else:
+            pos = self._data.rfind(self.splitter, max(begin - self._size, 0), end - self._size)
+            if pos >= 0:
+                pos += self._size
+            elif begin < self._size:
+                pos = self._find_in_edge(begin, end)
+                if pos < 0:
+                    pos = self._data.rfind(self.splitter, begin, self._size)
+
+        if pos < 0:
+            self._scanned = max(self._scanned, self._length - len(self.splitter) + 1)
+            return -1
+
+        pos -= self._head
+        self._scanned = pos
+        return pos
+
+    def _find_in_edge(self, begin: int, end: int) -> int:
+        """ Busca un separador de varios bytes partido entre el final y el principio del buffer """
+        overlap = len(self.splitter) - 1
+        if not overlap:
+            return -1
+
+        start = max(begin, self._size - overlap)
+        edge = bytes(self._view[start:self._size]) + bytes(self._view[:min(overlap, end - self._size)])
+        pos = edge.rfind(self.splitter)
+
+        return start + pos if pos >= 0 else -1
+
+    def _decode(self, num: int) -> str:
+        return str(self._chunk(num), self.encoding, 'replace')
+
+    def _bytes(self, num: int) -> bytes:
+        return bytes(self._chunk(num))
+
+    def _chunk(self, num: int):
+        start = self._head
+        end = start + num
+        if end <= self._size:
+            return self._view[start:end]
+
+        return bytes(self._view[start:]) + bytes(self._view[:end - self._size])
+
+    def _consume(self, num: int):
+        self._length -= num
+        self._scanned = 0
+        if self._length:
+            self._head = (self._head + num) % self._size
+        else:
+            self._head = 0
+
+    def _grow(self, min_size: int):
+        size = self._size
+        while size < min_size:
+            size *= 2
+
+        logger.debug("Growing line buffer from %i to %i bytes", self._size, size)
+        data = bytearray(size)
+        end = self._head + self._length
+        if end <= self._size:
+            data[:self._length] = self._view[self._head:end]
+        else:
+            first = self._size - self._head
+            data[:first] = self._view[self._head:]
+            data[first:self._length] = self._view[:end - self._size]
+
+        self._data = data
+        self._view = memoryview(data)
+        self._size = size
+        self._head = 0
@@ -0,0 +1,124 @@
+# -*- coding: utf-8 -*-
+
+import logging
+import math
+from collections import deque
+from datetime import datetime
+
+logger = logging.getLogger(__name__)
+
+TIMESTAMP_HOST = 'host'
+TIMESTAMP_ARRIVAL = 'arrival'
+TIMESTAMP_DEVICE = 'device'
+
+TIMESTAMP_MODES = (TIMESTAMP_HOST, TIMESTAMP_ARRIVAL, TIMESTAMP_DEVICE)
+
+
+class ClockDrift(object):
+    """
+    Estimación del desfase y la deriva del reloj de un dispositivo respecto al del equipo.
+
+    Por cada muestra se anota el desfase (hora del dispositivo - hora de llegada de los datos) y se ajusta
+    por mínimos cuadrados una recta sobre todas las muestras de los últimos window intervalos de interval
+    segundos (24 horas por defecto):
+
+        * offset: desfase estimado en la última muestra, en segundos
+        * drift: deriva del reloj del dispositivo, en partes por millón (positiva si adelanta)
+        * jitter: desviación típica de los residuos, en segundos. Recoge tanto la resolución del reloj
+          del dispositivo como la variación en el tiempo de lectura
+
+    Con un reloj de resolución de 1 s, el error de cuantificación (hasta ±0.5 s) solo deja resolver
+    derivas de pocos ppm con ventanas de horas. Para no guardar todas las muestras, cada intervalo guarda
+    las sumas del ajuste relativas a su inicio y a su primer desfase; al salir un intervalo de la ventana
+    se recalculan los totales respecto al más antiguo, de forma que los valores sumados no crecen con el
+    tiempo de funcionamiento ni se acumula el error de restar las muestras que salen.
+    """
+
+    def __init__(self, window: int = 1440, interval: float = 60, max_offset: float = None):
+        """
+        :param window: Número de intervalos sobre los que se estima
+        :param interval: Segundos de cada intervalo
+        :param max_offset: Desfase en segundos a partir del cual se avisa en el log, None para no avisar
+        """
+        self.window = window
+        self.interval = interval
+        self.max_offset = max_offset
+        # Por intervalo: [inicio, desfase de referencia, n, x, y, x², xy, y²]
+        self._buckets = deque()
+        # Sumas n, x, y, x², xy, y² de la ventana, relativas al inicio y al desfase del intervalo más antiguo
+        self._sums = [0, 0.0, 0.0, 0.0, 0.0, 0.0]
+        self.offset = None
+        self.drift = None
+        self.jitter = None
+
+    @property
+    def samples(self) -> int:
+        return self._sums[0]
+
+    def update(self, device_time: datetime, host_time: datetime) -> float:
+        """
+        Añade una muestra y actualiza la estimación
+
+        :param device_time: Hora que indica el dispositivo
+        :param host_time: Hora del equipo en la que llegaron los datos
+        :return: Desfase estimado en segundos
+        """
+        y = (device_time - host_time).total_seconds()
+        if not self._buckets or (host_time - self._buckets[-1][0]).total_seconds() >= self.interval:
+            self._buckets.append([host_time, y, 0, 0.0, 0.0, 0.0, 0.0, 0.0])
+            if len(self._buckets) > self.window:
+                self._buckets.popleft()
+                self._rebase()
+
+        bucket = self._buckets[-1]
+        _add(bucket, 2, (host_time - bucket[0]).total_seconds(), y - bucket[1])
+        oldest = self._buckets[0]
+        x = (host_time - oldest[0]).total_seconds()
+        _add(self._sums, 0, x, y - oldest[1])
+        self._estimate(x, oldest[1])
+
+        if self.max_offset is not None and abs(self.offset) > self.max_offset:
+            logger.warning("Device clock offset %.3f s exceeds %.3f s", self.offset, self.max_offset)
+
+        return self.offset
+
+    def _rebase(self):
+        """ Recalcula las sumas de la ventana respecto al inicio y al desfase del intervalo más antiguo """
+        origin, reference = self._buckets[0][0], self._buckets[0][1]
+        sums = [0, 0.0, 0.0, 0.0, 0.0, 0.0]
+        for start, y_ref, n, sum_x, sum_y, sum_xx, sum_xy, sum_yy in self._buckets:
+            dx = (start - origin).total_seconds()
+            dy = y_ref - reference
+            sums[0] += n
+            sums[1] += sum_x + n * dx
+            sums[2] += sum_y + n * dy
+            sums[3] += sum_xx + 2 * dx * sum_x + n * dx * dx
+            sums[4] += sum_xy + dx * sum_y + dy * sum_x + n * dx * dy
+            sums[5] += sum_yy + 2 * dy * sum_y + n * dy * dy
+        self._sums = sums
+
+    def _estimate(self, x_last: float, reference: float):
+        n, sum_x, sum_y, sum_xx, sum_xy, sum_yy = self._sums
+        sxx = sum_xx - sum_x * sum_x / n
+        sxy = sum_xy - sum_x * sum_y / n
+        syy = sum_yy - sum_y * sum_y / n
+        slope = sxy / sxx if sxx > 1e-9 else 0.0
+
+        self.offset = reference + (sum_y - slope * sum_x) / n + slope * x_last
+        self.drift = slope * 1e6
+        self.jitter = math.sqrt(max(syy - slope * sxy, 0.0) / n)
+
+    def reset(self):
+        self._buckets.clear()
+        self._sums = [0, 0.0, 0.0, 0.0, 0.0, 0.0]
+        self.offset = self.drift = self.jitter = None
+
+
+def _add(sums: list, index: int, x: float, y: float):
+    """ Suma la muestra a n, x, y, x², xy, y², a partir de la posición index """
+    sums[index] += 1
+    sums[index + 1] += x
+    sums[index + 2] += y
+    sums[index + 3] += x * x
+    sums[index + 4] += x * y
+    sums[index + 5] += y * y
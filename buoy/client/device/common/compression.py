@@ -0,0 +1,183 @@
+# -*- coding: utf-8 -*-
+
+import logging
+import struct
+import zlib
+from threading import Lock
+from typing import Dict, List, Union
+
+from buoy.client.device.common.item import BaseItem
+
+try:
+    import zstandard
+except ImportError:
+    zstandard = None
+
+logger = logging.getLogger(__name__)
+
+COMPRESSION_NONE = 'none'
+COMPRESSION_ZLIB = 'zlib'
+COMPRESSION_ZSTD = 'zstd'
+
+# Sobre de los mensajes comprimidos: marca, algoritmo, identificador del diccionario (0 sin diccionario)
+COMPRESSED_MAGIC = 0xC1
+COMPRESSED_HEADER = struct.Struct('>BBI')
+
+ALGORITHMS = {
+    COMPRESSION_ZLIB: 1,
+    COMPRESSION_ZSTD: 2
+}
+
+# Diccionarios conocidos por su identificador, para descomprimir
+DICTIONARIES = {}
+
+
+def dictionary_id(data: bytes) -> int:
+    """ Identificador del diccionario, su CRC32. El 0 se reserva para los mensajes sin diccionario """
+    return zlib.crc32(data) or 1
+
+
+def register_dictionary(data: bytes) -> int:
+    """ Registra un diccionario para poder descomprimir los mensajes que lo usan """
+    identifier = dictionary_id(data)
+    DICTIONARIES[identifier] = data
+    return identifier
+
+
+def load_dictionary(path: str) -> bytes:
+    with open(path, 'rb') as fh:
+        data = fh.read()
+    register_dictionary(data)
+
+    return data
+
+
+def train_dictionary(samples: List[Union[bytes, str]], size: int = 4096, algorithm: str = COMPRESSION_ZLIB) -> bytes:
+    """
+    Genera un diccionario a partir de mensajes de ejemplo de una clase de registro.
+
+    zlib usa el diccionario como datos previos al mensaje, por lo que basta con los ejemplos más
+    recientes (los últimos bytes son los que encuentra antes). zstd entrena su propio diccionario.
+    """
+    samples = [sample.encode('utf-8') if isinstance(sample, str) else sample for sample in samples]
+    if algorithm == COMPRESSION_ZSTD:
+        return zstd_module().train_dictionary(size, samples).as_bytes()
+
+    return b''.join(samples)[-size:]
+
+
+def zstd_module():
+    if zstandard is None:
+        raise ValueError("Compression %s requires zstandard package" % (COMPRESSION_ZSTD,))
+    return zstandard
+
+
+class CompressionStats(object):
+    """ Bytes antes y después de comprimir los mensajes agrupados """
+
+    def __init__(self):
+        self.messages = 0
+        self.compressed = 0
+        self.bytes_in = 0
+        self.bytes_out = 0
+        self._lock = Lock()
+
+    def add(self, size_in: int, size_out: int, compressed: bool):
+        with self._lock:
+            self.messages += 1
+            self.compressed += int(compressed)
+            self.bytes_in += size_in
+            self.bytes_out += size_out
+
+    @property
+    def ratio(self) -> float:
+        """ Tamaño enviado entre tamaño original, 1 si aún no hay datos """
+        if not self.bytes_in:
+            return 1.0
+
+        return self.bytes_out / self.bytes_in
+
+
+class CompressedCodec(object):
+    """
+    Comprime los mensajes agrupados de otro codificador (JSON o binario) cuando superan threshold bytes.
+    Los mensajes de un único registro y los que no se reducen al comprimir se envían sin comprimir.
+
+    El tamaño de los grupos se adapta a la compresión obtenida: el límite de batch_max_bytes se aplica
+    al tamaño estimado tras comprimir, de forma que cada mensaje lleva más registros.
+    """
+
+    def __init__(self, codec, algorithm: str = COMPRESSION_ZLIB, level: int = 6, threshold: int = 256,
+                 dictionaries: Dict[str, bytes] = None):
+        if algorithm not in ALGORITHMS:
+            raise ValueError("Compression %s not supported" % (algorithm,))
+        if algorithm == COMPRESSION_ZSTD:
+            zstd_module()
+
+        self.codec = codec
+        self.name = codec.name
+        self.header_size = codec.header_size
+        self.separator_size = codec.separator_size
+        self.algorithm = algorithm
+        self.level = level
+        self.threshold = threshold
+        # Diccionario de cada clase de registro, por nombre de la clase
+        self.dictionaries = {name: (register_dictionary(data), data) for name, data in (dictionaries or {}).items()}
+        self.stats = CompressionStats()
+
+    def encode(self, item: BaseItem):
+        return self.codec.encode(item)
+
+    def record(self, item: BaseItem):
+        return self.codec.record(item)
+
+    def batch_limit(self, max_bytes: int) -> int:
+        """ Tamaño sin comprimir de cada grupo, a partir de la compresión media obtenida """
+        return int(max_bytes / max(self.stats.ratio, 0.1))
+
+    def join(self, items: List[BaseItem], records: list):
+        payload = self.codec.join(items, records)
+        data = payload.encode('utf-8') if isinstance(payload, str) else payload
+        if len(data) < self.threshold:
+            self.stats.add(len(data), len(data), False)
+            return payload
+
+        identifier, dictionary = self.dictionaries.get(type(items[0]).__name__, (0, None))
+        compressed = COMPRESSED_HEADER.pack(COMPRESSED_MAGIC, ALGORITHMS[self.algorithm], identifier) + \
+            self.compress(data, dictionary)
+        if len(compressed) >= len(data):
+            self.stats.add(len(data), len(data), False)
+            return payload
+
+        self.stats.add(len(data), len(compressed), True)
+        logger.debug("Compressed %i items from %i to %i bytes", len(items), len(data), len(compressed))
+
+        return compressed
+
+    def compress(self, data: bytes, dictionary: bytes = None) -> bytes:
+        if self.algorithm == COMPRESSION_ZSTD:
+            zstd_dict = zstandard.ZstdCompressionDict(dictionary) if dictionary else None
+            return zstandard.ZstdCompressor(level=self.level, dict_data=zstd_dict).compress(data)
+
+        compressor = zlib.compressobj(self.level, zdict=dictionary) if dictionary else zlib.compressobj(self.level)
+        return compressor.compress(data) + compressor.flush()
+
+
+def decompress(payload: bytes) -> bytes:
+    """ Contenido de un mensaje comprimido, en el formato original (JSON o binario) """
+    _, algorithm, identifier = COMPRESSED_HEADER.unpack_from(payload, 0)
+    data = payload[COMPRESSED_HEADER.size:]
+    dictionary = None
+    if identifier:
+        dictionary = DICTIONARIES.get(identifier)
+        if dictionary is None:
+            raise ValueError("Unknown compression dictionary %s" % (identifier,))
+
+    if algorithm == ALGORITHMS[COMPRESSION_ZSTD]:
+        zstd_dict = zstd_module().ZstdCompressionDict(dictionary) if dictionary else None
+        return zstandard.ZstdDecompressor(dict_data=zstd_dict).decompress(data)
+    elif algorithm == ALGORITHMS[COMPRESSION_ZLIB]:
+        decompressor = zlib.decompressobj(zdict=dictionary) if dictionary else zlib.decompressobj()
+        return decompressor.decompress(data) + decompressor.flush()
+
+    raise ValueError("Unknown compression algorithm %s" % (algorithm,))
@@ -1,107 +1,302 @@
 # -*- coding: utf-8 -*-
 
+import heapq
 import logging
-from typing import List, AnyStr
+import time
+from collections import OrderedDict
+from contextlib import contextmanager
+from datetime import datetime
+from functools import wraps
+from itertools import islice
+from threading import get_ident
+from typing import List, AnyStr, Dict, Tuple
 
-import psycopg2
-from psycopg2 import DatabaseError, IntegrityError, errorcodes
+from psycopg2 import DatabaseError, IntegrityError, InterfaceError, OperationalError, errorcodes
 from psycopg2.extensions import AsIs
-from psycopg2.extras import DictCursor, DictRow
+from psycopg2.extras import DictCursor, execute_values
+from psycopg2.pool import ThreadedConnectionPool
 
 from buoy.client.device.common.item import BaseItem
+from buoy.client.device.common.outbox import Outbox
 
 logger = logging.getLogger(__name__)
 
+CONNECTION_ERRORS = (OperationalError, InterfaceError)
+
+
+def reconnect(func):
+    """ Si se ha perdido la conexión con la base de datos, repite la operación una vez con una conexión nueva """
+
+    @wraps(func)
+    def wrapper(self, *args, **kwargs):
+        try:
+            return func(self, *args, **kwargs)
+        except CONNECTION_ERRORS as ex:
+            logger.warning("Lost connection to database, reconnecting - %s", ex)
+            self.reconnections += 1
+            self.discard_connection()
+            return func(self, *args, **kwargs)
+
+    return wrapper
+
+
+class TableSQL(object):
+    """ Sentencias SQL de una tabla de datos """
+
+    def __init__(self, tablename: str):
+        self.tablename = tablename
+        self.insert = """INSERT INTO """ + tablename + """(%s) VALUES %s RETURNING id"""
+        self.insert_many = """INSERT INTO """ + tablename + """(%s) VALUES %%s RETURNING id"""
+        self.find_by_id = """SELECT * FROM """ + tablename + """ WHERE id = %s"""
+        self.update_status = """UPDATE """ + tablename + """ SET sended=%s WHERE id = ANY(%s)"""
+        # Paginación por clave (date, id), apoyada en el índice parcial de registros no enviados
+        self.select_items_to_send = """SELECT * FROM """ + tablename + \
+                                    """ WHERE sended IS false AND num_attempts < %s """ + \
+                                    """ AND date < now() - 30 * interval '1 second'""" + \
+                                    """ ORDER BY date, id LIMIT %s"""
+        self.select_items_to_send_after = """SELECT * FROM """ + tablename + \
+                                          """ WHERE sended IS false AND num_attempts < %s """ + \
+                                          """ AND date < now() - 30 * interval '1 second'""" + \
+                                          """ AND (date, id) > (%s, %s)""" + \
+                                          """ ORDER BY date, id LIMIT %s"""
+        # Los más recientes primero, recorriendo el mismo índice en sentido inverso
+        self.select_newest_items_to_send = """SELECT * FROM """ + tablename + \
+                                           """ WHERE sended IS false AND num_attempts < %s """ + \
+                                           """ AND date < now() - 30 * interval '1 second'""" + \
+                                           """ ORDER BY date DESC, id DESC LIMIT %s"""
+        self.select_newest_items_to_send_before = """SELECT * FROM """ + tablename + \
+                                                  """ WHERE sended IS false AND num_attempts < %s """ + \
+                                                  """ AND date < now() - 30 * interval '1 second'""" + \
+                                                  """ AND (date, id) < (%s, %s)""" + \
+                                                  """ ORDER BY date DESC, id DESC LIMIT %s"""
+
 
 class DeviceDB(object):
-    """ Clase encargada de gestionar la base de datos """
+    """
+    Clase encargada de gestionar la base de datos
+
+    Las conexiones se obtienen de un pool y cada hilo usa la suya, de forma que el guardado y el envío
+    no comparten transacción ni se bloquean entre sí. Cada hilo devuelve su conexión al pool con
+    release_connection al terminar.
 
-    def __init__(self, db_config, db_tablename, cls_item):
+    Cada clase de registro se guarda en su tabla: cls_item en db_tablename y el resto según tables.
+    Las operaciones que no reciben la clase usan cls_item.
+    """
 
-        self.connection = None
+    def __init__(self, db_config, db_tablename, cls_item, tables: Dict[type, str] = None):
+
+        self.pool = None
+        self.reconnections = 0
+        # Hilos con una conexión del pool asignada
+        self._connection_keys = set()
         self.connect(db_config)
         self.tablename_data = db_tablename
         self.cls = cls_item
 
-        self._insert_sql = """INSERT INTO """ + self.tablename_data + """(%s) VALUES %s RETURNING id"""
-        self._find_by_id_sql = """SELECT * FROM """ + self.tablename_data + """ WHERE id = %s"""
-        self._update_status_sql = """UPDATE """ + self.tablename_data + """ SET sended=%s WHERE id = ANY(%s)"""
-        self._select_items_to_send_sql = """SELECT * FROM """ + self.tablename_data + \
-                                         """ WHERE sended IS false AND num_attempts < %s """ + \
-                                         """ AND NOT id = ANY(%s) AND date < now() - 30 * interval '1 second'""" + \
-                                         """ ORDER BY date LIMIT %s OFFSET %s"""
+        self.tables = {cls_item: db_tablename}
+        self.tables.update(tables or {})
+        self._sql = {cls: TableSQL(tablename) for cls, tablename in self.tables.items()}
+
+    @property
+    def classes(self) -> List[type]:
+        """ Clases de registro con tabla, empezando por cls_item """
+        return list(self.tables)
+
+    def get_sql(self, cls: type = None) -> TableSQL:
+        """ Sentencias de la tabla de la clase, las clases sin tabla propia usan la de cls_item """
+        return self._sql.get(cls or self.cls) or self._sql[self.cls]
 
     def connect(self, db_config):
         logger.debug("Connecting to database")
-        self.connection = psycopg2.connect(**db_config)
+        db_config = dict(db_config)
+        min_connections = db_config.pop('pool_min', 1)
+        max_connections = db_config.pop('pool_max', 4)
+        self.pool = ThreadedConnectionPool(min_connections, max_connections, **db_config)
+
+    @property
+    def connection(self):
+        """
+        :return: Conexión del hilo actual, se crea una nueva si la anterior está cerrada
+        """
+        key = get_ident()
+        connection = self.pool.getconn(key=key)
+        self._connection_keys.add(key)
+        if connection.closed:
+            self.pool.putconn(connection, key=key, close=True)
+            connection = self.pool.getconn(key=key)
+
+        return connection
+
+    def discard_connection(self):
+        """ Cierra la conexión del hilo actual, la siguiente operación usará una nueva """
+        key = get_ident()
+        self.pool.putconn(self.pool.getconn(key=key), key=key, close=True)
+
+    def release_connection(self):
+        """ Devuelve al pool la conexión del hilo actual, si tiene una. Se llama desde el hilo al terminar """
+        key = get_ident()
+        if key not in self._connection_keys:
+            return
+
+        self._connection_keys.discard(key)
+        if not self.pool.closed:
+            self.pool.putconn(self.pool.getconn(key=key), key=key)
+
+    def close(self):
+        if self.pool and not self.pool.closed:
+            self.pool.closeall()
+
+    @contextmanager
+    def transaction(self):
+        """ Cursor sobre la conexión del hilo actual, con commit al terminar o rollback si hay error """
+        connection = self.connection
+        try:
+            with connection.cursor(cursor_factory=DictCursor) as cur:
+                yield cur
+            connection.commit()
+        except CONNECTION_ERRORS:
+            raise
+        except Exception:
+            connection.rollback()
+            raise
 
     def save(self, item: BaseItem) -> BaseItem:
         """ Inserta un nuevo registro en la base de datos """
         try:
-            with self.get_cursor() as cur:
-                sql = self.create_insert_sql(item, cur)
-                cur.execute(sql)
-                item.id = cur.fetchone()[0]
-            self.connection.commit()
+            self._insert(item)
         except IntegrityError as e:
             if e.pgcode == errorcodes.UNIQUE_VIOLATION:
                 logger.warning("Inserting data already inserted")
             else:
                 logger.exception("No insert data")
-        except DatabaseError as e:
+        except DatabaseError:
             logger.exception("No insert data")
 
         return item
 
-    def get(self, identifier):
+    @reconnect
+    def _insert(self, item: BaseItem):
+        with self.transaction() as cur:
+            sql = self.create_insert_sql(item, cur)
+            cur.execute(sql)
+            identifier = cur.fetchone()[0]
+
+        # El identificador solo existe si se ha confirmado la transacción
+        item.id = identifier
+
+    def save_many(self, items: List[BaseItem]) -> List[BaseItem]:
+        """
+        Inserta varios registros en una única transacción, con una sentencia por cada clase de registro.
+        Si falla, se insertan uno a uno para no perder los registros válidos.
+        """
+        if not items:
+            return items
+
+        try:
+            self._insert_many(items)
+        except DatabaseError:
+            logger.warning("No insert batch of %i items, inserting one by one", len(items))
+            return [self.save(item) for item in items]
+
+        return items
+
+    @reconnect
+    def _insert_many(self, items: List[BaseItem]):
+        groups = {}
+        for item in items:
+            groups.setdefault(type(item), []).append(item)
+
+        inserted = []
+        with self.transaction() as cur:
+            for cls, group in groups.items():
+                columns = self.__get_column_names(group[0])
+                values = [tuple(getattr(item, column) for column in columns) for item in group]
+                sql = self.get_sql(cls).insert_many % (','.join(columns),)
+                rows = execute_values(cur, sql, values, page_size=len(values), fetch=True)
+                inserted.extend(zip(group, rows))
+
+        # Los identificadores se asignan tras el commit, si hay rollback los registros quedan sin identificador
+        for item, row in inserted:
+            item.id = row[0]
+
+    @reconnect
+    def get(self, identifier, cls: type = None):
         """ Retorna un registro un registro dado un identificador """
-        with self.get_cursor() as cur:
-            sql = cur.mogrify(self._find_by_id_sql, (identifier,))
+        with self.transaction() as cur:
+            sql = cur.mogrify(self.get_sql(cls).find_by_id, (identifier,))
             cur.execute(sql)
             row = cur.fetchone()
 
         return row
 
-    def _get_items_to_send(self, *args):
+    @reconnect
+    def _get_items_to_send(self, cls, sql, args):
         """ Retorna la lista de registros nuevos a enviar """
-        with self.get_cursor() as cur:
-            sql = cur.mogrify(self._select_items_to_send_sql, *args)
+        with self.transaction() as cur:
+            sql = cur.mogrify(sql, args)
             cur.execute(sql)
             rows = cur.fetchall()
 
         items = []
         for row in rows:
-            items.append(self.cls(**row))
+            items.append(cls(**row))
 
         return items
 
-    def get_items_to_send(self, num_attemps: int = 3, discard: List[int] = [],
-                          size: int = 100, offset: int = 0) -> List[DictRow]:
+    def get_items_to_send(self, num_attemps: int = 3, size: int = 100,
+                          after: Tuple[datetime, int] = None, cls: type = None) -> List[BaseItem]:
+        """
+        Retorna una página de registros pendientes de envío, ordenados por fecha e identificador
 
-        return self._get_items_to_send((num_attemps, discard, size, offset))
+        :param num_attemps: Número máximo de intentos de envío
+        :param size: Tamaño de la página
+        :param after: Clave (date, id) del último registro de la página anterior, None para empezar desde el principio
+        :param cls: Clase de los registros, por defecto cls_item
+        """
+        cls = cls or self.cls
+        sql = self.get_sql(cls)
+        if after is None:
+            return self._get_items_to_send(cls, sql.select_items_to_send, (num_attemps, size))
 
-    def update_status(self, ids: List[int], status=True):
+        return self._get_items_to_send(cls, sql.select_items_to_send_after, (num_attemps,) + tuple(after) + (size,))
+
+    def get_newest_items_to_send(self, num_attemps: int = 3, size: int = 100,
+                                 after: Tuple[datetime, int] = None, cls: type = None) -> List[BaseItem]:
+        """
+        Retorna una página de registros pendientes de envío, de los más recientes a los más antiguos
+
+        :param after: Clave (date, id) del último registro de la página anterior, None para empezar por el más reciente
+        """
+        cls = cls or self.cls
+        sql = self.get_sql(cls)
+        if after is None:
+            return self._get_items_to_send(cls, sql.select_newest_items_to_send, (num_attemps, size))
+
+        return self._get_items_to_send(cls, sql.select_newest_items_to_send_before,
+                                       (num_attemps,) + tuple(after) + (size,))
+
+    @reconnect
+    def update_status(self, ids: List[int], status=True, cls: type = None):
         if len(ids):
-            with self.get_cursor() as cur:
-                sql = cur.mogrify(self._update_status_sql, (status, ids))
+            with self.transaction() as cur:
+                sql = cur.mogrify(self.get_sql(cls).update_status, (status, ids))
                 cur.execute(sql)
-            self.connection.commit()
 
-    def set_sent(self, id: int):
-        self.update_status([id], status=True)
+    def set_sent(self, id: int, cls: type = None):
+        self.update_status([id], status=True, cls=cls)
 
-    def set_failed(self, id: int):
-        self.update_status([id], status=False)
+    def set_failed(self, id: int, cls: type = None):
+        self.update_status([id], status=False, cls=cls)
 
     def create_insert_sql(self, item, cursor):
         columns = self.__get_column_names(item)
         values = [getattr(item, column) for column in columns]
-        sql = cursor.mogrify(self._insert_sql, (AsIs(','.join(columns)), tuple(values)))
+        sql = cursor.mogrify(self.get_sql(type(item)).insert, (AsIs(','.join(columns)), tuple(values)))
 
         return sql
 
     def get_cursor(self):
-        return self.connection.cursor(cursor_factory=psycopg2.extras.DictCursor)
+        return self.connection.cursor(cursor_factory=DictCursor)
 
     @staticmethod
     def __get_column_names(item: BaseItem) -> List[AnyStr]:
@@ -109,7 +304,144 @@ class DeviceDB(object):
         :param item: BaseItem
         :return: list
         """
-        columns = list(dict(item).keys())
-        columns.remove('id')
+        return [name for name in item.fields if name != 'id']
+
+
+class BacklogCursor(object):
+    """
+    Recorre por páginas los registros pendientes de envío de la base de datos.
+
+    Cada página mezcla por fecha los registros de todas las tablas: se consulta una página de cada tabla y se
+    toman los size más antiguos (con newest_first, los más recientes) del conjunto. De cada tabla se guarda la
+    clave (date, id) del último registro tomado, de forma que la siguiente consulta continúa donde terminó la
+    anterior. Una tabla se da por recorrida cuando su página llega incompleta y se han tomado todos sus registros.
+
+    Solo se consulta la base de datos durante un barrido de las tablas, que empieza cuando el outbox avisa de
+    registros que se han quedado sin enviar o cada reconcile_interval segundos (y al arrancar) como seguridad.
+    """
+
+    def __init__(self, db: DeviceDB, size: int = 100, num_attempts: int = 3, outbox: Outbox = None,
+                 reconcile_interval: float = 300, classes: List[type] = None, newest_first: bool = False):
+        self.db = db
+        self.size = size
+        self.num_attempts = num_attempts
+        self.outbox = outbox or Outbox()
+        self.reconcile_interval = reconcile_interval
+        self.classes = classes or db.classes
+        self.newest_first = newest_first
+        self.after = {}
+        self._remaining = []
+        self._next_reconcile = 0
+
+    def is_pending(self) -> bool:
+        """ Indica si hay que consultar la base de datos """
+        if self._remaining:
+            return True
+
+        now = time.monotonic()
+        reconcile = now >= self._next_reconcile
+        if reconcile:
+            logger.debug("Reconciling items to send with database")
+            self._next_reconcile = now + self.reconcile_interval
+
+        if self.outbox.take() or reconcile:
+            self.start()
+            return True
+
+        return False
+
+    def next_page(self, skip=()) -> List[BaseItem]:
+        """
+        :param skip: Claves (clase, id) de los registros que ya se están enviando
+        :return: Registros pendientes de la siguiente página, sin los indicados en skip
+        """
+        fetch = self.db.get_newest_items_to_send if self.newest_first else self.db.get_items_to_send
+        pages = OrderedDict()
+        for cls in list(self._remaining or self.classes):
+            pages[cls] = fetch(num_attemps=self.num_attempts, size=self.size, after=self.after.get(cls), cls=cls)
+
+        merged = heapq.merge(*[[(cls, item) for item in items] for cls, items in pages.items()],
+                             key=lambda entry: (entry[1].date, entry[1].id), reverse=self.newest_first)
+        page = list(islice(merged, self.size))
+
+        for cls, items in pages.items():
+            taken = [item for item_cls, item in page if item_cls is cls]
+            if taken:
+                self.after[cls] = (taken[-1].date, taken[-1].id)
+            if len(items) < self.size and len(taken) == len(items):
+                self.after.pop(cls, None)
+                if cls in self._remaining:
+                    self._remaining.remove(cls)
+
+        return [item for cls, item in page if (cls, item.id) not in skip]
+
+    def start(self):
+        """ Empieza un barrido de todas las tablas """
+        self.rewind()
+        self._remaining = list(self.classes)
+
+    def rewind(self):
+        self.after = {}
+
+
+class FreshestFirstBacklog(object):
+    """
+    Vaciado del backlog con los registros más recientes primero, para que tras un corte largo el servidor
+    muestre cuanto antes los datos actuales.
+
+    A la vez, un segundo recorrido (backfill) envía los más antiguos hacia los más recientes, como máximo
+    una página cada backfill_interval segundos, hasta que ambos se cruzan: los registros ya enviados por uno
+    no los devuelve el otro. Los dos se intercalan con los datos en directo, que siguen teniendo preferencia.
+    """
+
+    def __init__(self, db: DeviceDB, size: int = 100, num_attempts: int = 3, outbox: Outbox = None,
+                 reconcile_interval: float = 300, classes: List[type] = None, backfill_interval: float = 10):
+        self.newest = BacklogCursor(db, size=size, num_attempts=num_attempts, outbox=outbox,
+                                    reconcile_interval=reconcile_interval, classes=classes, newest_first=True)
+        self.backfill = BacklogCursor(db, size=size, num_attempts=num_attempts, outbox=self.newest.outbox,
+                                      classes=classes)
+        self.outbox = self.newest.outbox
+        self.backfill_interval = backfill_interval
+        self._next_backfill = 0
+
+    def is_pending(self) -> bool:
+        if self.newest._remaining:
+            return True
+
+        if self.newest.is_pending():
+            # Cada barrido de los más recientes arranca también el de los más antiguos
+            self.backfill.start()
+            return True
+
+        return self._backfill_due()
+
+    def _backfill_due(self) -> bool:
+        return bool(self.backfill._remaining) and time.monotonic() >= self._next_backfill
+
+    def next_page(self, skip=()) -> List[BaseItem]:
+        if self._backfill_due():
+            self._next_backfill = time.monotonic() + self.backfill_interval
+            return self.backfill.next_page(skip=skip)
+
+        return self.newest.next_page(skip=skip)
+
+    def rewind(self):
+        self.newest.rewind()
+        self.backfill.rewind()
+
+
+DRAIN_OLDEST = 'oldest'
+DRAIN_NEWEST = 'newest'
+
+
+def create_backlog(db: DeviceDB, drain_policy: str = DRAIN_OLDEST, backfill_interval: float = 10, **kwargs):
+    """
+    Recorrido del backlog según drain_policy: oldest, del más antiguo al más reciente; newest, los más
+    recientes primero con un backfill de los más antiguos cada backfill_interval segundos
+    """
+    if drain_policy == DRAIN_OLDEST:
+        return BacklogCursor(db, **kwargs)
+    elif drain_policy == DRAIN_NEWEST:
+        return FreshestFirstBacklog(db, backfill_interval=backfill_interval, **kwargs)
 
-        return columns
+    raise ValueError("Drain policy %s not supported" % (drain_policy,))
@@ -2,6 +2,7 @@
 
 import json
 import logging
+import math
 from datetime import datetime, timezone
 from decimal import *
 
@@ -9,9 +10,136 @@ from dateutil import parser
 
 logger = logging.getLogger(__name__)
 
+# json.dumps con argumentos crea un codificador en cada llamada
+JSON_ENCODER = json.JSONEncoder(separators=(',', ':'), check_circular=False)
+
+NUMERIC_FLOAT = 'float'
+NUMERIC_DECIMAL = 'decimal'
+
+
+def string_to_float(value):
+    """
+    Convierte un valor leído del dispositivo en float
+
+    :return: El número o None si el campo está vacío, no es un número o no es finito
+    """
+    if value is None or value == '':
+        return None
+
+    try:
+        number = float(value)
+    except (TypeError, ValueError):
+        logger.error("Convert %s to float", value)
+        return None
+
+    if not math.isfinite(number):
+        logger.error("Discard not finite value %s", value)
+        return None
+
+    return number
+
+
+def string_to_decimal(value):
+    """
+    Convierte un valor leído del dispositivo en Decimal
+
+    :return: El número o None si el campo está vacío, no es un número o no es finito
+    """
+    if value is None or value == '':
+        return None
+
+    try:
+        number = Decimal(value)
+    except (TypeError, ValueError, InvalidOperation):
+        logger.error("Convert %s to decimal", value)
+        return None
+
+    if not number.is_finite():
+        logger.error("Discard not finite value %s", value)
+        return None
+
+    return number
+
+
+def string_to_int(value):
+    """
+    Convierte un valor entero leído del dispositivo (número de satélites, calidad, etc.)
+
+    :return: El número o None si el campo está vacío o no es un entero
+    """
+    if value is None or value == '':
+        return None
+
+    try:
+        return int(value)
+    except (TypeError, ValueError):
+        logger.error("Convert %s to int", value)
+        return None
+
+
+NUMERIC_BACKENDS = {
+    NUMERIC_FLOAT: string_to_float,
+    NUMERIC_DECIMAL: string_to_decimal
+}
+
+
+def set_numeric_backend(backend: str = NUMERIC_FLOAT):
+    """
+    Selecciona el tipo numérico de los campos de todos los registros del proceso.
+    Por defecto float, que es el tipo de las columnas (double precision); decimal se mantiene por compatibilidad.
+    """
+    if backend not in NUMERIC_BACKENDS:
+        raise ValueError("Numeric backend '%s' not valid, options: %s" % (backend, ', '.join(NUMERIC_BACKENDS)))
+
+    logger.info("Using numeric backend %s", backend)
+    BaseItem._convert_to_number = staticmethod(NUMERIC_BACKENDS[backend])
+
+
+# Atributos internos del registro que no son campos: no se guardan ni se envían
+TRANSIENT_SLOTS = ('_trace',)
+
+
+def slots_to_fields(cls) -> tuple:
+    """
+    Retorna los nombres de los campos de la clase a partir de los __slots__ de toda la jerarquía,
+    empezando por la clase base y sin el guión bajo inicial
+    """
+    fields = []
+    for klass in reversed(cls.__mro__):
+        for name in vars(klass).get('__slots__', ()):
+            if name not in TRANSIENT_SLOTS:
+                fields.append(name[1:] if name.startswith('_') else name)
+
+    return tuple(fields)
+
 
 class BaseItem(object):
+    """
+    Clase base de los datos. Cada subclase declara en __slots__ los atributos de sus propiedades
+    (con guión bajo) y la lista de campos se calcula una sola vez por clase, en fields.
+
+    _trace guarda los instantes por los que pasa el registro en cada etapa (ver tracing.py), None si
+    no se sigue.
+    """
+
+    __slots__ = ('_id', '_date', '_trace')
+
+    fields = ('id', 'date')
+
+    # Esquema del formato binario (ver payload.py): identificador único por clase, versión y
+    # tipo de los campos que no se codifican como float32
+    schema_id = None
+    schema_version = 1
+    wire_types = {}
+
+    def __init_subclass__(cls, **kwargs):
+        super().__init_subclass__(**kwargs)
+        cls.fields = slots_to_fields(cls)
+        if 'to_dict' not in vars(cls):
+            cls.to_dict = compile_to_dict(cls)
+
     def __init__(self, **kwargs):
+        self._trace = None
         self.id = kwargs.pop('id', None)
         self.date = kwargs.pop('date', datetime.now(tz=timezone.utc))
 
@@ -44,37 +172,27 @@ class BaseItem(object):
 
         self._date = value
 
-    @staticmethod
-    def _convert_string_to_decimal(value):
-        val = None
-        if value is not None:
-            try:
-                val = Decimal(value)
-            except InvalidOperation:
-                logger.error("Convert string to decimal", value)
+    # Conversión de los campos numéricos, se cambia con set_numeric_backend
+    _convert_to_number = staticmethod(string_to_float)
 
-        return val
+    _convert_string_to_decimal = staticmethod(string_to_decimal)
+
+    _convert_to_int = staticmethod(string_to_int)
 
     def to_json(self):
-        item = json.dumps(self, cls=DataEncoder, sort_keys=True, separators=(',', ':'))
+        item = JSON_ENCODER.encode(self.to_dict())
         return item
 
     def __iter__(self):
-        for name in dir(self):
+        for name in self.fields:
             yield name, getattr(self, name)
 
     def __dir__(self):
-        list_props = []
-        for name in vars(self):
-            list_props.append(name[1:])
-
-        return list_props
+        return list(self.fields)
 
     def __eq__(self, other):
         if isinstance(other, self.__class__):
-            a = dict(other)
-            b = dict(self)
-            return a == b
+            return all(getattr(self, name) == getattr(other, name) for name in self.fields)
         return False
 
     def __lt__(self, other):
@@ -83,30 +201,86 @@ class BaseItem(object):
 
     def __str__(self):
         line = ''
-        for name in dir(self):
+        for name in self.fields:
             line += '%s: %s | ' % (name, getattr(self, name))
 
 
+def _convert_datetime(value: datetime) -> str:
+    return value.isoformat(timespec='milliseconds')
+
+
+def _convert_number(value):
+    value = round(float(value), 3)
+    # NaN e infinito no son JSON válido
+    return value if math.isfinite(value) else None
+
+
+def _convert_other(value):
+    if isinstance(value, BaseItem):
+        return value.to_dict()
+    if isinstance(value, (int, str)):
+        return value
+
+    logger.error("No serialize value %s of type %s", value, type(value).__name__)
+    return None
+
+
+# Conversión de cada tipo a un valor JSON, None si el valor se serializa tal cual
+CONVERTERS = {
+    datetime: _convert_datetime,
+    Decimal: _convert_number,
+    float: _convert_number,
+    int: None,
+    bool: None,
+    str: None
+}
+
+
+def compile_to_dict(cls):
+    """
+    Genera la función de serialización de la clase, con un bloque por campo en orden alfabético,
+    de forma que no hay que recorrer ni ordenar los campos en cada registro. Los números, el caso
+    más habitual, se convierten en línea sin llamadas adicionales.
+    Los campos con valor None no se incluyen.
+
+    :param cls: Subclase de BaseItem
+    :return: Función que recibe un registro y retorna un diccionario con valores JSON
+    """
+    lines = ['def to_dict(item):', '    data = {}']
+    for name in sorted(cls.fields):
+        lines += ['    value = item.%s' % name,
+                  '    if value is not None:',
+                  '        datatype = type(value)',
+                  '        if datatype is Decimal or datatype is float:',
+                  '            value = round(float(value), 3)',
+                  # NaN e infinito no son JSON válido, en ambos casos value - value no es 0
+                  '            if value - value == 0:',
+                  '                data[%r] = value' % name,
+                  '        else:',
+                  '            convert = get_converter(datatype, convert_other)',
+                  '            if convert is None:',
+                  '                data[%r] = value' % name,
+                  '            else:',
+                  '                value = convert(value)',
+                  '                if value is not None:',
+                  '                    data[%r] = value' % name]
+    lines.append('    return data')
+
+    namespace = {'Decimal': Decimal, 'get_converter': CONVERTERS.get, 'convert_other': _convert_other}
+    exec(compile('\n'.join(lines), '<%s.to_dict>' % cls.__name__, 'exec'), namespace)
+
+    return namespace['to_dict']
+
+
+# Las subclases la generan en __init_subclass__
+BaseItem.to_dict = compile_to_dict(BaseItem)
+
+
 class DataEncoder(json.JSONEncoder):
+    """ Permite serializar registros con json.dumps(..., cls=DataEncoder) """
+
     def default(self, o):
-        serial = {}
-        for name in dir(o):
-            value = getattr(o, name)
-            datatype = type(value)
-            if datatype is datetime:
-                serial[name] = value.isoformat(timespec='milliseconds')
-            elif datatype is Decimal:
-                serial[name] = round(float(value), 3)
-            elif datatype is int:
-                serial[name] = value
-            elif datatype is str:
-                serial[name] = value
-            elif isinstance(value, BaseItem):
-                serial[name] = self.default(value)
-            elif value:
-                try:
-                    serial[name] = json.JSONEncoder.default(self, value)
-                except TypeError as e:
-                    logger.error("No serialize property %s with value %s" % (name, value,))
-
-        return serial
+        if isinstance(o, BaseItem):
+            return o.to_dict()
+
+        return super(DataEncoder, self).default(o)
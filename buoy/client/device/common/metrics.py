@@ -0,0 +1,267 @@
+# -*- coding: utf-8 -*-
+
+"""
+Métricas del proceso de lectura, guardado y envío, en el formato de texto de Prometheus.
+
+Registrar un valor es una suma sobre un atributo, sin bloqueos: cada métrica la actualiza un único
+hilo (o el bucle asyncio) y el exportador solo la lee. Los valores que ya existen en otros objetos
+(tamaño de las colas, mensajes en vuelo) se leen con una función al exportar, sin coste al procesar.
+
+Las métricas se publican en un fichero para el textfile collector de node_exporter, en un servidor
+HTTP local o en ambos.
+"""
+
+import logging
+import os
+import time
+from bisect import bisect_left
+from http.server import BaseHTTPRequestHandler, HTTPServer
+from socketserver import ThreadingMixIn
+from threading import Thread
+from typing import Callable, Dict, List, Tuple
+
+logger = logging.getLogger(__name__)
+
+COUNTER = 'counter'
+GAUGE = 'gauge'
+HISTOGRAM = 'histogram'
+
+# Límites en segundos de los intervalos de los histogramas de latencia
+LATENCY_BUCKETS = (0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0)
+
+CONTENT_TYPE = 'text/plain; version=0.0.4; charset=utf-8'
+
+
+def format_labels(labels: Dict[str, str]) -> str:
+    if not labels:
+        return ''
+
+    return '{' + ','.join('%s="%s"' % (name, str(value).replace('\\', '\\\\').replace('"', '\\"'))
+                          for name, value in sorted(labels.items())) + '}'
+
+
+def format_value(value) -> str:
+    if value is None:
+        return 'NaN'
+    if isinstance(value, float) and value in (float('inf'), float('-inf')):
+        return '+Inf' if value > 0 else '-Inf'
+
+    return repr(float(value)) if isinstance(value, float) else str(value)
+
+
+class Metric(object):
+    """ Métrica con nombre y etiquetas. Con function, el valor se obtiene al exportar """
+
+    type = None
+
+    def __init__(self, name: str, help: str = '', labels: Dict[str, str] = None, function: Callable = None):
+        self.name = name
+        self.help = help
+        self.labels = labels or {}
+        self.function = function
+
+    def samples(self) -> List[Tuple[str, Dict[str, str], float]]:
+        """ :return: Lista de tuplas (sufijo del nombre, etiquetas, valor) """
+        raise NotImplementedError
+
+
+class Counter(Metric):
+    """ Valor que solo crece: líneas leídas, registros guardados, reconexiones... """
+
+    type = COUNTER
+
+    def __init__(self, *args, **kwargs):
+        super(Counter, self).__init__(*args, **kwargs)
+        self.value = 0
+
+    def inc(self, amount=1):
+        self.value += amount
+
+    def samples(self):
+        return [('_total', self.labels, self.function() if self.function else self.value)]
+
+
+class Gauge(Metric):
+    """ Valor que sube y baja: tamaño de una cola, mensajes en vuelo... """
+
+    type = GAUGE
+
+    def __init__(self, *args, **kwargs):
+        super(Gauge, self).__init__(*args, **kwargs)
+        self.value = 0
+
+    def set(self, value):
+        self.value = value
+
+    def inc(self, amount=1):
+        self.value += amount
+
+    def dec(self, amount=1):
+        self.value -= amount
+
+    def samples(self):
+        return [('', self.labels, self.function() if self.function else self.value)]
+
+
+class Histogram(Metric):
+    """
+    Distribución de valores (latencias en segundos) en intervalos fijos. Cada observación suma uno
+    al contador de su intervalo; los acumulados que pide Prometheus se calculan al exportar.
+    """
+
+    type = HISTOGRAM
+
+    def __init__(self, *args, buckets: Tuple[float, ...] = LATENCY_BUCKETS, **kwargs):
+        super(Histogram, self).__init__(*args, **kwargs)
+        self.buckets = tuple(sorted(buckets))
+        # El último contador es el intervalo +Inf
+        self.counts = [0] * (len(self.buckets) + 1)
+        self.sum = 0.0
+
+    def observe(self, value: float):
+        self.counts[bisect_left(self.buckets, value)] += 1
+        self.sum += value
+
+    @property
+    def count(self) -> int:
+        return sum(self.counts)
+
+    def samples(self):
+        samples, cumulative = [], 0
+        for bound, count in zip(self.buckets + (float('inf'),), self.counts):
+            cumulative += count
+            samples.append(('_bucket', dict(self.labels, le=format_value(float(bound))), cumulative))
+        samples.append(('_sum', self.labels, self.sum))
+        samples.append(('_count', self.labels, cumulative))
+
+        return samples
+
+
+class MetricsRegistry(object):
+    """
+    Métricas de un dispositivo. Cada métrica se identifica por su nombre y sus etiquetas; pedir una que
+    ya existe retorna la misma. El nombre completo lleva prefix y todas llevan las etiquetas comunes
+    del registro (p. ej. el dispositivo).
+    """
+
+    def __init__(self, prefix: str = 'buoy', labels: Dict[str, str] = None):
+        self.prefix = prefix
+        self.labels = labels or {}
+        self._metrics = {}
+
+    def _get(self, cls: type, name: str, help: str, labels: Dict[str, str], **kwargs) -> Metric:
+        labels = dict(self.labels, **(labels or {}))
+        key = (name, tuple(sorted(labels.items())))
+        metric = self._metrics.get(key)
+        if metric is None:
+            metric = self._metrics[key] = cls(self.prefix + '_' + name, help, labels=labels, **kwargs)
+        elif not isinstance(metric, cls):
+            raise ValueError("Metric %s already registered as %s" % (name, metric.type))
+
+        return metric
+
+    def counter(self, name: str, help: str = '', labels: Dict[str, str] = None, function: Callable = None) -> Counter:
+        return self._get(Counter, name, help, labels, function=function)
+
+    def gauge(self, name: str, help: str = '', labels: Dict[str, str] = None, function: Callable = None) -> Gauge:
+        return self._get(Gauge, name, help, labels, function=function)
+
+    def histogram(self, name: str, help: str = '', labels: Dict[str, str] = None,
+                  buckets: Tuple[float, ...] = LATENCY_BUCKETS) -> Histogram:
+        return self._get(Histogram, name, help, labels, buckets=buckets)
+
+    @property
+    def metrics(self) -> List[Metric]:
+        return list(self._metrics.values())
+
+    def render(self) -> str:
+        """ Métricas en el formato de texto de Prometheus, agrupadas por nombre """
+        lines, described = [], set()
+        for metric in sorted(self.metrics, key=lambda metric: metric.name):
+            try:
+                samples = metric.samples()
+            except Exception as ex:
+                logger.warning("Error reading metric %s - %s", metric.name, ex)
+                continue
+
+            if metric.name not in described:
+                described.add(metric.name)
+                lines.append('# HELP %s %s' % (metric.name, metric.help))
+                lines.append('# TYPE %s %s' % (metric.name, metric.type))
+            for suffix, labels, value in samples:
+                lines.append('%s%s%s %s' % (metric.name, suffix, format_labels(labels), format_value(value)))
+
+        return '\n'.join(lines) + '\n'
+
+    def write_textfile(self, path: str):
+        """ Escribe las métricas de forma atómica, node_exporter nunca lee un fichero a medias """
+        tmp_path = '%s.%i.tmp' % (path, os.getpid())
+        with open(tmp_path, 'w') as fh:
+            fh.write(self.render())
+        os.replace(tmp_path, path)
+
+
+class ThreadingHTTPServer(ThreadingMixIn, HTTPServer):
+    daemon_threads = True
+
+
+class MetricsHandler(BaseHTTPRequestHandler):
+    registry = None
+
+    def do_GET(self):
+        if self.path.split('?')[0] not in ('/', '/metrics'):
+            self.send_error(404)
+            return
+
+        body = self.registry.render().encode('utf-8')
+        self.send_response(200)
+        self.send_header('Content-Type', CONTENT_TYPE)
+        self.send_header('Content-Length', str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, format, *args):
+        logger.debug("Metrics request - " + format, *args)
+
+
+class MetricsExporter(Thread):
+    """
+    Publica las métricas del registro:
+        * textfile: fichero .prom que se reescribe cada interval segundos
+        * port: servidor HTTP en address:port que responde en /metrics
+    """
+
+    def __init__(self, registry: MetricsRegistry, textfile: str = None, interval: float = 15,
+                 port: int = None, address: str = '127.0.0.1'):
+        super(MetricsExporter, self).__init__(daemon=True)
+        self.registry = registry
+        self.textfile = textfile
+        self.interval = interval
+        self.port = port
+        self.address = address
+        self.server = None
+        self.active = False
+
+    def start(self):
+        if self.port is not None:
+            handler = type('RegistryMetricsHandler', (MetricsHandler,), {'registry': self.registry})
+            self.server = ThreadingHTTPServer((self.address, self.port), handler)
+            Thread(target=self.server.serve_forever, daemon=True).start()
+            logger.info("Serving metrics on http://%s:%i/metrics", self.address, self.server.server_port)
+        super(MetricsExporter, self).start()
+
+    def run(self):
+        self.active = True
+        while self.active and self.textfile:
+            try:
+                self.registry.write_textfile(self.textfile)
+            except OSError as ex:
+                logger.warning("Error writing metrics to %s - %s", self.textfile, ex)
+            time.sleep(self.interval)
+
+    def stop(self):
+        self.active = False
+        if self.server:
+            self.server.shutdown()
+            self.server.server_close()
+            self.server = None
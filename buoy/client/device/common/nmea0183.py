@@ -1,9 +1,105 @@
 # -*- coding: utf-8 -*-
 
+import logging
+from functools import reduce
+from operator import xor
+from typing import List, Optional, Tuple, Union
+
 from buoy.client.device.common.item import BaseItem
 
+logger = logging.getLogger(__name__)
+
+
+def nmea_checksum(data: bytes) -> int:
+    """ XOR de todos los bytes entre $ y * """
+    return reduce(xor, data, 0)
+
+
+def parse_sentence(line: Union[bytes, str], sentences=None, check: bool = True) -> Optional[Tuple[str, List[str]]]:
+    """
+    Separa una sentencia NMEA 0183 en identificador y campos.
+
+    El identificador (emisor y tipo, p. ej. WIMDA) se comprueba antes de cualquier otro trabajo,
+    de forma que las sentencias que no interesan se descartan sin calcular la suma de control
+    ni separar los campos.
+
+    La suma de control se calcula sobre los bytes, por lo que la línea debe pasarse tal como se
+    recibió del dispositivo. Las líneas ya decodificadas se codifican de nuevo en UTF-8.
+
+    :param line: Línea leída del dispositivo
+    :param sentences: Identificadores aceptados, None para aceptar todos
+    :param check: Valida la suma de control *hh, si la sentencia la incluye
+    :return: Tupla (identificador, campos) o None si la sentencia se descarta
+    """
+    if isinstance(line, str):
+        line = line.encode('utf-8')
+
+    start = line.find(b'$')
+    if start < 0:
+        return None
+
+    comma = line.find(b',', start)
+    if comma < 0:
+        return None
+
+    identifier = line[start + 1:comma].decode('latin-1')
+    if sentences is not None and identifier not in sentences:
+        return None
+
+    end = line.find(b'*', comma)
+    if end < 0:
+        end = len(line)
+    elif check:
+        try:
+            expected = int(line[end + 1:end + 3], 16)
+        except ValueError:
+            logger.debug("Invalid checksum in sentence %s", line)
+            return None
+        if nmea_checksum(line[start + 1:end]) != expected:
+            logger.debug("Checksum error in sentence %s", line)
+            return None
+
+    return identifier, line[comma + 1:end].decode('latin-1').split(',')
+
+
+def pad_fields(values: List[str], num: int) -> List[str]:
+    """ Completa con campos vacíos las sentencias que llegan truncadas """
+    if len(values) < num:
+        return values + [''] * (num - len(values))
+
+    return values
+
+
+def coordinate_to_degrees(value: str, hemisphere: str) -> Optional[float]:
+    """
+    Convierte una coordenada NMEA (ddmm.mmmm o dddmm.mmmm) a grados decimales
+
+    :param value: Coordenada en grados y minutos
+    :param hemisphere: N, S, E o W. Sur y oeste son negativos
+    :return: Grados decimales con signo o None si la coordenada no es válida
+    """
+    if not value:
+        return None
+
+    try:
+        point = value.index('.') if '.' in value else len(value)
+        degrees = int(value[:point - 2]) + float(value[point - 2:]) / 60
+    except ValueError:
+        logger.error("Convert coordinate %s to degrees", value)
+        return None
+
+    if hemisphere in ('S', 'W'):
+        degrees = -degrees
+
+    return round(degrees, 6)
+
 
 class WIMDA(BaseItem):
+    __slots__ = ('_press_inch', '_press_mbar', '_air_temp', '_water_temp', '_rel_humidity', '_abs_humidity',
+                 '_dew_point', '_wind_dir_true', '_wind_dir_magnetic', '_wind_knots', '_wind_meters')
+
+    schema_id = 1
+
     def __init__(self, **kwargs):
         self.press_inch = kwargs.pop('press_inch', None)
         self.press_mbar = kwargs.pop('press_mbar', None)
@@ -19,155 +115,164 @@ class WIMDA(BaseItem):
         super(WIMDA, self).__init__(**kwargs)
 
     @staticmethod
-    def from_nmea(in_datetime, wimda):
-        if hasattr(wimda, "b_pressure_bar"):
-            wimda.b_pressure_bar *= 1000
+    def from_sentence(in_datetime, values: List[str]):
+        """
+        Crea el registro a partir de los campos de la sentencia $WIMDA, sin el identificador:
+        presión (pulgadas), I, presión (bares), B, temperatura del aire, C, temperatura del agua, C,
+        humedad relativa, humedad absoluta, punto de rocío, C, dirección del viento verdadera, T,
+        dirección del viento magnética, M, velocidad del viento (nudos), N, velocidad del viento (m/s), M
+        """
+        values = pad_fields(values, 20)
+
+        press_mbar = BaseItem._convert_to_number(values[2])
+        if press_mbar is not None:
+            press_mbar = round(press_mbar * 1000, 3)
 
         return WIMDA(
             date=in_datetime,
-            press_inch=wimda.b_pressure_inch,
-            press_mbar=wimda.b_pressure_bar,
-            air_temp=wimda.air_temp,
-            water_temp=wimda.water_temp,
-            rel_humidity=wimda.rel_humidity,
-            abs_humidity=wimda.abs_humidity,
-            dew_point=wimda.dew_point,
-            wind_dir_true=wimda.direction_true,
-            wind_dir_magnetic=wimda.direction_magnetic,
-            wind_knots=wimda.wind_speed_knots,
-            wind_meters=wimda.wind_speed_meters)
+            press_inch=values[0],
+            press_mbar=press_mbar,
+            air_temp=values[4],
+            water_temp=values[6],
+            rel_humidity=values[8],
+            abs_humidity=values[9],
+            dew_point=values[10],
+            wind_dir_true=values[12],
+            wind_dir_magnetic=values[14],
+            wind_knots=values[16],
+            wind_meters=values[18])
 
     @property
     def press_inch(self):
         """
         :return: Barometric pressure, inches of mercury
-        :rtype: Decimal
+        :rtype: float
         """
         return self._press_inch
 
     @press_inch.setter
     def press_inch(self, value):
-        self._press_inch = self._convert_string_to_decimal(value)
+        self._press_inch = self._convert_to_number(value)
 
     @property
     def press_mbar(self):
         """
         :return: Barometric pressure, bars
-        :rtype: Decimal
+        :rtype: float
         """
         return self._press_mbar
 
     @press_mbar.setter
     def press_mbar(self, value):
-        self._press_mbar = self._convert_string_to_decimal(value)
+        self._press_mbar = self._convert_to_number(value)
 
     @property
     def air_temp(self):
         """
         :return: Barometric pressure, bars
-        :rtype: Decimal
+        :rtype: float
         """
         return self._air_temp
 
     @air_temp.setter
     def air_temp(self, value):
-        self._air_temp = self._convert_string_to_decimal(value)
+        self._air_temp = self._convert_to_number(value)
 
     @property
     def water_temp(self):
         """
         :return: Water temperature, degrees Celsius
-        :rtype: Decimal
+        :rtype: float
         """
         return self._water_temp
 
     @water_temp.setter
     def water_temp(self, value):
-        self._water_temp = self._convert_string_to_decimal(value)
+        self._water_temp = self._convert_to_number(value)
 
     @property
     def rel_humidity(self):
         """
         :return: Relative humidity, percent
-        :rtype: Decimal
+        :rtype: float
         """
         return self._rel_humidity
 
     @rel_humidity.setter
     def rel_humidity(self, value):
-        self._rel_humidity = self._convert_string_to_decimal(value)
+        self._rel_humidity = self._convert_to_number(value)
 
     @property
     def abs_humidity(self):
         """
         :return: Absolute humidity, percent
-        :rtype: Decimal
+        :rtype: float
         """
         return self._abs_humidity
 
     @abs_humidity.setter
     def abs_humidity(self, value):
-        self._abs_humidity = self._convert_string_to_decimal(value)
+        self._abs_humidity = self._convert_to_number(value)
 
     @property
     def dew_point(self):
         """
         :return: Dew point, degrees C
-        :rtype: Decimal
+        :rtype: float
         """
         return self._dew_point
 
     @dew_point.setter
     def dew_point(self, value):
-        self._dew_point = self._convert_string_to_decimal(value)
+        self._dew_point = self._convert_to_number(value)
 
     @property
     def wind_dir_true(self):
         """
         :return: Wind direction true
-        :rtype: Decimal
+        :rtype: float
         """
         return self._wind_dir_true
 
     @wind_dir_true.setter
     def wind_dir_true(self, value):
-        self._wind_dir_true = self._convert_string_to_decimal(value)
+        self._wind_dir_true = self._convert_to_number(value)
 
     @property
     def wind_dir_magnetic(self):
         """
         :return: Wind direction magnetic
-        :rtype: Decimal
+        :rtype: float
         """
         return self._wind_dir_magnetic
 
     @wind_dir_magnetic.setter
     def wind_dir_magnetic(self, value):
-        self._wind_dir_magnetic = self._convert_string_to_decimal(value)
+        self._wind_dir_magnetic = self._convert_to_number(value)
 
     @property
     def wind_knots(self):
         """
         :return: Wind speed knots
-        :rtype: Decimal
+        :rtype: float
         """
         return self._wind_knots
 
     @wind_knots.setter
     def wind_knots(self, value):
-        self._wind_knots = self._convert_string_to_decimal(value)
+        self._wind_knots = self._convert_to_number(value)
 
     @property
     def wind_meters(self):
         """
         :return: Wind speed meters/second
-        :rtype: Decimal
+        :rtype: float
         """
         return self._wind_meters
 
     @wind_meters.setter
     def wind_meters(self, value):
-        self._wind_meters = self._convert_string_to_decimal(value)
+        self._wind_meters = self._convert_to_number(value)
 
     def __str__(self):
         return ("Id: {id}\n"
@@ -181,3 +286,405 @@ class WIMDA(BaseItem):
                 "Wind direction true: {wind_dir_true} º\n"
                 "Wind direction magnetic: {wind_dir_magnetic} º\n"
                 "Wind speed: {wind_knots} knots - {wind_meters} m/s").format(**dict(self))
+
+
+class WIMWV(BaseItem):
+    """ Ángulo y velocidad del viento, relativo (R) o verdadero (T) """
+
+    __slots__ = ('_wind_angle', '_reference', '_wind_speed', '_speed_unit')
+
+    schema_id = 3
+    wire_types = {'reference': 'c', 'speed_unit': 'c'}
+
+    def __init__(self, **kwargs):
+        self.wind_angle = kwargs.pop('wind_angle', None)
+        self.reference = kwargs.pop('reference', None)
+        self.wind_speed = kwargs.pop('wind_speed', None)
+        self.speed_unit = kwargs.pop('speed_unit', None)
+        super(WIMWV, self).__init__(**kwargs)
+
+    @staticmethod
+    def from_sentence(in_datetime, values: List[str]):
+        """
+        Crea el registro a partir de los campos de la sentencia $WIMWV:
+        ángulo del viento, referencia (R/T), velocidad del viento, unidad (K/M/N), estado (A = válido)
+
+        :return: El registro o None si el dato no es válido
+        """
+        values = pad_fields(values, 5)
+        if values[4] != 'A':
+            return None
+
+        return WIMWV(
+            date=in_datetime,
+            wind_angle=values[0],
+            reference=values[1],
+            wind_speed=values[2],
+            speed_unit=values[3])
+
+    @property
+    def wind_angle(self):
+        """
+        :return: Wind angle, 0 to 359 degrees
+        :rtype: float
+        """
+        return self._wind_angle
+
+    @wind_angle.setter
+    def wind_angle(self, value):
+        self._wind_angle = self._convert_to_number(value)
+
+    @property
+    def reference(self):
+        """
+        :return: Reference, R = relative, T = true
+        :rtype: str
+        """
+        return self._reference
+
+    @reference.setter
+    def reference(self, value):
+        self._reference = value or None
+
+    @property
+    def wind_speed(self):
+        """
+        :return: Wind speed
+        :rtype: float
+        """
+        return self._wind_speed
+
+    @wind_speed.setter
+    def wind_speed(self, value):
+        self._wind_speed = self._convert_to_number(value)
+
+    @property
+    def speed_unit(self):
+        """
+        :return: Wind speed units, K = km/h, M = m/s, N = knots
+        :rtype: str
+        """
+        return self._speed_unit
+
+    @speed_unit.setter
+    def speed_unit(self, value):
+        self._speed_unit = value or None
+
+
+class YXXDR(BaseItem):
+    """ Cabeceo y balanceo de la estación, de la sentencia de transductores $YXXDR """
+
+    __slots__ = ('_pitch', '_roll')
+
+    schema_id = 4
+
+    def __init__(self, **kwargs):
+        self.pitch = kwargs.pop('pitch', None)
+        self.roll = kwargs.pop('roll', None)
+        super(YXXDR, self).__init__(**kwargs)
+
+    @staticmethod
+    def from_sentence(in_datetime, values: List[str]):
+        """
+        Crea el registro a partir de los campos de la sentencia $YXXDR, en grupos de cuatro:
+        tipo de transductor, medida, unidad, nombre. Solo se recogen los transductores PTCH y ROLL
+
+        :return: El registro o None si la sentencia no incluye ninguno de los dos
+        """
+        measures = {}
+        for i in range(0, len(values) - 3, 4):
+            measures[values[i + 3]] = values[i + 1]
+
+        if 'PTCH' not in measures and 'ROLL' not in measures:
+            return None
+
+        return YXXDR(
+            date=in_datetime,
+            pitch=measures.get('PTCH'),
+            roll=measures.get('ROLL'))
+
+    @property
+    def pitch(self):
+        """
+        :return: Pitch, degrees, bow up positive
+        :rtype: float
+        """
+        return self._pitch
+
+    @pitch.setter
+    def pitch(self, value):
+        self._pitch = self._convert_to_number(value)
+
+    @property
+    def roll(self):
+        """
+        :return: Roll, degrees, starboard down positive
+        :rtype: float
+        """
+        return self._roll
+
+    @roll.setter
+    def roll(self, value):
+        self._roll = self._convert_to_number(value)
+
+
+class HCHDG(BaseItem):
+    """ Rumbo magnético de la brújula, con su desvío y declinación """
+
+    __slots__ = ('_heading', '_deviation', '_variation')
+
+    schema_id = 5
+
+    def __init__(self, **kwargs):
+        self.heading = kwargs.pop('heading', None)
+        self.deviation = kwargs.pop('deviation', None)
+        self.variation = kwargs.pop('variation', None)
+        super(HCHDG, self).__init__(**kwargs)
+
+    @staticmethod
+    def from_sentence(in_datetime, values: List[str]):
+        """
+        Crea el registro a partir de los campos de la sentencia $HCHDG:
+        rumbo magnético, desvío, E/W, declinación, E/W. Los valores al oeste se guardan en negativo
+        """
+        values = pad_fields(values, 5)
+
+        return HCHDG(
+            date=in_datetime,
+            heading=values[0],
+            deviation=HCHDG._signed(values[1], values[2]),
+            variation=HCHDG._signed(values[3], values[4]))
+
+    @staticmethod
+    def _signed(value: str, direction: str) -> str:
+        if value and direction == 'W' and not value.startswith('-'):
+            return '-' + value
+
+        return value
+
+    @property
+    def heading(self):
+        """
+        :return: Magnetic sensor heading, degrees
+        :rtype: float
+        """
+        return self._heading
+
+    @heading.setter
+    def heading(self, value):
+        self._heading = self._convert_to_number(value)
+
+    @property
+    def deviation(self):
+        """
+        :return: Magnetic deviation, degrees, west negative
+        :rtype: float
+        """
+        return self._deviation
+
+    @deviation.setter
+    def deviation(self, value):
+        self._deviation = self._convert_to_number(value)
+
+    @property
+    def variation(self):
+        """
+        :return: Magnetic variation, degrees, west negative
+        :rtype: float
+        """
+        return self._variation
+
+    @variation.setter
+    def variation(self, value):
+        self._variation = self._convert_to_number(value)
+
+
+class GPGGA(BaseItem):
+    """ Posición GPS de la estación """
+
+    __slots__ = ('_latitude', '_longitude', '_fix_quality', '_num_satellites', '_hdop', '_altitude')
+
+    schema_id = 6
+    wire_types = {'latitude': 'd', 'longitude': 'd', 'fix_quality': 'h', 'num_satellites': 'h'}
+
+    def __init__(self, **kwargs):
+        self.latitude = kwargs.pop('latitude', None)
+        self.longitude = kwargs.pop('longitude', None)
+        self.fix_quality = kwargs.pop('fix_quality', None)
+        self.num_satellites = kwargs.pop('num_satellites', None)
+        self.hdop = kwargs.pop('hdop', None)
+        self.altitude = kwargs.pop('altitude', None)
+        super(GPGGA, self).__init__(**kwargs)
+
+    @staticmethod
+    def from_sentence(in_datetime, values: List[str]):
+        """
+        Crea el registro a partir de los campos de la sentencia $GPGGA:
+        hora UTC, latitud, N/S, longitud, E/W, calidad del fijo, número de satélites, HDOP, altitud, M, ...
+
+        :return: El registro o None si el GPS no tiene posición
+        """
+        values = pad_fields(values, 10)
+        latitude = coordinate_to_degrees(values[1], values[2])
+        longitude = coordinate_to_degrees(values[3], values[4])
+        if latitude is None or longitude is None:
+            return None
+
+        return GPGGA(
+            date=in_datetime,
+            latitude=latitude,
+            longitude=longitude,
+            fix_quality=values[5],
+            num_satellites=values[6],
+            hdop=values[7],
+            altitude=values[8])
+
+    @property
+    def latitude(self):
+        """
+        :return: Latitude, decimal degrees, south negative
+        :rtype: float
+        """
+        return self._latitude
+
+    @latitude.setter
+    def latitude(self, value):
+        self._latitude = self._convert_to_number(value)
+
+    @property
+    def longitude(self):
+        """
+        :return: Longitude, decimal degrees, west negative
+        :rtype: float
+        """
+        return self._longitude
+
+    @longitude.setter
+    def longitude(self, value):
+        self._longitude = self._convert_to_number(value)
+
+    @property
+    def fix_quality(self):
+        """
+        :return: GPS quality indicator, 0 = invalid, 1 = GPS fix, 2 = DGPS fix
+        :rtype: int
+        """
+        return self._fix_quality
+
+    @fix_quality.setter
+    def fix_quality(self, value):
+        self._fix_quality = self._convert_to_int(value)
+
+    @property
+    def num_satellites(self):
+        """
+        :return: Number of satellites in use
+        :rtype: int
+        """
+        return self._num_satellites
+
+    @num_satellites.setter
+    def num_satellites(self, value):
+        self._num_satellites = self._convert_to_int(value)
+
+    @property
+    def hdop(self):
+        """
+        :return: Horizontal dilution of precision
+        :rtype: float
+        """
+        return self._hdop
+
+    @hdop.setter
+    def hdop(self, value):
+        self._hdop = self._convert_to_number(value)
+
+    @property
+    def altitude(self):
+        """
+        :return: Antenna altitude above mean sea level, meters
+        :rtype: float
+        """
+        return self._altitude
+
+    @altitude.setter
+    def altitude(self, value):
+        self._altitude = self._convert_to_number(value)
+
+
+class GPVTG(BaseItem):
+    """ Rumbo y velocidad sobre el fondo """
+
+    __slots__ = ('_course_true', '_course_magnetic', '_speed_knots', '_speed_kmh')
+
+    schema_id = 7
+
+    def __init__(self, **kwargs):
+        self.course_true = kwargs.pop('course_true', None)
+        self.course_magnetic = kwargs.pop('course_magnetic', None)
+        self.speed_knots = kwargs.pop('speed_knots', None)
+        self.speed_kmh = kwargs.pop('speed_kmh', None)
+        super(GPVTG, self).__init__(**kwargs)
+
+    @staticmethod
+    def from_sentence(in_datetime, values: List[str]):
+        """
+        Crea el registro a partir de los campos de la sentencia $GPVTG:
+        rumbo verdadero, T, rumbo magnético, M, velocidad (nudos), N, velocidad (km/h), K, modo
+        """
+        values = pad_fields(values, 8)
+
+        return GPVTG(
+            date=in_datetime,
+            course_true=values[0],
+            course_magnetic=values[2],
+            speed_knots=values[4],
+            speed_kmh=values[6])
+
+    @property
+    def course_true(self):
+        """
+        :return: Course over ground, degrees true
+        :rtype: float
+        """
+        return self._course_true
+
+    @course_true.setter
+    def course_true(self, value):
+        self._course_true = self._convert_to_number(value)
+
+    @property
+    def course_magnetic(self):
+        """
+        :return: Course over ground, degrees magnetic
+        :rtype: float
+        """
+        return self._course_magnetic
+
+    @course_magnetic.setter
+    def course_magnetic(self, value):
+        self._course_magnetic = self._convert_to_number(value)
+
+    @property
+    def speed_knots(self):
+        """
+        :return: Speed over ground, knots
+        :rtype: float
+        """
+        return self._speed_knots
+
+    @speed_knots.setter
+    def speed_knots(self, value):
+        self._speed_knots = self._convert_to_number(value)
+
+    @property
+    def speed_kmh(self):
+        """
+        :return: Speed over ground, km/h
+        :rtype: float
+        """
+        return self._speed_kmh
+
+    @speed_kmh.setter
+    def speed_kmh(self, value):
+        self._speed_kmh = self._convert_to_number(value)
@@ -0,0 +1,63 @@
+# -*- coding: utf-8 -*-
+
+import logging
+import time
+from collections import deque
+from threading import Lock
+
+logger = logging.getLogger(__name__)
+
+
+class Outbox(object):
+    """
+    Aviso en memoria de los registros que se han quedado pendientes de envío en la base de datos,
+    porque no cabían en la cola de envío o porque falló su publicación.
+
+    La consulta de pendientes solo devuelve registros con más de delay segundos de antigüedad, por lo que
+    cada aviso no se considera listo hasta pasado ese tiempo. Los avisos próximos en el tiempo se agrupan
+    en tramos de como máximo resolution segundos, para que la memoria no crezca con el número de registros.
+    """
+
+    def __init__(self, delay: float = 30, resolution: float = 5):
+        self.delay = delay
+        self.resolution = resolution
+        # Tramos [inicio, fin, número de registros]
+        self._pending = deque()
+        self._lock = Lock()
+
+    @property
+    def pending(self) -> int:
+        """ Número de registros avisados que aún no se han retirado """
+        with self._lock:
+            return sum(num for _, _, num in self._pending)
+
+    def notify(self, num: int = 1):
+        """ Anota num registros pendientes de envío en la base de datos """
+        if num <= 0:
+            return
+
+        now = time.monotonic()
+        with self._lock:
+            if self._pending and now - self._pending[-1][0] < self.resolution:
+                self._pending[-1][1] = now
+                self._pending[-1][2] += num
+            else:
+                self._pending.append([now, now, num])
+
+    def take(self) -> int:
+        """
+        Retira los avisos que ya son visibles en la consulta de pendientes
+
+        :return: Número de registros avisados que hay que buscar en la base de datos
+        """
+        limit = time.monotonic() - self.delay
+        num = 0
+        with self._lock:
+            while self._pending and self._pending[0][1] <= limit:
+                num += self._pending.popleft()[2]
+
+        return num
+
+    def clear(self):
+        with self._lock:
+            self._pending.clear()
@@ -0,0 +1,339 @@
+# -*- coding: utf-8 -*-
+
+import json
+import logging
+import struct
+from datetime import datetime, timezone, timedelta
+from importlib import import_module
+from typing import Dict, List, Union
+
+from buoy.client.device.common.compression import CompressedCodec, COMPRESSED_MAGIC, COMPRESSION_NONE, \
+    decompress, load_dictionary
+from buoy.client.device.common.item import BaseItem
+from buoy.client.device.common.timeseries import encode_series, decode_series
+
+logger = logging.getLogger(__name__)
+
+PAYLOAD_JSON = 'json'
+PAYLOAD_BINARY = 'binary'
+PAYLOAD_TIMESERIES = 'timeseries'
+
+# Primer byte de los mensajes binarios, los JSON empiezan por { o [
+BINARY_MAGIC = 0xB1
+TIMESERIES_MAGIC = 0xD1
+
+# Cabecera binaria y de series temporales: marca, identificador del esquema, versión del esquema, número de registros
+BINARY_HEADER = struct.Struct('>BBBH')
+
+# Módulos con las clases de registro, se importan al decodificar para conocer todos los esquemas
+ITEM_MODULES = ('buoy.client.device.common.nmea0183', 'buoy.client.device.currentmeter.item')
+
+# Mayor valor finito de float32 y rango de int16, los valores fuera de rango no se pueden empaquetar
+FLOAT32_MAX = 3.4028234663852886e38
+INT16_MIN, INT16_MAX = -2 ** 15, 2 ** 15 - 1
+
+EPOCH = datetime(1970, 1, 1, tzinfo=timezone.utc)
+MILLISECOND = timedelta(milliseconds=1)
+
+
+def _encode_date(value: datetime) -> int:
+    if value.tzinfo is None:
+        value = value.replace(tzinfo=timezone.utc)
+    return (value - EPOCH) // MILLISECOND
+
+
+def _decode_date(value: int) -> str:
+    return datetime.fromtimestamp(value / 1000.0, tz=timezone.utc).isoformat(timespec='milliseconds')
+
+
+def _encode_number(value):
+    value = float(value)
+    # NaN e infinito se descartan igual que en JSON
+    return value if value - value == 0 else None
+
+
+def _encode_float32(value):
+    value = _encode_number(value)
+    # Una lectura errónea fuera del rango de float32 se descarta como el infinito
+    return value if value is not None and abs(value) <= FLOAT32_MAX else None
+
+
+def _encode_int16(value):
+    value = int(value)
+    return value if INT16_MIN <= value <= INT16_MAX else None
+
+
+def _decode_float32(value: float) -> float:
+    # float32 tiene unas 7 cifras significativas, se quitan los decimales espurios de la conversión
+    return float('%.7g' % value)
+
+
+def _encode_char(value: str) -> bytes:
+    return value.encode('ascii')[:1]
+
+
+def _decode_char(value: bytes) -> str:
+    return value.decode('ascii')
+
+
+# Tipo de campo: (formato struct, codificación, decodificación). T es la fecha en milisegundos
+WIRE_TYPES = {
+    'T': ('q', _encode_date, _decode_date),
+    'q': ('q', int, None),
+    'h': ('h', _encode_int16, None),
+    'f': ('f', _encode_float32, _decode_float32),
+    'd': ('d', _encode_number, None),
+    'c': ('c', _encode_char, _decode_char)
+}
+
+
+class Schema(object):
+    """
+    Esquema binario de una clase de registro. Cada campo se identifica por su posición en fields;
+    un mapa de bits indica los campos presentes y solo se codifican sus valores.
+    Si cambian los campos de la clase hay que incrementar schema_version.
+    """
+
+    def __init__(self, cls: type):
+        self.cls = cls
+        self.schema_id = cls.schema_id
+        self.version = cls.schema_version
+        types = dict({'id': 'q', 'date': 'T'}, **cls.wire_types)
+        self.columns = [(name, types.get(name, 'f')) for name in cls.fields]
+        num = len(self.columns)
+        self.bitmap = struct.Struct('>H' if num <= 16 else '>I' if num <= 32 else '>Q')
+        self._structs = {}
+
+    def get_struct(self, bitmap: int) -> struct.Struct:
+        """ Formato de los valores de un registro con los campos presentes en bitmap """
+        values = self._structs.get(bitmap)
+        if values is None:
+            values = struct.Struct('>' + ''.join(WIRE_TYPES[code][0] for i, (_, code) in enumerate(self.columns)
+                                                 if bitmap & (1 << i)))
+            self._structs[bitmap] = values
+
+        return values
+
+    def encode(self, item: BaseItem) -> bytes:
+        bitmap, values = 0, []
+        for i, (name, code) in enumerate(self.columns):
+            value = getattr(item, name)
+            if value is not None:
+                value = WIRE_TYPES[code][1](value)
+            if value is not None:
+                bitmap |= 1 << i
+                values.append(value)
+
+        return self.bitmap.pack(bitmap) + self.get_struct(bitmap).pack(*values)
+
+    def decode(self, payload: bytes, offset: int) -> tuple:
+        """ :return: Tupla (diccionario con los campos del registro, posición del siguiente registro) """
+        bitmap, = self.bitmap.unpack_from(payload, offset)
+        offset += self.bitmap.size
+        values = self.get_struct(bitmap)
+        data = {}
+        value_iter = iter(values.unpack_from(payload, offset))
+        for i, (name, code) in enumerate(self.columns):
+            if bitmap & (1 << i):
+                value = next(value_iter)
+                decode = WIRE_TYPES[code][2]
+                data[name] = decode(value) if decode else value
+
+        return data, offset + values.size
+
+
+SCHEMAS = {}
+
+
+def get_schema(cls: type) -> Schema:
+    """ Esquema binario de la clase de registro """
+    schema = SCHEMAS.get(cls.schema_id)
+    if schema is None or schema.cls is not cls:
+        if cls.schema_id is None:
+            raise ValueError("Item class %s has not binary schema" % (cls.__name__,))
+        schema = SCHEMAS[cls.schema_id] = Schema(cls)
+
+    return schema
+
+
+def find_schema(schema_id: int) -> Schema:
+    """ Busca el esquema por su identificador entre las subclases de BaseItem """
+    if schema_id not in SCHEMAS:
+        for module in ITEM_MODULES:
+            import_module(module)
+
+        pending = list(BaseItem.__subclasses__())
+        while pending:
+            cls = pending.pop()
+            pending.extend(cls.__subclasses__())
+            if cls.schema_id == schema_id:
+                return get_schema(cls)
+
+        raise ValueError("Unknown binary schema %s" % (schema_id,))
+
+    return SCHEMAS[schema_id]
+
+
+class JSONCodec(object):
+    """ Registros en JSON, un objeto por mensaje o un array de objetos en los envíos agrupados """
+
+    name = PAYLOAD_JSON
+    # Corchetes del array y separador entre registros
+    header_size = 1
+    separator_size = 1
+
+    def encode(self, item: BaseItem) -> str:
+        return item.to_json()
+
+    def record(self, item: BaseItem) -> str:
+        return item.to_json()
+
+    def join(self, items: List[BaseItem], records: List[str]) -> str:
+        return '[' + ','.join(records) + ']'
+
+    def batch_limit(self, max_bytes: int) -> int:
+        return max_bytes
+
+
+class BinaryCodec(object):
+    """
+    Mensajes agrupados en binario, con una cabecera (marca 0xB1, esquema, versión, número de registros)
+    seguida de los registros de una misma clase. Los campos numéricos van en float32 salvo que la clase
+    indique otro tipo en wire_types.
+
+    Los registros sueltos se envían en JSON, que es lo que esperan los consumidores de topic_data.
+    """
+
+    name = PAYLOAD_BINARY
+    header_size = BINARY_HEADER.size
+    separator_size = 0
+
+    def encode(self, item: BaseItem) -> str:
+        return item.to_json()
+
+    def record(self, item: BaseItem) -> bytes:
+        return get_schema(type(item)).encode(item)
+
+    def join(self, items: List[BaseItem], records: List[bytes]) -> bytes:
+        schema = get_schema(type(items[0]))
+        return BINARY_HEADER.pack(BINARY_MAGIC, schema.schema_id, schema.version, len(records)) + b''.join(records)
+
+    def batch_limit(self, max_bytes: int) -> int:
+        return max_bytes
+
+
+class TimeSeriesCodec(BinaryCodec):
+    """
+    Mensajes agrupados como series temporales (marca 0xD1, ver timeseries.py): el primer registro
+    completo y el resto como diferencias con el anterior, con los tipos del formato binario.
+    Los registros sueltos se envían en JSON.
+
+    El tamaño de cada registro solo se conoce al codificar el grupo entero, así que los grupos se
+    forman con el tamaño en binario, corregido con la reducción media obtenida.
+    """
+
+    name = PAYLOAD_TIMESERIES
+
+    def __init__(self):
+        self.bytes_binary = 0
+        self.bytes_series = 0
+
+    def join(self, items: List[BaseItem], records: List[bytes]) -> bytes:
+        schema = get_schema(type(items[0]))
+        payload = BINARY_HEADER.pack(TIMESERIES_MAGIC, schema.schema_id, schema.version, len(items)) + \
+            encode_series(schema.columns, WIRE_TYPES, items)
+        self.bytes_binary += self.header_size + sum(len(record) for record in records)
+        self.bytes_series += len(payload)
+
+        return payload
+
+    def batch_limit(self, max_bytes: int) -> int:
+        if not self.bytes_binary:
+            return max_bytes
+
+        return int(max_bytes / max(self.bytes_series / self.bytes_binary, 0.1))
+
+
+CODECS = {
+    PAYLOAD_JSON: JSONCodec,
+    PAYLOAD_BINARY: BinaryCodec,
+    PAYLOAD_TIMESERIES: TimeSeriesCodec
+}
+
+
+def get_codec(payload_format: str = PAYLOAD_JSON, compression: str = COMPRESSION_NONE, **kwargs):
+    """
+    Codificador de los mensajes según las opciones payload_format y compression
+
+    :param kwargs: Opciones de la compresión: level, threshold y dictionaries (nombre de la clase de
+        registro -> fichero con el diccionario)
+    """
+    try:
+        codec = CODECS[payload_format]()
+    except KeyError:
+        raise ValueError("Payload format %s not supported" % (payload_format,))
+
+    if compression and compression != COMPRESSION_NONE:
+        dictionaries = {name: load_dictionary(path) for name, path in (kwargs.pop('dictionaries', None) or {}).items()}
+        codec = CompressedCodec(codec, algorithm=compression, dictionaries=dictionaries, **kwargs)
+
+    return codec
+
+
+def decode_header(payload: bytes) -> tuple:
+    """ :return: Tupla (esquema, número de registros) de un mensaje binario o de series temporales """
+    _, schema_id, version, count = BINARY_HEADER.unpack_from(payload, 0)
+    schema = find_schema(schema_id)
+    if version != schema.version:
+        raise ValueError("Binary schema %s version %s not supported, expected %s" %
+                         (schema_id, version, schema.version))
+
+    return schema, count
+
+
+def decode_binary(payload: bytes) -> List[Dict]:
+    schema, count = decode_header(payload)
+    items, offset = [], BINARY_HEADER.size
+    for _ in range(count):
+        data, offset = schema.decode(payload, offset)
+        items.append(data)
+
+    return items
+
+
+def decode_timeseries(payload: bytes) -> List[Dict]:
+    schema, count = decode_header(payload)
+    return decode_series(schema.columns, WIRE_TYPES, payload, BINARY_HEADER.size, count)
+
+
+def decode_compressed(payload: bytes) -> List[Dict]:
+    return decode_payload(decompress(payload))
+
+
+# Decodificación de cada formato por su primer byte
+DECODERS = {
+    BINARY_MAGIC: decode_binary,
+    TIMESERIES_MAGIC: decode_timeseries,
+    COMPRESSED_MAGIC: decode_compressed
+}
+
+
+def decode_payload(payload: Union[bytes, str]) -> List[Dict]:
+    """
+    Decodifica un mensaje publicado por la boya, en cualquiera de los formatos
+
+    :param payload: Contenido del mensaje MQTT
+    :return: Lista de registros, como diccionarios con los mismos campos que el JSON
+    """
+    if isinstance(payload, str):
+        payload = payload.encode('utf-8')
+
+    if payload[:1] in (b'{', b'['):
+        data = json.loads(payload.decode('utf-8'))
+        return data if isinstance(data, list) else [data]
+
+    decoder = DECODERS.get(payload[0])
+    if decoder is None:
+        raise ValueError("Unknown payload format 0x%02X" % (payload[0],))
+
+    return decoder(payload)
@@ -0,0 +1,225 @@
+# -*- coding: utf-8 -*-
+
+"""
+Codificación por columnas de series temporales, en el estilo de Gorilla: cada valor se escribe como la
+diferencia con el anterior de su columna, con los bits justos.
+"""
+
+import struct
+from typing import Dict, List, Tuple
+
+from buoy.client.device.common.item import BaseItem
+
+FLOAT32 = struct.Struct('>f')
+FLOAT64 = struct.Struct('>d')
+UINT32 = struct.Struct('>I')
+UINT64 = struct.Struct('>Q')
+
+# Delta de la delta de los enteros: (prefijo, bits del prefijo, bits del valor). El último cubre el resto
+INT_BUCKETS = ((0b10, 2, 7), (0b110, 3, 9), (0b1110, 4, 12))
+
+
+class BitWriter(object):
+    def __init__(self):
+        self._out = bytearray()
+        self._acc = 0
+        self._bits = 0
+
+    def write(self, value: int, bits: int):
+        self._acc = (self._acc << bits) | (value & ((1 << bits) - 1))
+        self._bits += bits
+        while self._bits >= 8:
+            self._bits -= 8
+            self._out.append((self._acc >> self._bits) & 0xFF)
+        self._acc &= (1 << self._bits) - 1
+
+    def to_bytes(self) -> bytes:
+        if self._bits:
+            return bytes(self._out) + bytes([(self._acc << (8 - self._bits)) & 0xFF])
+
+        return bytes(self._out)
+
+
+class BitReader(object):
+    def __init__(self, data: bytes, offset: int = 0):
+        self._data = data
+        self._position = offset
+        self._acc = 0
+        self._bits = 0
+
+    def read(self, bits: int) -> int:
+        while self._bits < bits:
+            if self._position >= len(self._data):
+                raise ValueError("Truncated time series payload")
+            self._acc = (self._acc << 8) | self._data[self._position]
+            self._position += 1
+            self._bits += 8
+
+        self._bits -= bits
+        value = self._acc >> self._bits
+        self._acc &= (1 << self._bits) - 1
+
+        return value
+
+
+def _signed(value: int, bits: int) -> int:
+    return value - (1 << bits) if value >= 1 << (bits - 1) else value
+
+
+class IntColumn(object):
+    """ Enteros (identificadores, fechas en milisegundos): delta de la delta, como las fechas de Gorilla """
+
+    def __init__(self):
+        self.previous = 0
+        self.delta = 0
+
+    def write(self, out: BitWriter, value: int):
+        delta = value - self.previous
+        dod = delta - self.delta
+        self.previous, self.delta = value, delta
+        if dod == 0:
+            out.write(0, 1)
+            return
+
+        for prefix, prefix_bits, bits in INT_BUCKETS:
+            if -(1 << (bits - 1)) <= dod < 1 << (bits - 1):
+                out.write(prefix, prefix_bits)
+                out.write(dod, bits)
+                return
+
+        out.write(0b1111, 4)
+        out.write(dod, 64)
+
+    def read(self, bits_in: BitReader) -> int:
+        if bits_in.read(1):
+            dod = None
+            for prefix, prefix_bits, bits in INT_BUCKETS:
+                if not bits_in.read(1):
+                    dod = _signed(bits_in.read(bits), bits)
+                    break
+            if dod is None:
+                dod = _signed(bits_in.read(64), 64)
+            self.delta += dod
+
+        self.previous += self.delta
+        return self.previous
+
+
+class FloatColumn(object):
+    """
+    Números en coma flotante: XOR con el valor anterior, como los valores de Gorilla. Si el valor no cambia
+    se escribe un bit; si los bits significativos caben en la ventana anterior, solo esos bits.
+    """
+
+    def __init__(self, width: int):
+        self.width = width
+        self.packer = FLOAT32 if width == 32 else FLOAT64
+        self.unpacker = UINT32 if width == 32 else UINT64
+        self.length_bits = 5 if width == 32 else 6
+        self.previous = 0
+        self.leading = None
+        self.trailing = None
+
+    def write(self, out: BitWriter, value: float):
+        bits, = self.unpacker.unpack(self.packer.pack(value))
+        xor = bits ^ self.previous
+        self.previous = bits
+        if xor == 0:
+            out.write(0, 1)
+            return
+
+        leading = min(self.width - xor.bit_length(), 31)
+        trailing = (xor & -xor).bit_length() - 1
+        if self.leading is not None and leading >= self.leading and trailing >= self.trailing:
+            out.write(0b10, 2)
+            out.write(xor >> self.trailing, self.width - self.leading - self.trailing)
+            return
+
+        self.leading, self.trailing = leading, trailing
+        length = self.width - leading - trailing
+        out.write(0b11, 2)
+        out.write(leading, 5)
+        out.write(length - 1, self.length_bits)
+        out.write(xor >> trailing, length)
+
+    def read(self, bits_in: BitReader) -> float:
+        if bits_in.read(1):
+            if bits_in.read(1):
+                self.leading = bits_in.read(5)
+                length = bits_in.read(self.length_bits) + 1
+                self.trailing = self.width - self.leading - length
+            length = self.width - self.leading - self.trailing
+            self.previous ^= bits_in.read(length) << self.trailing
+
+        value, = self.packer.unpack(self.unpacker.pack(self.previous))
+        return value
+
+
+class CharColumn(object):
+    """ Caracteres: un bit si se repite el anterior """
+
+    def __init__(self):
+        self.previous = None
+
+    def write(self, out: BitWriter, value: bytes):
+        if value == self.previous:
+            out.write(0, 1)
+        else:
+            out.write(1, 1)
+            out.write(value[0], 8)
+        self.previous = value
+
+    def read(self, bits_in: BitReader) -> bytes:
+        if bits_in.read(1):
+            self.previous = bytes([bits_in.read(8)])
+        return self.previous
+
+
+def create_column(code: str):
+    if code in ('f', 'd'):
+        return FloatColumn(32 if code == 'f' else 64)
+    elif code == 'c':
+        return CharColumn()
+
+    return IntColumn()
+
+
+def encode_series(columns: List[Tuple[str, str]], wire_types: dict, items: List[BaseItem]) -> bytes:
+    """
+    Codifica los registros por columnas: para cada campo, un bit de presencia por registro y el valor,
+    relativo al del registro anterior
+
+    :param columns: Campos y su tipo, en el orden del esquema
+    :param wire_types: Tipo de campo -> (formato struct, codificación, decodificación)
+    """
+    out = BitWriter()
+    for name, code in columns:
+        encode = wire_types[code][1]
+        column = create_column(code)
+        for item in items:
+            value = getattr(item, name)
+            if value is not None:
+                value = encode(value)
+            if value is None:
+                out.write(0, 1)
+            else:
+                out.write(1, 1)
+                column.write(out, value)
+
+    return out.to_bytes()
+
+
+def decode_series(columns: List[Tuple[str, str]], wire_types: dict, payload: bytes, offset: int,
+                  count: int) -> List[Dict]:
+    """ Decodifica count registros codificados con encode_series a partir de offset """
+    bits_in = BitReader(payload, offset)
+    items = [{} for _ in range(count)]
+    for name, code in columns:
+        decode = wire_types[code][2]
+        column = create_column(code)
+        for data in items:
+            if bits_in.read(1):
+                value = column.read(bits_in)
+                data[name] = decode(value) if decode else value
+
+    return items
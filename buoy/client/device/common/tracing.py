@@ -0,0 +1,92 @@
+# -*- coding: utf-8 -*-
+
+"""
+Seguimiento de la latencia de cada lectura desde que llegan los bytes al puerto hasta que el broker
+confirma su publicación.
+
+Cada registro guarda en _trace el instante (time.monotonic) en el que pasa por cada etapa:
+
+    * received: llegada al puerto de los bytes que completan la línea
+    * parsed: registro creado por el parser
+    * enqueued: registro en la cola de guardado
+    * committed: registro guardado en la base de datos
+    * published: mensaje entregado al cliente MQTT
+    * acked: publicación confirmada por el broker
+
+El tiempo entre una etapa y la anterior se acumula en el histograma stage_seconds{stage=...} y el
+total en end_to_end_seconds. Con sample_rate, una fracción de las lecturas se escribe en el log con
+todas sus etapas. Los registros del backlog no se siguen, su latencia la marca el corte de conexión.
+"""
+
+import logging
+import random
+import time
+from typing import Optional
+
+from buoy.client.device.common.item import BaseItem
+from buoy.client.device.common.metrics import MetricsRegistry
+
+logger = logging.getLogger(__name__)
+
+STAGE_RECEIVED = 0
+STAGE_PARSED = 1
+STAGE_ENQUEUED = 2
+STAGE_COMMITTED = 3
+STAGE_PUBLISHED = 4
+STAGE_ACKED = 5
+
+STAGES = ('received', 'parsed', 'enqueued', 'committed', 'published', 'acked')
+
+
+class Tracer(object):
+    """ Anota las etapas de los registros y acumula sus latencias. Deshabilitado no hace nada """
+
+    def __init__(self, metrics: MetricsRegistry = None, enabled: bool = False, sample_rate: float = 0.0):
+        self.enabled = enabled
+        self.sample_rate = sample_rate
+        self.metrics = metrics or MetricsRegistry()
+        self._stages = [self.metrics.histogram('stage_seconds', "Tiempo de cada registro desde la etapa anterior",
+                                               labels={'stage': name}) for name in STAGES[1:]]
+        self._end_to_end = self.metrics.histogram('end_to_end_seconds',
+                                                  "Tiempo desde la llegada de los datos hasta la confirmación")
+
+    def start(self, item: BaseItem, received: Optional[float] = None):
+        """ Empieza a seguir un registro recién creado por el parser """
+        if not self.enabled:
+            return
+
+        now = time.monotonic()
+        item._trace = [received or now, now, None, None, None, None]
+        self._stages[0].observe(now - item._trace[STAGE_RECEIVED])
+
+    def mark(self, item: BaseItem, stage: int):
+        """ Anota que el registro ha llegado a la etapa """
+        if not self.enabled:
+            return
+
+        trace = item._trace
+        if trace is None:
+            return
+
+        now = time.monotonic()
+        trace[stage] = now
+        previous = stage - 1
+        while trace[previous] is None:
+            previous -= 1
+        self._stages[stage - 1].observe(now - trace[previous])
+
+        if stage == STAGE_ACKED:
+            self.finish(item)
+
+    def finish(self, item: BaseItem):
+        trace = item._trace
+        item._trace = None
+        self._end_to_end.observe(trace[STAGE_ACKED] - trace[STAGE_RECEIVED])
+        if self.sample_rate and random.random() < self.sample_rate:
+            logger.info("Trace %s %s - %s", type(item).__name__, item.id, format_trace(trace))
+
+
+def format_trace(trace: list) -> str:
+    """ Etapas del registro en milisegundos desde la llegada de los datos """
+    return ', '.join('%s +%.1f ms' % (name, (instant - trace[STAGE_RECEIVED]) * 1000)
+                     for name, instant in zip(STAGES[1:], trace[1:]) if instant is not None)
@@ -5,22 +5,50 @@ import re
 from datetime import datetime, timezone
 
 from buoy.client.device.common.base import DeviceReader, DeviceWriter, ItemSendThread, Device
+from buoy.client.device.common.clock import ClockDrift, TIMESTAMP_MODES, TIMESTAMP_HOST, TIMESTAMP_DEVICE
 from buoy.client.device.currentmeter.item import ACMPlusItem
 
 logger = logging.getLogger(__name__)
 
 
 class ACMPlusReader(DeviceReader):
+    """
+    Lee las medidas del correntímetro. La fecha de cada registro depende del modo timestamp:
+        * host: hora del equipo al procesar la línea
+        * arrival: hora del equipo a la que llegaron los datos al puerto
+        * device: hora del reloj del correntímetro (en UTC)
+
+    En todos los modos se compara la hora del correntímetro con la de llegada para estimar el desfase
+    y la deriva de su reloj (clock).
+    """
+
+    DEVICE_DATE_FORMAT = "%H:%M:%S %m-%d-%Y"
+
     def __init__(self, **kwargs):
+        self.timestamp = kwargs.pop('timestamp', TIMESTAMP_HOST)
+        if self.timestamp not in TIMESTAMP_MODES:
+            raise ValueError("Timestamp mode %s not supported" % (self.timestamp,))
+        self.clock = ClockDrift(window=kwargs.pop('clock_window', 1440), interval=kwargs.pop('clock_interval', 60),
+                                max_offset=kwargs.pop('max_clock_offset', None))
         super(ACMPlusReader, self).__init__(**kwargs)
         self.pattern = ("\s*(?P<vy>-?\d{1,}.\d{1,}),\s{1,}(?P<vx>-?\d{1,}.\d{1,}),\s{1,}(?P<time>\d{2}:\d{2}:\d{2})"
                         ",\s{1,}(?P<date>\d{2}-\d{2}-\d{4}),\s{1,}(?P<waterTemperature>-?\d{1,}.\d{1,}).*")
 
+    def register_metrics(self, metrics):
+        super(ACMPlusReader, self).register_metrics(metrics)
+        clock = self.clock
+        metrics.gauge('clock_offset_seconds', "Desfase estimado del reloj del dispositivo",
+                      function=lambda: clock.offset)
+        metrics.gauge('clock_drift_ppm', "Deriva estimada del reloj del dispositivo, en partes por millón",
+                      function=lambda: clock.drift)
+        metrics.gauge('clock_jitter_seconds', "Desviación típica de los residuos del ajuste del reloj",
+                      function=lambda: clock.jitter)
+
     def parser(self, data):
         result = re.match(self.pattern, data)
         if result:
             measurement = ACMPlusItem(
-                date=datetime.now(tz=timezone.utc),
+                date=self.get_date(result.group("time"), result.group("date")),
                 vx=result.group("vx"),
                 vy=result.group("vy"),
                 water_temp=result.group("waterTemperature")
@@ -28,6 +56,28 @@ class ACMPlusReader(DeviceReader):
 
             return measurement
 
+    def get_date(self, device_time: str, device_date: str) -> datetime:
+        """ Fecha del registro según el modo timestamp, actualizando la estimación del reloj """
+        arrival = self.arrival or datetime.now(tz=timezone.utc)
+        try:
+            device = datetime.strptime(device_time + " " + device_date, self.DEVICE_DATE_FORMAT) \
+                .replace(tzinfo=timezone.utc)
+        except ValueError:
+            logger.error("Invalid device date %s %s", device_time, device_date)
+            device = None
+
+        if device:
+            self.clock.update(device, arrival)
+            logger.debug("Device clock offset %.3f s, drift %.1f ppm, jitter %.3f s",
+                         self.clock.offset, self.clock.drift, self.clock.jitter)
+
+        if self.timestamp == TIMESTAMP_HOST:
+            return datetime.now(tz=timezone.utc)
+        elif self.timestamp == TIMESTAMP_DEVICE and device:
+            return device
+
+        return arrival
+
 
 class ACMPlusWriter(DeviceWriter):
     def __init__(self, **kwargs):
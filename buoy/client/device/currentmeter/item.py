@@ -5,6 +5,10 @@ from buoy.client.device.common.item import BaseItem
 
 
 class ACMPlusItem(BaseItem):
+    __slots__ = ('_vx', '_vy', '_speed', '_direction', '_water_temp')
+
+    schema_id = 2
+
     def __init__(self, **kwargs):
         self.vx = kwargs.pop('vx', None)
         self.vy = kwargs.pop('vy', None)
@@ -18,26 +22,26 @@ class ACMPlusItem(BaseItem):
         """
         :return: The X component of the current velocity in cm/sec relative to the direction indicator arrow on the
                  velocity head of instrument
-        :rtype: Decimal
+        :rtype: float
         """
         return self._vx
 
     @vx.setter
     def vx(self, value):
-        self._vx = self._convert_string_to_decimal(value)
+        self._vx = self._convert_to_number(value)
 
     @property
     def vy(self):
         """
         :return: The Y component of the current velocity in cm/sec relative to the direction indicator arrow on the
                  velocity head of instrument
-        :rtype: Decimal
+        :rtype: float
         """
         return self._vy
 
     @vy.setter
     def vy(self, value):
-        self._vy = self._convert_string_to_decimal(value)
+        self._vy = self._convert_to_number(value)
 
     @property
     def speed(self):
@@ -48,7 +52,7 @@ class ACMPlusItem(BaseItem):
 
     @speed.setter
     def speed(self, value):
-        self._speed = self._convert_string_to_decimal(value)
+        self._speed = self._convert_to_number(value)
 
     @property
     def direction(self):
@@ -69,19 +73,19 @@ class ACMPlusItem(BaseItem):
 
     @direction.setter
     def direction(self, value):
-        self._direction = self._convert_string_to_decimal(value)
+        self._direction = self._convert_to_number(value)
 
     @property
     def water_temp(self):
         """
         :return: The water temperature in °C
-        :rtype: Decimal
+        :rtype: float
         """
         return self._water_temp
 
     @water_temp.setter
     def water_temp(self, value):
-        self._water_temp = self._convert_string_to_decimal(value)
+        self._water_temp = self._convert_to_number(value)
 
     def is_fulled(self):
         return self._vx and self._vy
@@ -3,25 +3,32 @@
 import logging
 from datetime import datetime, timezone
 
-import pynmea2
-
 from buoy.client.device.common.base import Device, DeviceReader
-from buoy.client.device.common.nmea0183 import WIMDA
+from buoy.client.device.common.nmea0183 import parse_sentence
+from buoy.client.device.weatherstation.sentences import get_sentences
 
 logger = logging.getLogger(__name__)
 
 
 class PB200Reader(DeviceReader):
+    """
+    Lee las sentencias NMEA 0183 de la estación meteorológica. Cada sentencia configurada se despacha
+    a su clase de registro por el identificador; el resto se descarta sin separar sus campos.
+    Las líneas llegan sin decodificar para validar la suma de control sobre los bytes recibidos.
+    """
+
+    decode_lines = False
+
     def __init__(self, **kwargs):
+        # Identificador de sentencia -> clase del registro, por defecto todas las registradas
+        self.sentences = get_sentences(kwargs.pop('sentences', None))
         super(PB200Reader, self).__init__(**kwargs)
 
     def parser(self, data):
-        try:
-            item = pynmea2.parse(data)
-            if item.sentence_type == 'MDA':
-                return WIMDA.from_nmea(datetime.now(tz=timezone.utc), item)
-        except pynmea2.nmea.ParseError as e:
-            logger.debug(e)
+        sentence = parse_sentence(data, sentences=self.sentences)
+        if sentence:
+            identifier, values = sentence
+            return self.sentences[identifier].from_sentence(datetime.now(tz=timezone.utc), values)
 
 
 class PB200(Device):
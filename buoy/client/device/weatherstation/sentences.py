@@ -0,0 +1,54 @@
+# -*- coding: utf-8 -*-
+
+from typing import Dict, Iterable
+
+from buoy.client.device.common.nmea0183 import WIMDA, WIMWV, YXXDR, HCHDG, GPGGA, GPVTG
+
+# Sentencias NMEA 0183 de la estación meteorológica que se procesan: identificador -> clase del registro
+SENTENCES = {
+    'WIMDA': WIMDA,
+    'WIMWV': WIMWV,
+    'YXXDR': YXXDR,
+    'HCHDG': HCHDG,
+    'GPGGA': GPGGA,
+    'GPVTG': GPVTG
+}
+
+# Tabla de la base de datos en la que se guarda cada tipo de registro
+TABLES = {
+    WIMDA: 'pb200',
+    WIMWV: 'pb200_wind',
+    YXXDR: 'pb200_attitude',
+    HCHDG: 'pb200_heading',
+    GPGGA: 'pb200_position',
+    GPVTG: 'pb200_velocity'
+}
+
+
+def register_sentence(identifier: str, cls_item: type, tablename: str):
+    """
+    Añade una nueva sentencia a la tabla de despacho. La clase debe implementar
+    from_sentence(fecha, campos)
+    """
+    SENTENCES[identifier] = cls_item
+    TABLES[cls_item] = tablename
+
+
+def get_sentences(identifiers: Iterable[str] = None) -> Dict[str, type]:
+    """
+    :param identifiers: Identificadores de las sentencias a procesar, None para todas las registradas
+    :return: Diccionario identificador -> clase del registro
+    """
+    if identifiers is None:
+        return dict(SENTENCES)
+
+    unknown = [identifier for identifier in identifiers if identifier not in SENTENCES]
+    if unknown:
+        raise ValueError("Unknown NMEA sentences: %s" % ", ".join(unknown))
+
+    return {identifier: SENTENCES[identifier] for identifier in identifiers}
+
+
+def get_tables(identifiers: Iterable[str] = None) -> Dict[type, str]:
+    """ :return: Diccionario clase del registro -> tabla, de las sentencias a procesar """
+    return {cls_item: TABLES[cls_item] for cls_item in get_sentences(identifiers).values()}
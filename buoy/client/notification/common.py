@@ -3,9 +3,11 @@
 import json
 import logging
 import re
+from datetime import datetime
+from decimal import Decimal
 from enum import IntEnum, unique
 
-from buoy.client.device.common.item import BaseItem, DataEncoder
+from buoy.client.device.common.item import BaseItem
 from buoy.client.device.common.nmea0183 import WIMDA
 from buoy.client.device.currentmeter.item import ACMPlusItem
 from buoy.client.notification.exceptions import ValidationError
@@ -27,6 +29,8 @@ class NotificationLevel(IntEnum):
 
 
 class NoticeBase(BaseItem):
+    __slots__ = ('_level', '_daemon', '_type')
+
     def __init__(self, notice_type: NoticeType, **kwargs):
         self.level = kwargs.pop('level', NotificationLevel.NORMAL)
         self.daemon = kwargs.pop('daemon', None)
@@ -72,13 +76,41 @@ class NoticeBase(BaseItem):
         self._daemon = value
 
     def to_json(self):
-        return json.dumps(self, sort_keys=True, cls=DataEncoder)
+        """
+        Formato de los avisos: claves ordenadas con los separadores por defecto de json.dumps. Solo se
+        incluyen las fechas, los decimales y los valores de tipo int o str exactos, como hacía el DataEncoder
+        reflexivo; el resto (None, enumerados, booleanos...) se omite. Los registros anidados usan to_dict
+        """
+        data = {}
+        for name, value in self:
+            value = notice_value(value)
+            if value is not None:
+                data[name] = value
+
+        return json.dumps(data, sort_keys=True)
 
     def __str__(self):
         return "{datetime} - {level} - {type}".format(**dict(self))
 
 
+def notice_value(value):
+    """ Valor JSON de un campo de un aviso, None si el campo no se incluye """
+    datatype = type(value)
+    if datatype is datetime:
+        return value.isoformat(timespec='milliseconds')
+    if datatype is Decimal:
+        return round(float(value), 3)
+    if datatype is int or datatype is str:
+        return value
+    if isinstance(value, BaseItem):
+        return value.to_dict()
+
+    return None
+
+
 class NoticeData(NoticeBase):
+    __slots__ = ('_data', '_device')
+
     def __init__(self, **kwargs):
         self.data = kwargs.pop('data', None)
         self.device = kwargs.pop('device', None)
@@ -116,6 +148,8 @@ class NoticeData(NoticeBase):
 
 
 class Notification(NoticeBase):
+    __slots__ = ('_phone', '_message')
+
     def __init__(self, message: str, **kwargs):
         self.phone = kwargs.pop('phone', None)
         super(Notification, self).__init__(notice_type=NoticeType.NOTIFICATION, **kwargs)
@@ -20,6 +20,11 @@ def get_config(device_name, buoy_config):
     return serial_config, mqtt_config, db_config, service_config
 
 
+def get_device_options(device_name, buoy_config, section):
+    """ Retorna una sección opcional de la configuración del dispositivo o un diccionario vacío """
+    return buoy_config['device'][device_name].get(section) or {}
+
+
 class DaemonException(Exception):
     pass
 
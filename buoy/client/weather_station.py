@@ -5,10 +5,13 @@ import logging.config
 
 import buoy.client.utils.argsparse as args_parse
 import buoy.client.utils.config as load_config
+from buoy.client.device.common.base import RUNTIME_THREADS
 from buoy.client.device.common.database import DeviceDB
+from buoy.client.device.common.item import set_numeric_backend, NUMERIC_FLOAT
 from buoy.client.device.common.nmea0183 import WIMDA
 from buoy.client.device.weatherstation.pb200 import PB200
-from buoy.client.service.daemon import Daemon, get_config
+from buoy.client.device.weatherstation.sentences import get_tables
+from buoy.client.service.daemon import Daemon, get_config, get_device_options
 
 DEVICE_NAME = 'PB200'
 DAEMON_NAME = 'weather-station'
@@ -17,10 +20,18 @@ DAEMON_NAME = 'weather-station'
 class WeatherStationDaemon(PB200, Daemon):
     def __init__(self, name, buoy_config):
         serial_config, mqtt_config, db_config, service_config = get_config(name, buoy_config=buoy_config)
-        db = DeviceDB(db_config=db_config, db_tablename=name, cls_item=WIMDA)
+        set_numeric_backend(buoy_config['device'][name].get('numeric', NUMERIC_FLOAT))
+        reader_config = get_device_options(name, buoy_config, 'reader')
+        db = DeviceDB(db_config=db_config, db_tablename=name, cls_item=WIMDA,
+                      tables=get_tables(reader_config.get('sentences')))
 
         Daemon.__init__(self, daemon_name=DAEMON_NAME, daemon_config=service_config)
-        PB200.__init__(self, serial_config=serial_config, db=db, mqtt=mqtt_config)
+        PB200.__init__(self, serial_config=serial_config, db=db, mqtt=mqtt_config,
+                       reader=reader_config,
+                       save=get_device_options(name, buoy_config, 'save'),
+                       metrics=get_device_options(name, buoy_config, 'metrics'),
+                       tracing=get_device_options(name, buoy_config, 'tracing'),
+                       runtime=buoy_config['device'][name].get('runtime', RUNTIME_THREADS))
 
     def before_stop(self):
         self.disconnect()
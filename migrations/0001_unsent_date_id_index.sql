@@ -0,0 +1,9 @@
+-- Índice parcial sobre los registros pendientes de envío, usado por la paginación (date, id)
+-- de DeviceDB.get_items_to_send. Solo contiene las filas con sended = false, por lo que su tamaño
+-- depende de los datos sin enviar y no del histórico completo.
+--
+--     psql boyadb -f migrations/0001_unsent_date_id_index.sql
+
+CREATE INDEX CONCURRENTLY IF NOT EXISTS acmplus_unsent_date_id_idx ON acmplus (date, id) WHERE sended IS false;
+
+CREATE INDEX CONCURRENTLY IF NOT EXISTS pb200_unsent_date_id_idx ON pb200 (date, id) WHERE sended IS false;
@@ -72,8 +72,8 @@ setup(
     # requirements files see:
     # https://packaging.python.org/en/latest/requirements.html
     install_requires=['requests', 'pypandoc', 'pyyaml', 'pyserial',
-                      'pynmea2', 'configparser', 'pyyaml', 'mypy',
-                      'jsonpickle', 'python-dateutil', 'paho-mqtt',
+                      'configparser', 'pyyaml', 'mypy',
+                      'jsonpickle', 'python-dateutil', 'paho-mqtt>=1.5',
                       'psycopg2'],
     setup_requires=['pytest-runner', 'wheel'],
 
@@ -12,6 +12,8 @@ CREATE TABLE acmplus (
     num_attempts SMALLINT default 0
 );
 
+CREATE INDEX acmplus_unsent_date_id_idx ON acmplus (date, id) WHERE sended IS false;
+
 DROP TABLE IF EXISTS pb200;
 
 CREATE TABLE pb200 (
@@ -32,6 +34,82 @@ CREATE TABLE pb200 (
     num_attempts SMALLINT default 0
 );
 
+CREATE INDEX pb200_unsent_date_id_idx ON pb200 (date, id) WHERE sended IS false;
+
+DROP TABLE IF EXISTS pb200_wind;
+
+CREATE TABLE pb200_wind (
+    id BIGSERIAL PRIMARY KEY,
+    date TIMESTAMP WITH TIME ZONE NOT NULL,
+    wind_angle double precision,
+    reference CHAR(1),
+    wind_speed double precision,
+    speed_unit CHAR(1),
+    sended BOOLEAN default false,
+    num_attempts SMALLINT default 0
+);
+
+CREATE INDEX pb200_wind_unsent_date_id_idx ON pb200_wind (date, id) WHERE sended IS false;
+
+DROP TABLE IF EXISTS pb200_attitude;
+
+CREATE TABLE pb200_attitude (
+    id BIGSERIAL PRIMARY KEY,
+    date TIMESTAMP WITH TIME ZONE NOT NULL,
+    pitch double precision,
+    roll double precision,
+    sended BOOLEAN default false,
+    num_attempts SMALLINT default 0
+);
+
+CREATE INDEX pb200_attitude_unsent_date_id_idx ON pb200_attitude (date, id) WHERE sended IS false;
+
+DROP TABLE IF EXISTS pb200_heading;
+
+CREATE TABLE pb200_heading (
+    id BIGSERIAL PRIMARY KEY,
+    date TIMESTAMP WITH TIME ZONE NOT NULL,
+    heading double precision,
+    deviation double precision,
+    variation double precision,
+    sended BOOLEAN default false,
+    num_attempts SMALLINT default 0
+);
+
+CREATE INDEX pb200_heading_unsent_date_id_idx ON pb200_heading (date, id) WHERE sended IS false;
+
+DROP TABLE IF EXISTS pb200_position;
+
+CREATE TABLE pb200_position (
+    id BIGSERIAL PRIMARY KEY,
+    date TIMESTAMP WITH TIME ZONE NOT NULL,
+    latitude double precision,
+    longitude double precision,
+    fix_quality SMALLINT,
+    num_satellites SMALLINT,
+    hdop double precision,
+    altitude double precision,
+    sended BOOLEAN default false,
+    num_attempts SMALLINT default 0
+);
+
+CREATE INDEX pb200_position_unsent_date_id_idx ON pb200_position (date, id) WHERE sended IS false;
+
+DROP TABLE IF EXISTS pb200_velocity;
+
+CREATE TABLE pb200_velocity (
+    id BIGSERIAL PRIMARY KEY,
+    date TIMESTAMP WITH TIME ZONE NOT NULL,
+    course_true double precision,
+    course_magnetic double precision,
+    speed_knots double precision,
+    speed_kmh double precision,
+    sended BOOLEAN default false,
+    num_attempts SMALLINT default 0
+);
+
+CREATE INDEX pb200_velocity_unsent_date_id_idx ON pb200_velocity (date, id) WHERE sended IS false;
+
 CREATE OR REPLACE FUNCTION increment_num_attempts()
     RETURNS trigger AS
 $BODY$
@@ -52,4 +130,35 @@ CREATE TRIGGER acmplus_increment_num_attemps_before_update
 	BEFORE UPDATE
 	ON acmplus
 	FOR EACH ROW
+	EXECUTE PROCEDURE increment_num_attempts();
+
+
+CREATE TRIGGER pb200_wind_increment_num_attemps_before_update
+	BEFORE UPDATE
+	ON pb200_wind
+	FOR EACH ROW
+	EXECUTE PROCEDURE increment_num_attempts();
+
+CREATE TRIGGER pb200_attitude_increment_num_attemps_before_update
+	BEFORE UPDATE
+	ON pb200_attitude
+	FOR EACH ROW
+	EXECUTE PROCEDURE increment_num_attempts();
+
+CREATE TRIGGER pb200_heading_increment_num_attemps_before_update
+	BEFORE UPDATE
+	ON pb200_heading
+	FOR EACH ROW
+	EXECUTE PROCEDURE increment_num_attempts();
+
+CREATE TRIGGER pb200_position_increment_num_attemps_before_update
+	BEFORE UPDATE
+	ON pb200_position
+	FOR EACH ROW
+	EXECUTE PROCEDURE increment_num_attempts();
+
+CREATE TRIGGER pb200_velocity_increment_num_attemps_before_update
+	BEFORE UPDATE
+	ON pb200_velocity
+	FOR EACH ROW
 	EXECUTE PROCEDURE increment_num_attempts();
\ No newline at end of file
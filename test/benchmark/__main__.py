@@ -0,0 +1,71 @@
+"""
+Ejecuta la suite de benchmarks, guarda los resultados en JSON y los compara con un baseline.
+
+    python -m test.benchmark --output results.json
+    python -m test.benchmark --only parsers,pipeline --baseline baseline.json
+
+Con --baseline el proceso termina con código 1 si algún resultado empeora más que el umbral.
+"""
+import argparse
+import importlib
+import logging
+import sys
+from typing import List
+
+from test.benchmark.suite import DEFAULT_THRESHOLD, compare, load_report, save_report, to_report
+
+BENCHMARKS = ('parsers', 'nmea', 'serializer', 'line_buffer', 'timeseries', 'metrics', 'db', 'pipeline', 'mqtt')
+
+
+def parse_args(args: List[str] = None):
+    parser = argparse.ArgumentParser(prog='python -m test.benchmark', description="Benchmarks offline del cliente")
+    parser.add_argument('--only', help="Benchmarks a ejecutar separados por comas (%s)" % ','.join(BENCHMARKS))
+    parser.add_argument('--output', help="Fichero JSON en el que guardar los resultados")
+    parser.add_argument('--baseline', help="Fichero JSON con los resultados de referencia")
+    parser.add_argument('--threshold', type=float, default=DEFAULT_THRESHOLD,
+                        help="Variación relativa a partir de la cual se considera regresión")
+
+    return parser.parse_args(args)
+
+
+def run(names) -> list:
+    results = []
+    for name in names:
+        module = importlib.import_module('test.benchmark.bench_' + name)
+        print("Running %s..." % (name,), file=sys.stderr)
+        collected = module.collect()
+        if not collected:
+            print("No results from %s" % (name,), file=sys.stderr)
+        results.extend(collected)
+
+    return results
+
+
+def main(args: List[str] = None) -> int:
+    logging.basicConfig(level=logging.ERROR)
+    options = parse_args(args)
+    names = options.only.split(',') if options.only else BENCHMARKS
+    unknown = set(names) - set(BENCHMARKS)
+    if unknown:
+        print("Unknown benchmarks: %s" % ','.join(sorted(unknown)), file=sys.stderr)
+        return 2
+
+    report = to_report(run(names))
+    if options.output:
+        save_report(report, options.output)
+
+    if not options.baseline:
+        for name, result in sorted(report['results'].items()):
+            print("{name:45s} {value:14.1f} {unit}".format(name=name, **result))
+        return 0
+
+    rows = compare(report, load_report(options.baseline), threshold=options.threshold)
+    for row in rows:
+        print("{name:45s} {value:14.1f} {baseline:14.1f} {unit:8s} {change:+7.1%} {flag}".format(
+            flag='REGRESSION' if row['regression'] else '', **row))
+
+    return 1 if any(row['regression'] for row in rows) else 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
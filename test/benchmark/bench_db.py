@@ -0,0 +1,93 @@
+"""
+Mide DeviceDB contra un Postgres local temporal (testing.postgresql, necesita initdb en el PATH):
+inserciones de una en una (save) y en lotes (save_many), y lectura por páginas de los pendientes de
+envío (get_items_to_send) de los más antiguos y de los más recientes.
+
+Si no se puede arrancar Postgres el benchmark no retorna resultados.
+
+    python -m test.benchmark.bench_db
+"""
+import logging
+import time
+from datetime import datetime, timezone, timedelta
+from typing import List
+
+from buoy.client.device.common.database import DeviceDB
+from buoy.client.device.currentmeter.item import ACMPlusItem
+from test.benchmark.suite import Result, rate
+
+NUM_ITEMS = 5000
+BATCH_SIZE = 50
+PAGE_SIZE = 100
+
+logger = logging.getLogger(__name__)
+
+
+def create_items(num: int = NUM_ITEMS) -> List[ACMPlusItem]:
+    # Fechas pasadas, get_items_to_send descarta los registros de los últimos 30 segundos
+    start = datetime.now(tz=timezone.utc) - timedelta(days=1)
+    return [ACMPlusItem(date=start + timedelta(seconds=i), vx='-0.61', vy='-73.51', water_temp='24.37')
+            for i in range(num)]
+
+
+def run_save(db: DeviceDB) -> float:
+    items = create_items(NUM_ITEMS // 5)
+    start = time.perf_counter()
+    for item in items:
+        db.save(item)
+
+    return len(items) / (time.perf_counter() - start)
+
+
+def run_save_many(db: DeviceDB) -> float:
+    items = create_items()
+    start = time.perf_counter()
+    for i in range(0, len(items), BATCH_SIZE):
+        db.save_many(items[i:i + BATCH_SIZE])
+
+    return len(items) / (time.perf_counter() - start)
+
+
+def run_pages(fetch) -> float:
+    """ :return: Registros por segundo leyendo todas las páginas """
+    num = 0
+    start = time.perf_counter()
+    page = fetch(size=PAGE_SIZE)
+    while page:
+        num += len(page)
+        page = fetch(size=PAGE_SIZE, after=(page[-1].date, page[-1].id))
+
+    return num / (time.perf_counter() - start)
+
+
+def collect() -> List[Result]:
+    try:
+        from test.support.function.database import prepare_db, close_db
+        db_config = prepare_db()
+    except Exception as ex:
+        logger.warning("Skip database benchmark, local Postgres not available - %s", ex)
+        return []
+
+    db = DeviceDB(db_config=db_config, db_tablename='acmplus', cls_item=ACMPlusItem)
+    try:
+        return [
+            rate('db.save', run_save(db), 'items/s'),
+            rate('db.save_many', run_save_many(db), 'items/s'),
+            rate('db.get_items_to_send', run_pages(db.get_items_to_send), 'items/s'),
+            rate('db.get_newest_items_to_send', run_pages(db.get_newest_items_to_send), 'items/s')
+        ]
+    finally:
+        db.close()
+        close_db()
+
+
+def main(args: List[str] = None):
+    results = collect()
+    if not results:
+        print("Local Postgres not available")
+    for result in results:
+        print("{name:30s} {value:10.0f} {unit}".format(**result._asdict()))
+
+
+if __name__ == '__main__':
+    main()
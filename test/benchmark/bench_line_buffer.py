@@ -0,0 +1,113 @@
+"""
+Compara el buffer de bytes de DeviceReader con la concatenación de cadenas anterior,
+leyendo un flujo del ACMPlus a través de SerialMock.
+
+    python -m test.benchmark.bench_line_buffer
+"""
+import time
+import tracemalloc
+from queue import Queue
+from typing import List
+
+from buoy.client.device.common.base import DeviceReader
+from test.benchmark.suite import Result, rate, cost
+from test.support.mock.SerialMock import SerialMock
+
+LINE = b"  -0.61,  -73.51, 10:18:48, 11-29-2017,  24.37\r\n"
+NUM_LINES = 20000
+
+
+class ReaderBench(DeviceReader):
+    def __init__(self, **kwargs):
+        super(ReaderBench, self).__init__(**kwargs)
+        self.num_lines = 0
+
+    def parser(self, data):
+        self.num_lines += 1
+
+
+class LegacyReaderBench(ReaderBench):
+    """ Implementación anterior: decodifica cada lectura y concatena cadenas """
+
+    def __init__(self, **kwargs):
+        super(LegacyReaderBench, self).__init__(**kwargs)
+        self.legacy_buffer = ''
+
+    def read_data(self):
+        self.legacy_buffer += self.device.read(self.device.in_waiting).decode()
+
+    def is_buffer_empty(self):
+        return self.char_splitter not in self.legacy_buffer
+
+    def process_data(self):
+        buffer = self.legacy_buffer.rsplit(self.char_splitter, 1)
+        self.legacy_buffer = buffer[1].strip()
+        for line in buffer[0].split(self.char_splitter):
+            if line.strip():
+                self.parser(line.strip())
+
+
+def serial_stream(chunk_size: int, num_lines: int = NUM_LINES):
+    """
+    Crea un SerialMock que entrega el flujo en trozos de tamaño fijo. La lectura se sustituye
+    por una función simple para no medir el registro de llamadas de MagicMock.
+    """
+    data = LINE * num_lines
+    chunks = iter([data[i:i + chunk_size] for i in range(0, len(data), chunk_size)])
+    device = SerialMock()
+    device.read = lambda size: next(chunks, b'')
+    device.in_waiting = chunk_size
+
+    return device, -(-len(data) // chunk_size)
+
+
+def consume(reader, num_reads):
+    for _ in range(num_reads):
+        reader.read_data()
+        if not reader.is_buffer_empty():
+            reader.process_data()
+
+
+def run(cls_reader, chunk_size: int) -> dict:
+    device, num_reads = serial_stream(chunk_size)
+    reader = cls_reader(device=device, queue_save_data=Queue(), queue_notice=Queue())
+    start = time.perf_counter()
+    consume(reader, num_reads)
+    elapsed = time.perf_counter() - start
+
+    device, num_reads = serial_stream(chunk_size)
+    reader_traced = cls_reader(device=device, queue_save_data=Queue(), queue_notice=Queue())
+    tracemalloc.start()
+    consume(reader_traced, num_reads)
+    _, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+
+    return {
+        'reader': cls_reader.__name__,
+        'lines': reader.num_lines,
+        'lines_per_second': reader.num_lines / elapsed,
+        'peak_bytes': peak
+    }
+
+
+def collect() -> List[Result]:
+    results = []
+    for chunk_size in (64, 2304, 16384):
+        result = run(ReaderBench, chunk_size=chunk_size)
+        results.append(rate('line_buffer.%i' % (chunk_size,), result['lines_per_second'], 'lines/s'))
+        results.append(cost('line_buffer.%i.peak' % (chunk_size,), result['peak_bytes'], 'bytes'))
+
+    return results
+
+
+def main(args: List[str] = None):
+    # 64 bytes ~ lectura del FTDI, 2304 bytes ~ 0.2 s a 115200 baudios, 16384 bytes ~ datos acumulados
+    for chunk_size in (64, 2304, 16384):
+        for cls_reader in (LegacyReaderBench, ReaderBench):
+            result = run(cls_reader, chunk_size=chunk_size)
+            print("chunk={chunk:6d} {reader:18s} lines={lines} {lines_per_second:10.0f} lines/s "
+                  "peak={peak_bytes} bytes".format(chunk=chunk_size, **result))
+
+
+if __name__ == '__main__':
+    main()
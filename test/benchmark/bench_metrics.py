@@ -0,0 +1,65 @@
+"""
+Mide el coste de registrar una métrica en el camino crítico (contador, valor instantáneo e histograma)
+frente a una llamada vacía, y el tiempo de generar el texto de Prometheus con las métricas de un dispositivo.
+
+    python -m test.benchmark.bench_metrics
+"""
+import time
+from typing import List
+
+from buoy.client.device.common.metrics import MetricsRegistry
+from test.benchmark.suite import Result, cost
+
+NUM_OPERATIONS = 1000000
+
+
+def noop(value=1):
+    pass
+
+
+def measure(function, value, num: int = NUM_OPERATIONS) -> float:
+    """ :return: Nanosegundos por llamada """
+    start = time.perf_counter()
+    for _ in range(num):
+        function(value)
+    return (time.perf_counter() - start) / num * 1e9
+
+
+def run() -> dict:
+    registry = MetricsRegistry(labels={'device': 'PB200'})
+    counter = registry.counter('lines_read')
+    gauge = registry.gauge('inflight_messages')
+    histogram = registry.histogram('publish_seconds')
+    for name in ('queue_size', 'outbox_pending', 'budget_bytes_used'):
+        registry.gauge(name, function=lambda: 0)
+
+    baseline = measure(noop, 1)
+    results = {
+        'counter.inc': measure(counter.inc, 1) - baseline,
+        'gauge.set': measure(gauge.set, 1) - baseline,
+        'histogram.observe': measure(histogram.observe, 0.012) - baseline
+    }
+
+    start = time.perf_counter()
+    for _ in range(1000):
+        registry.render()
+    results['render_us'] = (time.perf_counter() - start) / 1000 * 1e6
+
+    return results
+
+
+def collect() -> List[Result]:
+    results = run()
+    return [cost('metrics.' + name, results[name], 'ns') for name in ('counter.inc', 'gauge.set', 'histogram.observe')] \
+        + [cost('metrics.render', results['render_us'], 'us')]
+
+
+def main(args: List[str] = None):
+    results = run()
+    for name in ('counter.inc', 'gauge.set', 'histogram.observe'):
+        print("{name:18s} {ns:8.1f} ns/op (sin el coste de la llamada)".format(name=name, ns=results[name]))
+    print("{name:18s} {us:8.1f} us".format(name='render', us=results['render_us']))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,136 @@
+"""
+Mide ItemSendThread contra el broker local FakeBroker, con la configuración de envío de buoy.yaml
+(QoS 1, 20 mensajes en vuelo) y en distintas condiciones de red:
+
+    * publish_rate: registros en directo confirmados por segundo
+    * backlog_drain: segundos en vaciar el backlog de la base de datos con mensajes agrupados
+    * reconnect: segundos desde una caída de la conexión hasta volver a estar conectado
+
+    python -m test.benchmark.bench_mqtt
+"""
+import logging
+import time
+from datetime import datetime, timezone, timedelta
+from queue import Queue
+from typing import List
+from unittest.mock import patch
+
+from buoy.client.device.common.base import ItemSendThread
+from buoy.client.device.common.outbox import Outbox
+from buoy.client.device.currentmeter.item import ACMPlusItem
+from test.benchmark.bench_pipeline import MemoryDB
+from test.benchmark.suite import Result, rate, cost
+from test.support.mock.FakeBroker import FakeBroker
+
+NUM_ITEMS = 2000
+TIMEOUT = 60
+
+# Red local y red móvil: latencia de ida y vuelta, su variación y mensajes perdidos
+CONDITIONS = {
+    'local': {},
+    'cellular': {'ack_latency': 0.15, 'ack_jitter': 0.05, 'loss': 0.005}
+}
+
+SENDER_CONFIG = {
+    'qos': 1,
+    'max_inflight': 20,
+    'publish_timeout': 5,
+    'batch_max_bytes': 8192
+}
+
+
+def create_items(db: MemoryDB, num: int = NUM_ITEMS) -> List[ACMPlusItem]:
+    start = datetime.now(tz=timezone.utc) - timedelta(days=1)
+    return db.save_many([ACMPlusItem(date=start + timedelta(seconds=i), vx='-0.61', vy='-73.51', water_temp='24.37')
+                         for i in range(num)])
+
+
+def wait_until(condition, timeout: float = TIMEOUT) -> bool:
+    deadline = time.monotonic() + timeout
+    while not condition():
+        if time.monotonic() > deadline:
+            return False
+        time.sleep(0.001)
+
+    return True
+
+
+class SenderBench(object):
+    """ Broker con las condiciones de red indicadas e hilo de envío conectado a él """
+
+    def __init__(self, conditions: dict, **kwargs):
+        self.broker = FakeBroker(seed=1, **conditions)
+        self.db = MemoryDB()
+        self.kwargs = dict(SENDER_CONFIG, **kwargs)
+        self.sender = None
+        self._patch = patch('buoy.client.device.common.base.is_connected_to_internet', return_value=True)
+
+    def __enter__(self):
+        self.broker.start()
+        self._patch.start()
+        # MemoryDB retorna los pendientes al momento, sin los 30 segundos de margen de Postgres
+        self.sender = ItemSendThread(db=self.db, queue_send_data=Queue(), queue_notice=Queue(),
+                                     broker_url=self.broker.address, broker_port=self.broker.port,
+                                     outbox=Outbox(delay=0), **self.kwargs)
+        self.sender.start()
+        if not wait_until(lambda: self.sender.connected_to_mqtt, timeout=10):
+            raise RuntimeError("Sender not connected to broker")
+        # Reconciliación inicial con la base de datos vacía
+        wait_until(lambda: not self.sender.backlog.is_pending(), timeout=1)
+
+        return self
+
+    def __exit__(self, *args):
+        self.sender.stop()
+        self.sender.join(timeout=5)
+        self.sender.active = False
+        self.sender.client.loop_stop()
+        self._patch.stop()
+        self.broker.stop()
+
+    def publish_rate(self) -> float:
+        items = create_items(self.db)
+        start = time.perf_counter()
+        for item in items:
+            self.sender.queue_send_data.put(item)
+        wait_until(lambda: self.db.sent >= len(items))
+
+        return self.db.sent / (time.perf_counter() - start)
+
+    def backlog_drain(self) -> float:
+        items = create_items(self.db)
+        start = time.perf_counter()
+        self.sender.outbox.notify(len(items))
+        wait_until(lambda: self.db.sent >= len(items))
+
+        return time.perf_counter() - start
+
+    def reconnect(self) -> float:
+        start = time.perf_counter()
+        self.broker.disconnect_clients()
+        wait_until(lambda: not self.sender.connected_to_mqtt, timeout=10)
+        wait_until(lambda: self.sender.connected_to_mqtt)
+
+        return time.perf_counter() - start
+
+
+def collect() -> List[Result]:
+    results = []
+    for name, conditions in sorted(CONDITIONS.items()):
+        with SenderBench(conditions) as bench:
+            results.append(rate('mqtt.%s.publish_rate' % (name,), bench.publish_rate(), 'items/s'))
+            results.append(cost('mqtt.%s.reconnect' % (name,), bench.reconnect(), 's'))
+        with SenderBench(conditions, batch_publish=True) as bench:
+            results.append(cost('mqtt.%s.backlog_drain' % (name,), bench.backlog_drain(), 's'))
+
+    return results
+
+
+def main(args: List[str] = None):
+    logging.basicConfig(level=logging.CRITICAL)
+    for result in collect():
+        print("{name:30s} {value:10.2f} {unit}".format(**result._asdict()))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,72 @@
+"""
+Mide el analizador NMEA 0183 del PB200, solo con $WIMDA y con todas las sentencias registradas,
+sobre un flujo de ejemplo del PB200 con todas las sentencias que emite (test/support/data/pb200_stream.nmea).
+Las líneas se pasan al parser en bytes, como las recibe del puerto.
+
+    python -m test.benchmark.bench_nmea
+"""
+import time
+from queue import Queue
+from typing import List
+
+from buoy.client.device.common.nmea0183 import nmea_checksum
+from buoy.client.device.weatherstation.pb200 import PB200Reader
+from test.benchmark.suite import Result, rate
+from test.support.mock.SerialMock import SerialMock
+
+STREAM_FILE = 'test/support/data/pb200_stream.nmea'
+REPEAT = 50
+
+
+def load_stream(path: str = STREAM_FILE) -> List[bytes]:
+    with open(path, 'rb') as fh:
+        return [line.strip() for line in fh.read().split(b'\n') if line.strip()]
+
+
+def run(cls_reader, lines: List[bytes], **kwargs) -> dict:
+    reader = cls_reader(device=SerialMock(), queue_save_data=Queue(), queue_notice=Queue(), **kwargs)
+    items = 0
+    start = time.perf_counter()
+    for _ in range(REPEAT):
+        for line in lines:
+            if reader.parser(line):
+                items += 1
+    elapsed = time.perf_counter() - start
+
+    return {
+        'reader': cls_reader.__name__ + ('(%s)' % ','.join(kwargs['sentences']) if 'sentences' in kwargs else ''),
+        'items': items,
+        'lines_per_second': len(lines) * REPEAT / elapsed
+    }
+
+
+def run_checksum(checksum, lines: List[bytes]) -> float:
+    bodies = [line[1:line.find(b'*')] for line in lines]
+    start = time.perf_counter()
+    for _ in range(REPEAT):
+        for body in bodies:
+            checksum(body)
+
+    return len(bodies) * REPEAT / (time.perf_counter() - start)
+
+
+def collect() -> List[Result]:
+    lines = load_stream()
+    return [
+        rate('nmea.pb200.wimda', run(PB200Reader, lines, sentences=['WIMDA'])['lines_per_second'], 'lines/s'),
+        rate('nmea.pb200.all', run(PB200Reader, lines)['lines_per_second'], 'lines/s'),
+        rate('nmea.checksum', run_checksum(nmea_checksum, lines), 'lines/s')
+    ]
+
+
+def main(args: List[str] = None):
+    lines = load_stream()
+    # Solo $WIMDA y todas las sentencias registradas
+    for kwargs in ({'sentences': ['WIMDA']}, {}):
+        result = run(PB200Reader, lines, **kwargs)
+        print("{reader:25s} items={items:6d} {lines_per_second:10.0f} lines/s".format(**result))
+    print("checksum                  {:10.0f} lines/s".format(run_checksum(nmea_checksum, lines)))
+
+
+if __name__ == '__main__':
+    main()
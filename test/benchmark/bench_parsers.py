@@ -0,0 +1,77 @@
+"""
+Mide las líneas por segundo de los parser del ACMPlus (con cada modo de fecha) y del PB200 (flujo de
+ejemplo con todas sus sentencias), y los registros por segundo de BaseItem.to_json.
+
+    python -m test.benchmark.bench_parsers
+"""
+import time
+from datetime import datetime, timezone, timedelta
+from queue import Queue
+from typing import List
+
+from buoy.client.device.common.nmea0183 import WIMDA
+from buoy.client.device.currentmeter.acmplus import ACMPlusReader
+from buoy.client.device.currentmeter.item import ACMPlusItem
+from buoy.client.device.weatherstation.pb200 import PB200Reader
+from test.benchmark.bench_nmea import load_stream
+from test.benchmark.suite import Result, rate
+from test.support.mock.SerialMock import SerialMock
+
+NUM_LINES = 20000
+
+
+def acmplus_lines(num: int = NUM_LINES) -> List[str]:
+    start = datetime(2017, 11, 29, 10, 18, 48)
+    lines = []
+    for i in range(num):
+        date = start + timedelta(seconds=i)
+        lines.append("  -0.%02i,  -73.51, %s,  24.37" % (i % 100, date.strftime("%H:%M:%S, %m-%d-%Y")))
+
+    return lines
+
+
+def run_parser(reader, lines: List[str]) -> float:
+    start = time.perf_counter()
+    for line in lines:
+        reader.parser(line)
+
+    return len(lines) / (time.perf_counter() - start)
+
+
+def run_to_json(items) -> float:
+    start = time.perf_counter()
+    for item in items:
+        item.to_json()
+
+    return len(items) / (time.perf_counter() - start)
+
+
+def collect() -> List[Result]:
+    results = []
+    lines = acmplus_lines()
+    for timestamp in ('host', 'device'):
+        reader = ACMPlusReader(device=SerialMock(), queue_save_data=Queue(), queue_notice=Queue(), timestamp=timestamp)
+        results.append(rate('parsers.acmplus.%s' % (timestamp,), run_parser(reader, lines), 'lines/s'))
+
+    stream = load_stream() * (NUM_LINES // 100)
+    reader = PB200Reader(device=SerialMock(), queue_save_data=Queue(), queue_notice=Queue())
+    results.append(rate('parsers.pb200', run_parser(reader, stream), 'lines/s'))
+
+    date = datetime(2017, 11, 29, tzinfo=timezone.utc)
+    acmplus = [ACMPlusItem(id=i, date=date, vx='-0.61', vy='-73.51', water_temp='24.37') for i in range(NUM_LINES)]
+    wimda = [WIMDA(id=i, date=date, press_inch='30.3273', press_mbar='1027.0', air_temp='26.8', rel_humidity='12.3',
+                   dew_point='2.3', wind_dir_true='2.0', wind_dir_magnetic='128.7', wind_knots='134.6',
+                   wind_meters='0.3') for i in range(NUM_LINES)]
+    results.append(rate('parsers.to_json.acmplus', run_to_json(acmplus), 'items/s'))
+    results.append(rate('parsers.to_json.wimda', run_to_json(wimda), 'items/s'))
+
+    return results
+
+
+def main(args: List[str] = None):
+    for result in collect():
+        print("{name:28s} {value:10.0f} {unit}".format(**result._asdict()))
+
+
+if __name__ == '__main__':
+    main()
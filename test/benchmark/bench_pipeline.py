@@ -0,0 +1,198 @@
+"""
+Mide el Device completo con hilos (lectura en modo select, guardado por lotes y envío con ventana de
+mensajes en vuelo) con líneas del ACMPlus entregadas por un puerto simulado (ReplaySerial), una base
+de datos en memoria y un cliente MQTT que confirma cada publicación al momento:
+
+    * throughput: registros confirmados por segundo entregando las líneas sin límite
+    * latencia: percentiles del tiempo desde la llegada de cada línea hasta su confirmación, a la
+      cadencia indicada
+
+    python -m test.benchmark.bench_pipeline
+"""
+import time
+from datetime import datetime, timedelta
+from itertools import count
+from threading import Lock
+from typing import List
+
+from buoy.client.device.common.base import BaseThread, Device, ItemSendThread, READ_MODE_SELECT
+from buoy.client.device.common.outbox import Outbox
+from buoy.client.device.common.tracing import Tracer, STAGE_ACKED, STAGE_RECEIVED
+from buoy.client.device.currentmeter.acmplus import ACMPlusReader
+from buoy.client.device.currentmeter.item import ACMPlusItem
+from test.benchmark.suite import Result, rate, cost
+from test.support.mock.ReplaySerial import ReplaySerial
+
+NUM_LINES = 10000
+PACED_RATE = 200
+PACED_SECONDS = 3
+
+
+class MemoryDB(object):
+    """
+    Base de datos en memoria con la interfaz de DeviceDB. Los registros que no caben en la cola de
+    envío quedan pendientes y se envían desde el backlog, como con Postgres
+    """
+
+    def __init__(self):
+        self.tables = {ACMPlusItem: 'acmplus'}
+        self.classes = [ACMPlusItem]
+        self.reconnections = 0
+        self.sent = 0
+        self.pending = {}
+        self._ids = count(1)
+        self._lock = Lock()
+
+    def save(self, item):
+        with self._lock:
+            item.id = next(self._ids)
+            self.pending[item.id] = item
+        return item
+
+    def save_many(self, items):
+        return [self.save(item) for item in items]
+
+    def get_items_to_send(self, num_attemps: int = 3, size: int = 100, after=None, cls=None, newest=False):
+        with self._lock:
+            items = sorted(self.pending.values(), key=lambda item: (item.date, item.id), reverse=newest)
+        if after is not None:
+            items = [item for item in items if ((item.date, item.id) < after if newest else (item.date, item.id) > after)]
+
+        return items[:size]
+
+    def get_newest_items_to_send(self, *args, **kwargs):
+        return self.get_items_to_send(*args, newest=True, **kwargs)
+
+    def update_status(self, ids, status=True, cls=None):
+        if not status:
+            return
+        with self._lock:
+            for id in ids:
+                if self.pending.pop(id, None) is not None:
+                    self.sent += 1
+
+    def set_sent(self, id, cls=None):
+        self.update_status([id], cls=cls)
+
+    def release_connection(self):
+        pass
+
+    def set_failed(self, id, cls=None):
+        self.update_status([id], status=False, cls=cls)
+
+
+class StubMessageInfo(object):
+    def __init__(self, mid):
+        self.rc = 0
+        self.mid = mid
+
+    def wait_for_publish(self, timeout=None):
+        pass
+
+    def is_published(self):
+        return True
+
+
+class StubMQTTClient(object):
+    """ Cliente MQTT que confirma cada publicación en la misma llamada """
+
+    def __init__(self):
+        self.on_publish = None
+        self._mids = count(1)
+
+    def publish(self, topic, payload, qos=0, retain=False):
+        info = StubMessageInfo(next(self._mids))
+        if self.on_publish:
+            self.on_publish(self, None, info.mid)
+        return info
+
+    def disconnect(self):
+        pass
+
+
+class StubSendThread(ItemSendThread):
+    def __init__(self, **kwargs):
+        super(StubSendThread, self).__init__(**kwargs)
+        self.client = StubMQTTClient()
+        self.client.on_publish = self.on_publish
+        self.connected_to_mqtt = True
+
+    def stop(self):
+        BaseThread.stop(self)
+
+
+class RecordingTracer(Tracer):
+    """ Guarda la latencia total de cada registro para calcular percentiles exactos """
+
+    def __init__(self, *args, **kwargs):
+        super(RecordingTracer, self).__init__(*args, **kwargs)
+        self.latencies = []
+
+    def finish(self, item):
+        self.latencies.append(item._trace[STAGE_ACKED] - item._trace[STAGE_RECEIVED])
+        super(RecordingTracer, self).finish(item)
+
+
+def acmplus_lines(num: int):
+    start = datetime(2017, 11, 29, 10, 18, 48)
+    for i in range(num):
+        date = start + timedelta(seconds=i)
+        yield ("  -0.%02i,  -73.51, %s,  24.37\r\n" % (i % 100, date.strftime("%H:%M:%S, %m-%d-%Y"))).encode()
+
+
+def create_device() -> Device:
+    device = Device(device_name='ACMPlus', db=MemoryDB(), cls_reader=ACMPlusReader, cls_send=StubSendThread,
+                    reader={'read_mode': READ_MODE_SELECT}, save={'batch_size': 50, 'linger_ms': 20},
+                    mqtt={'max_inflight': 20, 'qos': 1})
+    device.tracer = RecordingTracer(device.metrics, enabled=True)
+    # MemoryDB retorna los pendientes al momento, sin los 30 segundos de margen de Postgres
+    device.outbox = Outbox(delay=0)
+    device._dev_connection = ReplaySerial()
+
+    return device
+
+
+def run(num_lines: int, lines_per_second: float = None, timeout: float = 120) -> dict:
+    device = create_device()
+    device._create_threads()
+    device._start_threads()
+    try:
+        start = time.perf_counter()
+        device._dev_connection.replay(acmplus_lines(num_lines), lines_per_second=lines_per_second)
+        deadline = time.monotonic() + timeout
+        while device.db.sent < num_lines and time.monotonic() < deadline:
+            time.sleep(0.005)
+        elapsed = time.perf_counter() - start
+    finally:
+        device._stop_threads()
+        for name in ('reader', 'save', 'send'):
+            getattr(device, '_thread_' + name).join(timeout=5)
+        device._dev_connection.close()
+
+    latencies = sorted(device.tracer.latencies)
+    return {
+        'sent': device.db.sent,
+        'items_per_second': device.db.sent / elapsed,
+        'p50_ms': latencies[len(latencies) // 2] * 1000 if latencies else None,
+        'p99_ms': latencies[int(len(latencies) * 0.99)] * 1000 if latencies else None
+    }
+
+
+def collect() -> List[Result]:
+    throughput = run(NUM_LINES)
+    paced = run(PACED_RATE * PACED_SECONDS, lines_per_second=PACED_RATE)
+
+    return [
+        rate('pipeline.throughput', throughput['items_per_second'], 'items/s'),
+        cost('pipeline.latency.p50', paced['p50_ms'], 'ms'),
+        cost('pipeline.latency.p99', paced['p99_ms'], 'ms')
+    ]
+
+
+def main(args: List[str] = None):
+    for result in collect():
+        print("{name:24s} {value:10.1f} {unit}".format(**result._asdict()))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,108 @@
+"""
+Compara la serialización generada por clase (BaseItem.to_json) con el DataEncoder reflexivo anterior,
+sobre 100000 registros ACMPlusItem y WIMDA. El codificador anterior solo serializa Decimal, por lo que
+se mide con registros Decimal y la serialización generada con ambos tipos numéricos.
+
+    python -m test.benchmark.bench_serializer
+"""
+import json
+import logging
+import time
+from datetime import datetime, timezone, timedelta
+from decimal import Decimal
+from typing import List
+
+from buoy.client.device.common.item import BaseItem, set_numeric_backend, NUMERIC_DECIMAL, NUMERIC_FLOAT
+from buoy.client.device.common.nmea0183 import WIMDA
+from buoy.client.device.currentmeter.item import ACMPlusItem
+from test.benchmark.suite import Result, rate
+
+NUM_ITEMS = 100000
+
+logger = logging.getLogger(__name__)
+
+
+class LegacyDataEncoder(json.JSONEncoder):
+    """ Implementación anterior: recorre dir() y decide la conversión por el tipo de cada valor """
+
+    def default(self, o):
+        serial = {}
+        for name in dir(o):
+            value = getattr(o, name)
+            datatype = type(value)
+            if datatype is datetime:
+                serial[name] = value.isoformat(timespec='milliseconds')
+            elif datatype is Decimal:
+                serial[name] = round(float(value), 3)
+            elif datatype is int:
+                serial[name] = value
+            elif datatype is str:
+                serial[name] = value
+            elif isinstance(value, BaseItem):
+                serial[name] = self.default(value)
+            elif value:
+                try:
+                    serial[name] = json.JSONEncoder.default(self, value)
+                except TypeError:
+                    logger.error("No serialize property %s with value %s" % (name, value,))
+
+        return serial
+
+
+def legacy_to_json(item: BaseItem) -> str:
+    return json.dumps(item, cls=LegacyDataEncoder, sort_keys=True, separators=(',', ':'))
+
+
+def create_items(cls, numeric: str, num: int = NUM_ITEMS) -> List[BaseItem]:
+    set_numeric_backend(numeric)
+    start = datetime(2017, 11, 29, tzinfo=timezone.utc)
+    items = []
+    for i in range(num):
+        date = start + timedelta(seconds=i)
+        if cls is ACMPlusItem:
+            item = ACMPlusItem(id=i, date=date, vx='-0.61', vy='-73.51', water_temp='24.37')
+            # La velocidad y la dirección se calculan al leerlas, con el tipo numérico activo
+            item.speed, item.direction = item.speed, item.direction
+            items.append(item)
+        else:
+            items.append(WIMDA(id=i, date=date, press_inch='30.3273', press_mbar='1027.0', air_temp='26.8',
+                               water_temp='20.1', rel_humidity='12.3', abs_humidity='21.0', dew_point='2.3',
+                               wind_dir_true='2.0', wind_dir_magnetic='128.7', wind_knots='134.6',
+                               wind_meters='0.3'))
+    set_numeric_backend(NUMERIC_FLOAT)
+
+    return items
+
+
+def run(serialize, items: List[BaseItem]) -> float:
+    start = time.perf_counter()
+    for item in items:
+        serialize(item)
+
+    return len(items) / (time.perf_counter() - start)
+
+
+def collect() -> List[Result]:
+    results = []
+    for cls in (ACMPlusItem, WIMDA):
+        for numeric in (NUMERIC_DECIMAL, NUMERIC_FLOAT):
+            results.append(rate('serializer.%s.%s' % (cls.__name__.lower(), numeric),
+                                run(cls.to_json, create_items(cls, numeric)), 'items/s'))
+
+    return results
+
+
+def main(args: List[str] = None):
+    for cls in (ACMPlusItem, WIMDA):
+        items = create_items(cls, NUMERIC_DECIMAL)
+        legacy = run(legacy_to_json, items)
+        compiled = run(cls.to_json, items)
+        compiled_float = run(cls.to_json, create_items(cls, NUMERIC_FLOAT))
+        print("{cls:12s} legacy={legacy:8.0f} items/s compiled={compiled:8.0f} items/s (x{ratio:.1f}) "
+              "compiled float={compiled_float:8.0f} items/s (x{ratio_float:.1f})".format(
+                cls=cls.__name__, legacy=legacy, compiled=compiled, ratio=compiled / legacy,
+                compiled_float=compiled_float, ratio_float=compiled_float / legacy))
+
+
+if __name__ == '__main__':
+    main()
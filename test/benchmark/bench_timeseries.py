@@ -0,0 +1,99 @@
+"""
+Compara el tamaño de los envíos agrupados en cada formato (JSON, binario y series temporales, con y sin
+compresión zlib) sobre un día de datos a 1 Hz del ACMPlus y del PB200, en grupos de 100 registros.
+
+Los datos se generan como paseos aleatorios con la resolución de cada dispositivo (semilla fija),
+a partir de los valores del flujo de ejemplo del PB200.
+
+    python -m test.benchmark.bench_timeseries
+"""
+import random
+import time
+from datetime import datetime, timezone, timedelta
+from typing import List
+
+from buoy.client.device.common.item import BaseItem
+from buoy.client.device.common.nmea0183 import WIMDA
+from buoy.client.device.common.payload import get_codec
+from buoy.client.device.currentmeter.item import ACMPlusItem
+from test.benchmark.suite import Result, rate, cost
+
+SECONDS = 24 * 3600
+BATCH_SIZE = 100
+FORMATS = ('json', 'binary', 'timeseries')
+
+
+def walk(rnd: random.Random, start: float, step: float, decimals: int, low: float, high: float):
+    value = start
+    while True:
+        value = min(max(value + rnd.uniform(-step, step), low), high)
+        yield round(value, decimals)
+
+
+def create_day(cls) -> List[BaseItem]:
+    rnd = random.Random(20171129)
+    start = datetime(2017, 11, 29, tzinfo=timezone.utc)
+    # Retraso de lectura de unos milisegundos sobre la cadencia de 1 s
+    dates = [start + timedelta(seconds=i, milliseconds=rnd.randint(0, 5)) for i in range(SECONDS)]
+    if cls is ACMPlusItem:
+        vx, vy, temp = walk(rnd, -0.61, 0.5, 2, -150, 150), walk(rnd, -73.51, 0.5, 2, -150, 150), \
+            walk(rnd, 24.37, 0.01, 2, 10, 30)
+        return [ACMPlusItem(id=i + 1, date=date, vx=next(vx), vy=next(vy), water_temp=next(temp))
+                for i, date in enumerate(dates)]
+
+    press, air, humidity, dew = walk(rnd, 30.3261, 0.0005, 4, 29, 31), walk(rnd, 26.6, 0.05, 1, 10, 40), \
+        walk(rnd, 54.1, 0.1, 1, 0, 100), walk(rnd, 16.5, 0.05, 1, 0, 30)
+    wind_dir, wind_speed = walk(rnd, 356.1, 5, 1, 0, 360), walk(rnd, 12.1, 0.5, 1, 0, 60)
+    items = []
+    for i, date in enumerate(dates):
+        inch, knots, direction = next(press), next(wind_speed), next(wind_dir)
+        items.append(WIMDA(id=i + 1, date=date, press_inch=inch, press_mbar=round(inch * 33.8639, 1),
+                           air_temp=next(air), rel_humidity=next(humidity), dew_point=next(dew), wind_dir_true=direction,
+                           wind_dir_magnetic=round((direction + 5.3) % 360, 1), wind_knots=knots,
+                           wind_meters=round(knots * 0.514444, 1)))
+
+    return items
+
+
+def run(codec, items: List[BaseItem]) -> dict:
+    size = 0
+    start = time.perf_counter()
+    for i in range(0, len(items), BATCH_SIZE):
+        group = items[i:i + BATCH_SIZE]
+        size += len(codec.join(group, [codec.record(item) for item in group]))
+    elapsed = time.perf_counter() - start
+
+    return {
+        'bytes': size,
+        'items_per_kb': len(items) * 1024 / size,
+        'items_per_second': len(items) / elapsed
+    }
+
+
+def collect() -> List[Result]:
+    results = []
+    for cls in (ACMPlusItem, WIMDA):
+        items = create_day(cls)
+        for payload_format in FORMATS:
+            for compression in ('none', 'zlib'):
+                result = run(get_codec(payload_format, compression=compression, threshold=0), items)
+                name = 'timeseries.%s.%s.%s' % (cls.__name__.lower(), payload_format, compression)
+                results.append(cost(name + '.size', result['bytes'], 'bytes'))
+                results.append(rate(name, result['items_per_second'], 'items/s'))
+
+    return results
+
+
+def main(args: List[str] = None):
+    for cls in (ACMPlusItem, WIMDA):
+        items = create_day(cls)
+        for payload_format in FORMATS:
+            for compression in ('none', 'zlib'):
+                result = run(get_codec(payload_format, compression=compression, threshold=0), items)
+                print("{cls:12s} {format:10s} {compression:4s} {bytes:10d} bytes {items_per_kb:8.1f} items/KB "
+                      "{items_per_second:8.0f} items/s".format(cls=cls.__name__, format=payload_format,
+                                                               compression=compression, **result))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,77 @@
+"""
+Resultados de los benchmarks en un formato común, para guardarlos en JSON y compararlos con una
+ejecución anterior (baseline).
+
+Cada módulo de benchmark define collect(), que retorna una lista de Result. El nombre del resultado
+es único en toda la suite, con el módulo como prefijo.
+"""
+import json
+import platform
+import sys
+from collections import namedtuple
+from datetime import datetime, timezone
+from typing import Dict, List
+
+# higher_is_better: True en las tasas (líneas/s, registros/s), False en tiempos y tamaños
+Result = namedtuple('Result', ('name', 'value', 'unit', 'higher_is_better'))
+
+# Variación relativa a partir de la cual un resultado peor que el baseline es una regresión
+DEFAULT_THRESHOLD = 0.15
+
+
+def rate(name: str, value: float, unit: str) -> Result:
+    return Result(name, value, unit, True)
+
+
+def cost(name: str, value: float, unit: str) -> Result:
+    return Result(name, value, unit, False)
+
+
+def to_report(results: List[Result]) -> dict:
+    """ Informe JSON de una ejecución, con el entorno en el que se ha medido """
+    return {
+        'date': datetime.now(tz=timezone.utc).isoformat(timespec='seconds'),
+        'python': sys.version.split()[0],
+        'platform': platform.platform(),
+        'results': {result.name: {'value': result.value, 'unit': result.unit,
+                                  'higher_is_better': result.higher_is_better} for result in results}
+    }
+
+
+def load_report(path: str) -> dict:
+    with open(path) as fh:
+        return json.load(fh)
+
+
+def save_report(report: dict, path: str):
+    with open(path, 'w') as fh:
+        json.dump(report, fh, indent=2, sort_keys=True)
+        fh.write('\n')
+
+
+def compare(report: dict, baseline: dict, threshold: float = DEFAULT_THRESHOLD) -> List[Dict]:
+    """
+    Compara los resultados comunes a ambas ejecuciones
+
+    :return: Lista con cada resultado comparado: name, value, baseline, change (variación relativa,
+        positiva si mejora) y regression
+    """
+    rows = []
+    for name, result in sorted(report['results'].items()):
+        previous = baseline.get('results', {}).get(name)
+        if not previous or not previous['value']:
+            continue
+
+        change = (result['value'] - previous['value']) / previous['value']
+        if not result['higher_is_better']:
+            change = -change
+        rows.append({
+            'name': name,
+            'value': result['value'],
+            'baseline': previous['value'],
+            'unit': result['unit'],
+            'change': change,
+            'regression': change < -threshold
+        })
+
+    return rows
@@ -0,0 +1,352 @@
+import asyncio
+import json
+import os
+import unittest
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime, timezone
+from unittest.mock import MagicMock
+
+import paho.mqtt.client as mqtt
+from nose.tools import eq_, ok_
+from psycopg2 import OperationalError
+
+from buoy.client.device.common.aio import AsyncDeviceRunner, AsyncMQTTClient, AsyncItemSender
+from buoy.client.device.common.base import Device, DeviceReader
+from buoy.client.device.common.exceptions import LostConnectionException
+from buoy.client.device.common.metrics import MetricsRegistry
+from buoy.client.device.common.payload import decode_payload, TIMESERIES_MAGIC
+from buoy.client.device.currentmeter.item import ACMPlusItem
+
+
+class DeviceReaderMock(DeviceReader):
+    def __init__(self, **kwargs):
+        super(DeviceReaderMock, self).__init__(**kwargs)
+
+    def parser(self, data):
+        return data
+
+
+class FakeDB(object):
+    def __init__(self):
+        self.saved = []
+
+    def save(self, item):
+        self.saved.append(item)
+        return item
+
+    def release_connection(self):
+        pass
+
+
+class FakeSendDB(object):
+    def __init__(self):
+        self.classes = [ACMPlusItem]
+        self.status = []
+
+    def update_status(self, ids, status=True, cls=None):
+        self.status.append((ids, status))
+
+
+class FakeAsyncMQTT(object):
+    def __init__(self, loop):
+        self.loop = loop
+        self.published = []
+
+    def publish(self, topic, payload, qos=0, retain=False):
+        self.published.append((topic, payload))
+        future = self.loop.create_future()
+        future.set_result(mqtt.MQTT_ERR_SUCCESS)
+        return future
+
+    def disconnect(self):
+        pass
+
+
+class FakeMessageInfo(object):
+    def __init__(self, mid, rc=mqtt.MQTT_ERR_SUCCESS, published=False):
+        self.mid = mid
+        self.rc = rc
+        self.published = published
+
+    def is_published(self):
+        return self.published
+
+
+class TestAsyncMQTTClient(unittest.TestCase):
+    def setUp(self):
+        self.loop = asyncio.new_event_loop()
+        self.paho = MagicMock()
+        self.client = AsyncMQTTClient(self.paho, self.loop)
+
+    def tearDown(self):
+        self.loop.close()
+
+    def test_resolveFuture_when_brokerConfirmsPublish(self):
+        self.paho.publish.return_value = FakeMessageInfo(mid=7)
+
+        future = self.client.publish("topic", "data", qos=1)
+        eq_(future.done(), False)
+
+        self.client._on_publish(self.paho, None, 7)
+
+        eq_(self.loop.run_until_complete(future), mqtt.MQTT_ERR_SUCCESS)
+
+    def test_resolveFutureWithError_when_publishFails(self):
+        self.paho.publish.return_value = FakeMessageInfo(mid=1, rc=mqtt.MQTT_ERR_NO_CONN)
+
+        future = self.client.publish("topic", "data", qos=1)
+
+        eq_(self.loop.run_until_complete(future), mqtt.MQTT_ERR_NO_CONN)
+
+    def test_resolvePendingFuturesWithError_when_connectionIsLost(self):
+        self.paho.publish.return_value = FakeMessageInfo(mid=3)
+
+        future = self.client.publish("topic", "data", qos=1)
+        self.client.fail_pending()
+
+        eq_(self.loop.run_until_complete(future), mqtt.MQTT_ERR_CONN_LOST)
+
+    def test_forgetPendingAck_when_waitForPublishTimesOut(self):
+        self.paho.publish.return_value = FakeMessageInfo(mid=5)
+
+        future = self.client.publish("topic", "data", qos=1)
+        with self.assertRaises(asyncio.TimeoutError):
+            self.loop.run_until_complete(asyncio.wait_for(future, timeout=0.01))
+
+        eq_(self.client._acks, {})
+
+
+class TestAsyncItemSender(unittest.TestCase):
+    def setUp(self):
+        self.loop = asyncio.new_event_loop()
+        self.executor = ThreadPoolExecutor(max_workers=1)
+        self.db = FakeSendDB()
+
+    def tearDown(self):
+        self.executor.shutdown(wait=True)
+        self.loop.close()
+
+    def create_sender(self, **kwargs):
+        sender = AsyncItemSender(db=self.db, queue_send_data=asyncio.Queue(), loop=self.loop,
+                                 executor=self.executor, topic_data="redmic/data", qos=1, max_inflight=5, **kwargs)
+        sender.client = FakeAsyncMQTT(self.loop)
+        sender.connected_to_mqtt = True
+        return sender
+
+    def send_batch(self, sender, items):
+        async def send():
+            await sender.send_batch(items)
+            # Con la ventana completa ya han terminado todas las publicaciones
+            for _ in range(sender.max_inflight):
+                await sender._window.acquire()
+
+        self.loop.run_until_complete(send())
+
+    def create_items(self, num):
+        date = datetime(2017, 11, 29, tzinfo=timezone.utc)
+        return [ACMPlusItem(id=i, date=date, vx='-0.61', vy='-73.51', water_temp='24.37') for i in range(num)]
+
+    def test_publishItemsInOneMessageToTopicBatch_when_batchPublishIsEnabled(self):
+        sender = self.create_sender(batch_publish=True, topic_batch="redmic/batch")
+
+        self.send_batch(sender, self.create_items(10))
+
+        eq_(len(sender.client.published), 1)
+        topic, payload = sender.client.published[0]
+        eq_(topic, "redmic/batch")
+        eq_(len(json.loads(payload)), 10)
+        eq_(self.db.status, [(list(range(10)), True)])
+        eq_(sender.item_in_queue, set())
+
+    def test_splitMessages_when_batchExceedsMaxBytes(self):
+        sender = self.create_sender(batch_publish=True, batch_max_bytes=300)
+
+        self.send_batch(sender, self.create_items(10))
+
+        ok_(len(sender.client.published) > 1)
+        ok_(all(len(payload) <= 300 for _, payload in sender.client.published))
+        eq_(sum(len(ids) for ids, status in self.db.status if status), 10)
+
+    def test_notifyOutbox_when_connectionIsLostInTheMiddleOfBatch(self):
+        sender = self.create_sender(batch_publish=True, batch_max_bytes=150)
+        sender.max_inflight = 1
+        sender._window = asyncio.Semaphore(1)
+        publish = sender.client.publish
+
+        def disconnect_and_publish(*args, **kwargs):
+            sender.connected_to_mqtt = False
+            return publish(*args, **kwargs)
+        sender.client.publish = disconnect_and_publish
+
+        self.send_batch(sender, self.create_items(3))
+
+        eq_(len(sender.client.published), 1)
+        eq_(sender.outbox.pending, 2)
+
+    def test_waitPublishingTasks_when_senderCloses(self):
+        sender = self.create_sender()
+        item = self.create_items(1)[0]
+        ack = self.loop.create_future()
+        sender.client.publish = MagicMock(return_value=ack)
+
+        async def close():
+            await sender._window.acquire()
+            sender.start_publishing(sender.publish([item], "data", "redmic/data"))
+            self.loop.call_later(0.05, ack.set_result, mqtt.MQTT_ERR_SUCCESS)
+            await sender.close()
+
+        self.loop.run_until_complete(close())
+
+        eq_(sender._publishing, set())
+        eq_(self.db.status, [([0], True)])
+
+    def test_keepWaitingLiveData_when_readingBacklogFails(self):
+        sender = self.create_sender(backlog_interval=0.01)
+        sender.backlog.next_page = MagicMock(side_effect=OperationalError("server closed the connection"))
+
+        items = self.loop.run_until_complete(sender.waiting_data())
+
+        eq_(items, [])
+        eq_(sender.backlog.next_page.call_count, 1)
+        eq_(sender.from_backlog, False)
+
+    def test_notCountMessage_when_publishFails(self):
+        metrics = MetricsRegistry()
+        sender = self.create_sender(metrics=metrics)
+        sender.client.publish = MagicMock(side_effect=ValueError())
+
+        self.loop.run_until_complete(sender.publish(self.create_items(1), "data", "redmic/data"))
+
+        ok_('buoy_messages_published_total 0\n' in metrics.render())
+        ok_('buoy_items_failed_total 1\n' in metrics.render())
+
+    def test_publishCompressedBatch_when_compressionIsConfigured(self):
+        sender = self.create_sender(batch_publish=True, topic_batch="redmic/batch", compression='zlib',
+                                    compression_threshold=0)
+
+        self.send_batch(sender, self.create_items(10))
+
+        topic, payload = sender.client.published[0]
+        eq_(topic, "redmic/batch")
+        eq_([data['id'] for data in decode_payload(payload)], list(range(10)))
+
+    def test_publishOneTimeseriesMessage_when_payloadFormatIsTimeseries(self):
+        sender = self.create_sender(batch_publish=True, topic_batch="redmic/batch", payload_format='timeseries')
+
+        self.send_batch(sender, self.create_items(10))
+
+        eq_(len(sender.client.published), 1)
+        _, payload = sender.client.published[0]
+        eq_(payload[0], TIMESERIES_MAGIC)
+        eq_([data['id'] for data in decode_payload(payload)], list(range(10)))
+
+    def test_raiseValueError_when_compressedBatchesUseTopicData(self):
+        with self.assertRaises(ValueError):
+            self.create_sender(batch_publish=True, compression='zlib')
+
+    def test_publishBudgetStateAndDeferItems_when_budgetIsExhausted(self):
+        metrics = MetricsRegistry()
+        sender = self.create_sender(metrics=metrics, budget={'max_messages': 2, 'period': 10, 'burst_seconds': 10,
+                                                             'topic': "redmic/budget"})
+        items = self.create_items(2)
+
+        sender.report_budget()
+        self.loop.run_until_complete(sender.send(items[0]))
+        self.loop.run_until_complete(sender.send(items[1]))
+
+        eq_(sender.client.published[0][0], "redmic/budget")
+        eq_(json.loads(sender.client.published[0][1])['messages_limit'], 2)
+        eq_(len(sender.client.published), 2)
+        text = metrics.render()
+        ok_('buoy_items_deferred_total 1\n' in text)
+        ok_('buoy_budget_messages_used_total 2\n' in text)
+
+
+class TestAsyncDeviceRunner(unittest.TestCase):
+    def setUp(self):
+        self.fd_read, self.fd_write = os.pipe()
+        self.serial = MagicMock()
+        self.serial.fileno.return_value = self.fd_read
+        self.serial.in_waiting = 64
+        self.serial.read.side_effect = lambda size: os.read(self.fd_read, size)
+
+        self.db = FakeDB()
+        self.device = Device(device_name="test", db=self.db, cls_reader=DeviceReaderMock, cls_send=None,
+                             runtime='asyncio')
+        self.device._dev_connection = self.serial
+        self.runner = AsyncDeviceRunner(device=self.device)
+
+    def tearDown(self):
+        os.close(self.fd_read)
+        os.close(self.fd_write)
+
+    def test_saveItemsAndQueueToSend_when_linesArriveToPort(self):
+        async def scenario():
+            main = self.runner.loop.create_task(self.runner.main())
+            await asyncio.sleep(0)
+            os.write(self.fd_write, b"hola\nadios\n")
+            first = await asyncio.wait_for(self.runner.queues['send_data'].get(), timeout=5)
+            second = await asyncio.wait_for(self.runner.queues['send_data'].get(), timeout=5)
+            main.cancel()
+            return [first, second]
+
+        items = self.runner.loop.run_until_complete(scenario())
+        self.runner.loop.close()
+
+        eq_(items, ["hola", "adios"])
+        eq_(self.db.saved, ["hola", "adios"])
+
+    def test_raiseLostConnection_when_deviceReadFails(self):
+        self.serial.read.side_effect = OSError()
+        os.write(self.fd_write, b"x")
+
+        with self.assertRaises(LostConnectionException):
+            self.runner.loop.run_until_complete(self.runner.main())
+        self.runner.loop.close()
+
+    def test_awaitCancelledTasks_when_mainEnds(self):
+        self.device.cls_writer = object
+        self.serial.read.side_effect = OSError()
+        os.write(self.fd_write, b"x")
+        finished = []
+
+        async def write():
+            try:
+                await asyncio.sleep(10)
+            finally:
+                await asyncio.sleep(0.01)
+                finished.append(True)
+        self.runner.write = write
+
+        with self.assertRaises(LostConnectionException):
+            self.runner.loop.run_until_complete(self.runner.main())
+        self.runner.loop.close()
+
+        eq_(finished, [True])
+
+    def test_writeToDevice_when_configureWritesCommand(self):
+        self.device.cls_writer = object
+        self.device.configure = lambda: self.device.write("MODE")
+
+        async def scenario():
+            main = self.runner.loop.create_task(self.runner.main())
+            while not self.serial.write.called:
+                await asyncio.sleep(0.01)
+            main.cancel()
+
+        self.runner.loop.run_until_complete(asyncio.wait_for(scenario(), timeout=5))
+        self.runner.loop.close()
+
+        self.serial.write.assert_called_with(b"MODE\r")
+
+    def test_useDeviceQueues_when_runnerCreatesQueues(self):
+        self.runner._create_queues()
+
+        eq_(self.device.queues, self.runner.queues)
+        ok = all(isinstance(queue, asyncio.Queue) for queue in self.device.queues.values())
+        eq_(ok, True)
+        self.runner.loop.close()
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,139 @@
+import datetime
+import unittest
+from unittest.mock import MagicMock, patch
+
+from nose.tools import eq_, ok_
+
+from buoy.client.device.common.database import BacklogCursor, FreshestFirstBacklog, create_backlog
+from buoy.client.device.common.nmea0183 import WIMDA
+from buoy.client.device.currentmeter.acmplus import ACMPlusItem
+
+
+def get_items(num=2):
+    items = []
+    for i in range(1, num + 1):
+        items.append(ACMPlusItem(id=i, vx=1.0, vy=2.0, date=datetime.datetime(2017, 1, 1, 0, i),
+                                 water_temp=20.0))
+    return items
+
+
+class TestBacklogCursor(unittest.TestCase):
+    def setUp(self):
+        self.db = MagicMock()
+        self.backlog = BacklogCursor(self.db, size=2, classes=[ACMPlusItem])
+
+    def test_continueAfterLastItem_when_pageIsComplete(self):
+        items = get_items(2)
+        self.db.get_items_to_send = MagicMock(return_value=items)
+
+        self.backlog.next_page()
+        self.backlog.next_page()
+
+        self.db.get_items_to_send.assert_called_with(num_attemps=3, size=2, after=(items[1].date, 2),
+                                                       cls=ACMPlusItem)
+
+    def test_returnToStart_when_pageIsIncomplete(self):
+        self.db.get_items_to_send = MagicMock(return_value=get_items(1))
+        self.backlog.after = {ACMPlusItem: (datetime.datetime(2017, 1, 1), 10)}
+
+        self.backlog.next_page()
+
+        eq_(self.backlog.after, {})
+
+    def test_skipItemsInFlight_when_getNextPage(self):
+        self.db.get_items_to_send = MagicMock(return_value=get_items(2))
+
+        items = self.backlog.next_page(skip={(ACMPlusItem, 1), (WIMDA, 2)})
+
+        eq_([item.id for item in items], [2])
+
+    def test_queryEveryTable_when_reconcileStarts(self):
+        self.backlog = BacklogCursor(self.db, size=2, classes=[ACMPlusItem, WIMDA])
+        self.db.get_items_to_send = MagicMock(return_value=[])
+
+        pages = 0
+        while self.backlog.is_pending():
+            self.backlog.next_page()
+            pages += 1
+
+        eq_(pages, 1)
+        eq_([call[1]['cls'] for call in self.db.get_items_to_send.call_args_list], [ACMPlusItem, WIMDA])
+
+    def test_mergeTablesByDate_when_newestFirst(self):
+        minute = datetime.timedelta(minutes=1)
+        start = datetime.datetime(2017, 1, 1)
+        rows = {
+            ACMPlusItem: [ACMPlusItem(id=i, vx=1.0, vy=2.0, water_temp=20.0, date=start + i * 2 * minute)
+                          for i in range(1, 4)],
+            WIMDA: [WIMDA(id=i, date=start + (i * 2 + 1) * minute) for i in range(1, 4)]
+        }
+
+        def get_newest_items_to_send(num_attemps, size, after, cls):
+            items = sorted(rows[cls], key=lambda item: (item.date, item.id), reverse=True)
+            if after:
+                items = [item for item in items if (item.date, item.id) < after]
+            return items[:size]
+
+        self.backlog = BacklogCursor(self.db, size=2, classes=[WIMDA, ACMPlusItem], newest_first=True)
+        self.db.get_newest_items_to_send = MagicMock(side_effect=get_newest_items_to_send)
+
+        pages = []
+        while self.backlog.is_pending():
+            pages.append([(type(item).__name__, item.id) for item in self.backlog.next_page()])
+
+        eq_(pages, [[('WIMDA', 3), ('ACMPlusItem', 3)], [('WIMDA', 2), ('ACMPlusItem', 2)],
+                    [('WIMDA', 1), ('ACMPlusItem', 1)]])
+
+    def test_queryNewestItems_when_newestFirst(self):
+        items = list(reversed(get_items(2)))
+        self.backlog = BacklogCursor(self.db, size=2, classes=[ACMPlusItem], newest_first=True)
+        self.db.get_newest_items_to_send = MagicMock(return_value=items)
+
+        self.backlog.next_page()
+        self.backlog.next_page()
+
+        self.db.get_newest_items_to_send.assert_called_with(num_attemps=3, size=2, after=(items[1].date, 1),
+                                                              cls=ACMPlusItem)
+        eq_(self.db.get_items_to_send.call_count, 0)
+
+
+class TestFreshestFirstBacklog(unittest.TestCase):
+    def setUp(self):
+        self.db = MagicMock()
+        self.db.get_newest_items_to_send = MagicMock(return_value=list(reversed(get_items(2))))
+        self.db.get_items_to_send = MagicMock(return_value=get_items(2))
+        self.backlog = FreshestFirstBacklog(self.db, size=2, classes=[ACMPlusItem], backfill_interval=60)
+
+    @patch('buoy.client.device.common.database.time.monotonic', return_value=1000)
+    def test_backfillOnePagePerInterval_when_drainingNewestFirst(self, mock_monotonic):
+        pages = []
+        for _ in range(4):
+            ok_(self.backlog.is_pending())
+            pages.append([item.id for item in self.backlog.next_page()])
+
+        eq_(pages, [[1, 2], [2, 1], [2, 1], [2, 1]])
+        eq_(self.db.get_items_to_send.call_count, 1)
+        eq_(self.db.get_newest_items_to_send.call_count, 3)
+
+    @patch('buoy.client.device.common.database.time.monotonic', return_value=1000)
+    def test_continueBackfill_when_newestSweepEnds(self, mock_monotonic):
+        self.db.get_newest_items_to_send = MagicMock(return_value=[])
+        self.backlog.is_pending()
+        self.backlog.next_page()
+        self.backlog.next_page()
+
+        ok_(not self.backlog.is_pending())
+        mock_monotonic.return_value = 1060
+        ok_(self.backlog.is_pending())
+        eq_([item.id for item in self.backlog.next_page()], [1, 2])
+
+    def test_createCursorByPolicy_when_drainPolicyIsConfigured(self):
+        ok_(isinstance(create_backlog(self.db, drain_policy='oldest', classes=[WIMDA]), BacklogCursor))
+        ok_(isinstance(create_backlog(self.db, drain_policy='newest', classes=[WIMDA]), FreshestFirstBacklog))
+
+    def test_raiseError_when_drainPolicyIsUnknown(self):
+        self.assertRaises(ValueError, create_backlog, self.db, drain_policy='random', classes=[WIMDA])
+
+
+if __name__ == '__main__':
+    unittest.main()
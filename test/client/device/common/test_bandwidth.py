@@ -0,0 +1,108 @@
+import os
+import tempfile
+import unittest
+from unittest.mock import patch
+
+from nose.tools import eq_, ok_
+
+from buoy.client.device.common.bandwidth import BandwidthBudget, TokenBucket, publish_size
+
+
+class TestTokenBucket(unittest.TestCase):
+    @patch('buoy.client.device.common.bandwidth.time.monotonic', return_value=0)
+    def test_refillTokens_when_timePasses(self, mock_monotonic):
+        bucket = TokenBucket(rate=2, capacity=100)
+        bucket.consume(100)
+        mock_monotonic.return_value = 10
+
+        ok_(bucket.can_consume(20))
+        ok_(not bucket.can_consume(21))
+
+
+class TestBandwidthBudget(unittest.TestCase):
+    def test_alwaysAcquire_when_budgetHasNoLimits(self):
+        budget = BandwidthBudget()
+
+        ok_(budget.unlimited)
+        ok_(budget.acquire(10 ** 9))
+        ok_(budget.backlog_allowed())
+
+    def test_denyLive_when_bytesBudgetIsExhausted(self):
+        budget = BandwidthBudget(max_bytes=1000, period=10, burst_seconds=10)
+
+        # 993 bytes de contenido más 7 de cabeceras MQTT sin topic
+        ok_(budget.acquire(993))
+        ok_(not budget.acquire(100))
+        eq_(budget.denied, {'live': 1, 'backlog': 0})
+
+    def test_keepReserveForLive_when_sendingBacklog(self):
+        budget = BandwidthBudget(max_messages=10, period=10, burst_seconds=10, backlog_reserve=0.2)
+
+        sent = 0
+        while budget.acquire(10, live=False):
+            sent += 1
+
+        eq_(sent, 8)
+        ok_(not budget.backlog_allowed())
+        ok_(budget.acquire(10))
+        ok_(budget.acquire(10))
+
+    def test_denyBacklog_when_nextMessageNotFitsOverReserve(self):
+        budget = BandwidthBudget(max_bytes=1000, period=10, burst_seconds=10, backlog_reserve=0.5)
+        budget.acquire(393, live=False)
+
+        ok_(budget.backlog_allowed())
+        ok_(budget.backlog_allowed(94))
+        ok_(not budget.backlog_allowed(95))
+        ok_(not budget.backlog_allowed(94, topic='buoy'))
+
+    def test_returnAverageSize_when_messagesWerePublished(self):
+        budget = BandwidthBudget(max_bytes=1000, period=10, burst_seconds=10)
+        eq_(budget.average_size, 0)
+
+        budget.acquire(100)
+        budget.acquire(200)
+
+        eq_(budget.average_size, 150)
+
+    def test_countTopicAndHeaders_when_publish(self):
+        budget = BandwidthBudget(max_bytes=1000, period=10, burst_seconds=10)
+
+        budget.acquire(200, topic='redmic/data')
+
+        eq_(publish_size('redmic/data', 0), 17)
+        eq_(budget.used['bytes'], 1 + 2 + 2 + len('redmic/data') + 2 + 200)
+
+    def test_keepUsage_when_budgetIsRestarted(self):
+        with tempfile.TemporaryDirectory() as path:
+            state_file = os.path.join(path, 'budget.json')
+            budget = BandwidthBudget(max_bytes=1000, period=3600, burst_seconds=3600, state_file=state_file)
+            budget.acquire(593)
+            budget.save()
+
+            restarted = BandwidthBudget(max_bytes=1000, period=3600, burst_seconds=3600, state_file=state_file)
+
+            eq_(restarted.used, {'bytes': 600, 'messages': 1})
+            eq_(restarted.period_start, budget.period_start)
+            ok_(restarted.buckets['bytes'].tokens < 401)
+
+    def test_limitBurst_when_periodIsLong(self):
+        budget = BandwidthBudget(max_bytes=30 * 86400 * 100, period=30 * 86400, burst_seconds=60)
+
+        eq_(budget.buckets['bytes'].capacity, 6000)
+
+    def test_returnUsage_when_getState(self):
+        budget = BandwidthBudget(max_bytes=1000, max_messages=10, period=10, burst_seconds=10)
+        budget.acquire(94)
+
+        state = budget.state()
+
+        eq_(state['bytes_used'], 100)
+        eq_(state['messages_used'], 1)
+        eq_(state['bytes_limit'], 1000)
+        eq_(state['messages_used_ratio'], 0.1)
+        ok_(state['bytes_available'] >= 900)
+
+
+if __name__ == '__main__':
+    unittest.main()
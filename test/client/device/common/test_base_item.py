@@ -0,0 +1,73 @@
+import unittest
+from datetime import datetime, timezone
+from decimal import Decimal
+
+from nose.tools import eq_, ok_
+
+from buoy.client.device.common.item import set_numeric_backend, NUMERIC_DECIMAL, NUMERIC_FLOAT
+from buoy.client.device.common.nmea0183 import WIMDA
+from buoy.client.device.currentmeter.item import ACMPlusItem
+from buoy.client.notification.common import Notification
+
+
+class TestBaseItem(unittest.TestCase):
+    def test_computeFieldsFromSlots_when_defineItemClass(self):
+        eq_(ACMPlusItem.fields, ('id', 'date', 'vx', 'vy', 'speed', 'direction', 'water_temp'))
+        eq_(Notification.fields, ('id', 'date', 'level', 'daemon', 'type', 'phone', 'message'))
+
+    def test_notHaveInstanceDict_when_createItem(self):
+        item = WIMDA(air_temp='26.8')
+
+        ok_(not hasattr(item, '__dict__'))
+        with self.assertRaises(AttributeError):
+            item.unknown = 1
+
+    def test_iterateOverFields_when_convertItemToDict(self):
+        date = datetime.now(tz=timezone.utc)
+        item = ACMPlusItem(id=1, date=date, vx='1.5', vy='2', speed='2.5', direction='36.87', water_temp='20.1')
+
+        eq_(list(dict(item).keys()), list(ACMPlusItem.fields))
+        eq_(dir(item), sorted(ACMPlusItem.fields))
+
+    def test_returnTrue_when_itemsHaveSameValues(self):
+        date = datetime.now(tz=timezone.utc)
+
+        eq_(WIMDA(date=date, air_temp='26.8'), WIMDA(date=date, air_temp='26.8'))
+        ok_(WIMDA(date=date, air_temp='26.8') != WIMDA(date=date, air_temp='26.9'))
+
+
+class TestNumericBackend(unittest.TestCase):
+    def tearDown(self):
+        set_numeric_backend(NUMERIC_FLOAT)
+
+    def test_convertToFloat_when_useDefaultBackend(self):
+        item = WIMDA(air_temp='26.8', water_temp='', dew_point=None)
+
+        eq_(type(item.air_temp), float)
+        eq_(item.air_temp, 26.8)
+        eq_(item.water_temp, None)
+        eq_(item.dew_point, None)
+
+    def test_convertToDecimal_when_useDecimalBackend(self):
+        set_numeric_backend(NUMERIC_DECIMAL)
+
+        item = WIMDA(air_temp='26.8', water_temp='')
+
+        eq_(item.air_temp, Decimal('26.8'))
+        eq_(item.water_temp, None)
+
+    def test_discardValue_when_valueIsNotValidNumber(self):
+        for backend in (NUMERIC_FLOAT, NUMERIC_DECIMAL):
+            set_numeric_backend(backend)
+
+            item = WIMDA(air_temp='26,8', water_temp='nan', dew_point='inf')
+
+            eq_((item.air_temp, item.water_temp, item.dew_point), (None, None, None))
+
+    def test_raiseValueError_when_backendNotExists(self):
+        with self.assertRaises(ValueError):
+            set_numeric_backend('int')
+
+
+if __name__ == '__main__':
+    unittest.main()
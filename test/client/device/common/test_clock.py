@@ -0,0 +1,72 @@
+import unittest
+from datetime import datetime, timezone, timedelta
+
+from nose.tools import eq_, ok_
+
+from buoy.client.device.common.clock import ClockDrift
+
+START = datetime(2017, 11, 29, tzinfo=timezone.utc)
+
+
+class TestClockDrift(unittest.TestCase):
+    def test_estimateOffset_when_deviceClockIsAhead(self):
+        clock = ClockDrift()
+        for i in range(10):
+            host = START + timedelta(seconds=i)
+            clock.update(host + timedelta(seconds=2), host)
+
+        eq_(round(clock.offset, 6), 2.0)
+        eq_(round(clock.drift, 6), 0.0)
+        eq_(round(clock.jitter, 6), 0.0)
+
+    def test_estimateDrift_when_deviceClockRunsFaster(self):
+        clock = ClockDrift()
+        for i in range(100):
+            host = START + timedelta(seconds=i * 10)
+            clock.update(host + timedelta(seconds=i * 10 * 50e-6), host)
+
+        eq_(round(clock.drift, 3), 50.0)
+        eq_(round(clock.offset, 6), round(990 * 50e-6, 6))
+
+    def test_measureJitter_when_arrivalTimeVaries(self):
+        clock = ClockDrift()
+        for i in range(100):
+            device = START + timedelta(seconds=i)
+            clock.update(device, device + timedelta(seconds=0.2 if i % 2 else 0))
+
+        ok_(0.09 < clock.jitter < 0.11)
+
+    def test_forgetOldSamples_when_windowIsFull(self):
+        clock = ClockDrift(window=5, interval=1)
+        for i in range(10):
+            host = START + timedelta(seconds=i)
+            clock.update(host + timedelta(seconds=1 if i < 5 else 3), host)
+
+        eq_(clock.samples, 5)
+        eq_(round(clock.offset, 6), 3.0)
+
+    def test_estimateDrift_when_deviceClockHasOneSecondResolution(self):
+        clock = ClockDrift()
+        start = START + timedelta(days=400)
+        for i in range(24 * 3600):
+            host = start + timedelta(seconds=i, microseconds=(i * 7919) % 1000000)
+            device = host + timedelta(seconds=3 + (host - start).total_seconds() * 20e-6)
+            clock.update(device.replace(microsecond=0), host)
+
+        ok_(abs(clock.drift - 20.0) < 1.0)
+        ok_(abs(clock.offset - (2.5 + 24 * 3600 * 20e-6)) < 0.05)
+        ok_(0.25 < clock.jitter < 0.32)
+
+    def test_keepEstimate_when_windowSlidesForLong(self):
+        clock = ClockDrift(window=10, interval=60)
+        for i in range(0, 30 * 24 * 3600, 30):
+            host = START + timedelta(seconds=i)
+            clock.update(host + timedelta(seconds=3600 + i * 10e-6), host)
+
+        eq_(clock.samples, 20)
+        eq_(round(clock.drift, 3), 10.0)
+        eq_(round(clock.offset, 6), round(3600 + (30 * 24 * 3600 - 30) * 10e-6, 6))
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,71 @@
+import unittest
+from datetime import datetime, timezone, timedelta
+
+from nose.tools import eq_, ok_
+
+from buoy.client.device.common.compression import CompressedCodec, COMPRESSED_MAGIC, train_dictionary
+from buoy.client.device.common.nmea0183 import WIMDA
+from buoy.client.device.common.payload import get_codec, decode_payload, JSONCodec, BinaryCodec
+
+DATE = datetime(2017, 11, 29, 10, 18, 48, tzinfo=timezone.utc)
+
+
+def get_items(num=50):
+    return [WIMDA(id=i, date=DATE + timedelta(seconds=i), press_inch='30.327', air_temp=str(20 + i % 7 / 10),
+                  wind_knots=str(i % 13), wind_meters='0.3') for i in range(num)]
+
+
+def join(codec, items):
+    return codec.join(items, [codec.record(item) for item in items])
+
+
+class TestCompressedCodec(unittest.TestCase):
+    def test_compressAndDecode_when_payloadExceedsThreshold(self):
+        items = get_items()
+        codec = CompressedCodec(JSONCodec(), threshold=256)
+
+        payload = join(codec, items)
+
+        eq_(payload[0], COMPRESSED_MAGIC)
+        eq_(decode_payload(payload), [item.to_dict() for item in items])
+        ok_(codec.stats.ratio < 0.3)
+
+    def test_sendUncompressed_when_payloadIsBelowThreshold(self):
+        items = get_items(1)
+        codec = CompressedCodec(JSONCodec(), threshold=4096)
+
+        payload = join(codec, items)
+
+        eq_(payload, '[' + items[0].to_json() + ']')
+        eq_(codec.stats.compressed, 0)
+
+    def test_notCompressSingleItem_when_encodeItem(self):
+        item = get_items(1)[0]
+
+        eq_(CompressedCodec(JSONCodec(), threshold=0).encode(item), item.to_json())
+
+    def test_reduceSize_when_useDictionary(self):
+        dictionary = train_dictionary([join(JSONCodec(), get_items(10))])
+        items = get_items(3)
+
+        plain = join(CompressedCodec(JSONCodec(), threshold=0), items)
+        with_dictionary = join(CompressedCodec(JSONCodec(), threshold=0, dictionaries={'WIMDA': dictionary}), items)
+
+        ok_(len(with_dictionary) < len(plain))
+        eq_(decode_payload(with_dictionary), [item.to_dict() for item in items])
+
+    def test_growBatchLimit_when_compressionIsEffective(self):
+        codec = CompressedCodec(BinaryCodec(), threshold=0)
+        eq_(codec.batch_limit(1000), 1000)
+
+        join(codec, get_items())
+
+        ok_(codec.batch_limit(1000) > 2000)
+
+    def test_raiseValueError_when_algorithmIsUnknown(self):
+        with self.assertRaises(ValueError):
+            get_codec('json', compression='lzma')
+
+
+if __name__ == '__main__':
+    unittest.main()
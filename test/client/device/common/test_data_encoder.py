@@ -2,8 +2,14 @@ import json
 import unittest
 from datetime import datetime, timezone
 
+from decimal import Decimal
+
+from nose.tools import eq_
+
 from buoy.client.device.common.item import DataEncoder
 from buoy.client.device.common.nmea0183 import WIMDA
+from buoy.client.device.currentmeter.item import ACMPlusItem
+from buoy.client.notification.common import NoticeData, Notification, NotificationLevel, NoticeType
 
 skip_test = False
 
@@ -44,5 +50,54 @@ class TestItemRedmic(unittest.TestCase):
 # eq_(json_to_send['date'], now)
 
 
+class TestItemSerializer(unittest.TestCase):
+    def test_sortKeysAndRound_when_serializeItem(self):
+        date = datetime(2017, 11, 29, 10, 18, 48, 714123, tzinfo=timezone.utc)
+        item = WIMDA(id=3, date=date, air_temp='26.8123', press_mbar=Decimal('1027.0004'))
+
+        eq_(item.to_json(), '{"air_temp":26.812,"date":"2017-11-29T10:18:48.714+00:00","id":3,"press_mbar":1027.0}')
+
+    def test_emitZeroValues_when_serializeItem(self):
+        item = ACMPlusItem(id=0, date=datetime(2017, 1, 1, tzinfo=timezone.utc), vx=0, vy=0, water_temp=0.0)
+
+        data = json.loads(item.to_json())
+
+        eq_((data['id'], data['vx'], data['vy'], data['water_temp']), (0, 0.0, 0.0, 0.0))
+
+    def test_skipNotFiniteValues_when_serializeItem(self):
+        item = WIMDA(date=datetime(2017, 1, 1, tzinfo=timezone.utc), air_temp='NaN')
+
+        eq_('air_temp' in item.to_dict(), False)
+
+    def test_serializeNestedItem_when_noticeHasData(self):
+        item = WIMDA(id=1, date=datetime(2017, 1, 1, tzinfo=timezone.utc), air_temp='26.8')
+        notice = NoticeData(data=item, date=datetime(2017, 1, 1, tzinfo=timezone.utc))
+
+        data = json.loads(json.dumps(notice, cls=DataEncoder))
+
+        eq_(data['data'], item.to_dict())
+        eq_(data['type'], 2)
+
+
+class TestNoticeSerializer(unittest.TestCase):
+    def setUp(self):
+        self.date = datetime(2017, 11, 29, 10, 18, 48, 714123, tzinfo=timezone.utc)
+
+    def test_keepPreviousFormat_when_serializeNotification(self):
+        notice = Notification("Hola", phone="600000000", date=self.date, level=NotificationLevel.HIGHT,
+                              daemon="pb200")
+
+        eq_(notice.to_json(), '{"daemon": "pb200", "date": "2017-11-29T10:18:48.714+00:00", "level": 3, '
+                              '"message": "Hola", "phone": "600000000", "type": 1}')
+
+    def test_omitNotPlainValues_when_serializeNoticeData(self):
+        item = WIMDA(id=1, date=self.date, air_temp='26.8')
+        notice = NoticeData(data=item, device='PB200', date=self.date, daemon=True)
+        notice.id = NoticeType.DATA
+
+        eq_(notice.to_json(), '{"data": {"air_temp": 26.8, "date": "2017-11-29T10:18:48.714+00:00", "id": 1}, '
+                              '"date": "2017-11-29T10:18:48.714+00:00", "device": "PB200", "level": 5, "type": 2}')
+
+
 if __name__ == '__main__':
     unittest.main()
@@ -1,12 +1,14 @@
+import os
+import time
 import unittest
 from queue import Queue
 from unittest.mock import MagicMock
 from unittest.mock import patch
 
-from nose.tools import eq_
+from nose.tools import eq_, ok_
 from serial import SerialException
 
-from buoy.client.device.common.base import DeviceReader
+from buoy.client.device.common.base import DeviceReader, READ_MODE_SELECT
 from buoy.client.device.common.exceptions import ProcessDataExecption
 from buoy.client.notification.client.common import NoticePriorityQueue
 
@@ -38,13 +40,16 @@ class TestItemReaderThread(unittest.TestCase):
                                        device=device)
 
     def test_returnTwoItems_when_passStringWith3CarriageReturnAndWhiteSpace(self):
-        text = """hola
+        text = b"""hola
             
-        adios"""
+        adios
+"""
 
-        lines = self.thread.split_by_lines(text)
+        self.thread.receive(text)
+        self.thread.process_data()
 
-        eq_(len(lines), 2)
+        eq_(self.queue_save_data.qsize(), 2)
+        eq_([self.queue_save_data.get_nowait() for _ in range(2)], ["hola", "adios"])
 
     def test_bufferContainsJoinTwoText_when_callTwoRead_Data(self):
         text = [b"Hola", b" como esta"]
@@ -111,6 +116,19 @@ class TestItemReaderThread(unittest.TestCase):
         eq_(self.thread.queue_save_data.qsize(), 2)
         eq_(len(self.thread.buffer), 0)
 
+    def test_countLinesAndParseFailures_when_processData(self):
+        self.thread.parser = lambda data: data if data != "error" else None
+        self.thread.device.read = MagicMock(return_value=b"hola\nerror\nadios\n")
+        self.thread.device.in_waiting = 17
+
+        self.thread.read_data()
+        self.thread.process_data()
+
+        eq_(self.thread._bytes_read.value, 17)
+        eq_(self.thread._lines_read.value, 3)
+        eq_(self.thread._parse_failures.value, 1)
+        eq_(self.thread._items_read.value, 2)
+
     def test_returnException_when_bufferHasNotSplitChar(self):
         text = """hola"""
         self.thread.buffer = text
@@ -118,5 +136,55 @@ class TestItemReaderThread(unittest.TestCase):
         self.assertRaises(ProcessDataExecption, self.thread.process_data)
 
 
+class TestItemReaderThreadSelectMode(unittest.TestCase):
+    def setUp(self):
+        self.fd_read, self.fd_write = os.pipe()
+        self.device = MagicMock()
+        self.device.fileno.return_value = self.fd_read
+        self.device.read.side_effect = lambda size: os.read(self.fd_read, size)
+        self.queue_save_data = Queue()
+        self.thread = DeviceReaderMock(queue_save_data=self.queue_save_data, queue_notice=NoticePriorityQueue(),
+                                       device=self.device, read_mode=READ_MODE_SELECT, read_timeout=5)
+
+    def tearDown(self):
+        self.thread.stop()
+        if self.thread.is_alive():
+            self.thread.join(timeout=5)
+        os.close(self.fd_read)
+        os.close(self.fd_write)
+
+    def test_returnFalse_when_noDataArrivesBeforeTimeout(self):
+        self.thread.read_timeout = 0.01
+
+        eq_(self.thread.wait_for_data(), False)
+
+    def test_processLine_when_dataArrivesToPort(self):
+        self.device.in_waiting = 5
+        self.thread.start()
+        os.write(self.fd_write, b"hola\n")
+
+        item = self.queue_save_data.get(timeout=5)
+
+        eq_(item, "hola")
+
+    def test_wakeUpThread_when_stopThreadWhileWaitingData(self):
+        self.thread.start()
+        time.sleep(0.1)
+        start = time.time()
+        self.thread.stop()
+        self.thread.join(timeout=5)
+
+        eq_(self.thread.is_alive(), False)
+        ok_(time.time() - start < 1)
+
+    def test_raiseException_when_portIsReadyButHasNotData(self):
+        self.device.in_waiting = 0
+        self.device.read.side_effect = SerialException()
+        os.write(self.fd_write, b"x")
+
+        self.assertRaises(SerialException, self.thread.read_data)
+        self.device.read.assert_called_with(1)
+
+
 if __name__ == '__main__':
     unittest.main()
@@ -0,0 +1,106 @@
+import time
+import unittest
+from queue import Queue
+from unittest.mock import patch
+
+import paho.mqtt.client as mqtt
+from nose.tools import eq_, ok_
+
+from buoy.client.device.common.base import ItemSendThread
+from buoy.client.device.common.outbox import Outbox
+from test.benchmark.bench_mqtt import create_items, wait_until
+from test.benchmark.bench_pipeline import MemoryDB
+from test.support.mock.FakeBroker import FakeBroker
+
+
+class TestFakeBroker(unittest.TestCase):
+    def setUp(self):
+        self.broker = FakeBroker(seed=1, keep_messages=True)
+        self.broker.start()
+        self.acks = []
+        self.connections = []
+        self.client = mqtt.Client(protocol=mqtt.MQTTv311)
+        self.client.on_publish = lambda client, userdata, mid: self.acks.append(mid)
+        self.client.on_connect = lambda client, userdata, flags, rc: self.connections.append(rc)
+        self.client.reconnect_delay_set(min_delay=0.1)
+        self.client.connect(self.broker.address, self.broker.port)
+        self.client.loop_start()
+        ok_(wait_until(lambda: self.connections, timeout=5))
+
+    def tearDown(self):
+        self.client.disconnect()
+        self.client.loop_stop()
+        self.broker.stop()
+
+    def test_ackAllMessages_when_publishWithQoS1(self):
+        for i in range(50):
+            self.client.publish('buoy/test', b'data %i' % (i,), qos=1)
+
+        ok_(wait_until(lambda: len(self.acks) == 50, timeout=5))
+        eq_(self.broker.published, 50)
+        eq_(self.broker.messages[0], ('buoy/test', b'data 0'))
+
+    def test_notAckMessage_when_messageIsLost(self):
+        self.broker.loss = 1
+
+        self.client.publish('buoy/test', b'data', qos=1)
+
+        ok_(wait_until(lambda: self.broker.lost == 1, timeout=5))
+        time.sleep(0.2)
+        eq_(self.acks, [])
+        eq_(self.broker.published, 0)
+
+    def test_delayAck_when_ackLatencyIsConfigured(self):
+        self.broker.ack_latency = 0.3
+        start = time.monotonic()
+
+        self.client.publish('buoy/test', b'data', qos=1)
+
+        ok_(wait_until(lambda: self.acks, timeout=5))
+        ok_(time.monotonic() - start >= 0.3)
+
+    def test_clientReconnects_when_brokerForcesDisconnection(self):
+        self.broker.disconnect_clients()
+
+        ok_(wait_until(lambda: len(self.connections) == 2, timeout=5))
+        eq_(self.broker.disconnections, 1)
+        eq_(self.broker.connections, 2)
+
+
+class TestItemSendThreadWithFakeBroker(unittest.TestCase):
+    def setUp(self):
+        self.broker = FakeBroker(seed=1)
+        self.broker.start()
+        self.db = MemoryDB()
+        self.patch = patch('buoy.client.device.common.base.is_connected_to_internet', return_value=True)
+        self.patch.start()
+        self.thread = ItemSendThread(db=self.db, queue_send_data=Queue(), queue_notice=Queue(),
+                                     broker_url=self.broker.address, broker_port=self.broker.port,
+                                     outbox=Outbox(delay=0), reconcile_interval=3600, qos=1, max_inflight=30,
+                                     publish_timeout=0.5)
+        self.thread.start()
+        ok_(wait_until(lambda: self.thread.connected_to_mqtt, timeout=5))
+
+    def tearDown(self):
+        self.thread.stop()
+        self.thread.join(timeout=5)
+        self.thread.active = False
+        self.patch.stop()
+        self.broker.stop()
+
+    def test_sendLiveItems_when_previousMessagesWereLost(self):
+        # Más mensajes perdidos que la ventana por defecto de paho (20)
+        self.broker.loss = 1
+        for item in create_items(self.db, 25):
+            self.thread.queue_send_data.put(item)
+        ok_(wait_until(lambda: self.broker.lost >= 25, timeout=5))
+
+        self.broker.loss = 0
+        for item in create_items(self.db, 5):
+            self.thread.queue_send_data.put(item)
+
+        ok_(wait_until(lambda: self.db.sent >= 5, timeout=5))
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,73 @@
+import time
+import unittest
+from queue import Queue
+
+from nose.tools import eq_, ok_
+from serial import Serial, SerialException
+
+from buoy.client.device.currentmeter.acmplus import ACMPlusReader
+from buoy.client.device.weatherstation.pb200 import PB200Reader
+from test.support.mock.InstrumentEmulator import ACMPlusEmulator, PB200Emulator
+from test.support.mock.SerialMock import SerialMock
+
+
+def read_lines(port: Serial, num: int, timeout: float = 5) -> list:
+    data = b''
+    deadline = time.monotonic() + timeout
+    while data.count(b'\n') < num and time.monotonic() < deadline:
+        data += port.read(port.in_waiting or 1)
+
+    return [line.strip().decode() for line in data.split(b'\n') if line.strip()]
+
+
+class TestInstrumentEmulator(unittest.TestCase):
+    def setUp(self):
+        self.emulator = None
+        self.port = None
+
+    def tearDown(self):
+        if self.port:
+            self.port.close()
+        if self.emulator:
+            self.emulator.stop()
+
+    def start(self, cls_emulator, **kwargs):
+        self.emulator = cls_emulator(seed=1, **kwargs)
+        self.port = Serial(port=self.emulator.open(), baudrate=115200, timeout=0.1)
+        self.emulator.start()
+
+    def test_parseACMPlusLines_when_readFromEmulatorPort(self):
+        self.start(ACMPlusEmulator, rate=200)
+        reader = ACMPlusReader(device=SerialMock(), queue_save_data=Queue(), queue_notice=Queue())
+
+        items = [reader.parser(line) for line in read_lines(self.port, 20)]
+
+        ok_(len(items) >= 20)
+        ok_(all(items))
+
+    def test_answerModeCommand_when_writeModeToEmulatorPort(self):
+        self.start(ACMPlusEmulator, rate=0.1)
+
+        self.port.write(b"MODE\r")
+
+        ok_('MODE' in read_lines(self.port, 2))
+        eq_(self.emulator.commands, ['MODE'])
+
+    def test_parsePB200SentencesWithValidChecksum_when_readFromEmulatorPort(self):
+        self.start(PB200Emulator, rate=100, split=0.5)
+        reader = PB200Reader(device=SerialMock(), queue_save_data=Queue(), queue_notice=Queue())
+
+        items = [reader.parser(line) for line in read_lines(self.port, 45)]
+
+        ok_(len([item for item in items if item]) >= 5)
+
+    def test_raiseException_when_emulatorDisconnects(self):
+        self.start(ACMPlusEmulator, rate=100, disconnect_every=0.2, disconnect_time=10)
+
+        with self.assertRaises(SerialException):
+            read_lines(self.port, 1000, timeout=2)
+        eq_(self.emulator.disconnections, 1)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -1,7 +1,7 @@
 import unittest
 from datetime import datetime, timezone
 from queue import Queue
-from unittest.mock import patch, call, Mock
+from unittest.mock import patch, call, Mock, MagicMock
 
 from nose.tools import eq_
 
@@ -35,6 +35,17 @@ def get_items(num=1):
 
 
 class TestItemSaveThread(unittest.TestCase):
+    @patch.object(ItemSaveThread, 'is_active', return_value=False)
+    def test_releaseDBConnection_when_threadEnds(self, mock_is_active):
+        db = MagicMock()
+        thread = ItemSaveThread(queue_save_data=Queue(), queue_send_data=Queue(), db=db,
+                                queue_notice=NoticePriorityQueue())
+
+        thread.start()
+        thread.join()
+
+        eq_(db.release_connection.call_count, 1)
+
     @patch.object(ItemSaveThread, 'save')
     @patch.object(ItemSaveThread, 'is_active', side_effect=[True, True, True, False])
     def test_twiceCallSaveMethodAndExitsTwoItemsInNoticeQueue_when_insertTwoItemsInQueueData(self,
@@ -90,6 +101,39 @@ class TestItemSaveThread(unittest.TestCase):
         eq_(mock_task_done.call_count, NUM_ITEM)
         eq_(mock_save.call_args_list, items_expected)
 
+    @patch.object(ItemSaveThread, 'save_batch', side_effect=lambda items: items)
+    @patch.object(ItemSaveThread, 'is_active', side_effect=[True, True, True, False])
+    def test_saveItemsInBatchesAndQueueAllToSend_when_batchSizeIsGreaterThanOne(self, mock_is_active,
+                                                                                mock_save_batch):
+        queue_data = Queue()
+        queue_send = Queue()
+        queue_notice = NoticePriorityQueue()
+
+        items = get_items(5)
+        for item in items:
+            queue_data.put_nowait(item)
+
+        thread = ItemSaveThread(queue_save_data=queue_data, queue_send_data=queue_send,
+                                db=None, queue_notice=queue_notice, batch_size=3, linger_ms=10)
+        thread.run()
+
+        eq_(mock_save_batch.call_count, 2)
+        eq_(mock_save_batch.call_args_list, [call(items[:3]), call(items[3:])])
+        eq_(queue_send.qsize(), 5)
+        eq_(queue_data.unfinished_tasks, 0)
+
+    def test_returnItemsArrivedBeforeLinger_when_batchIsNotFull(self):
+        queue_data = Queue()
+        items = get_items(2)
+        for item in items:
+            queue_data.put_nowait(item)
+
+        thread = ItemSaveThread(queue_save_data=queue_data, queue_send_data=Queue(),
+                                db=None, queue_notice=NoticePriorityQueue(), batch_size=10, linger_ms=10)
+
+        eq_(thread.get_batch(), items)
+        eq_(thread.get_batch(), [])
+
 
 if __name__ == '__main__':
     unittest.main()
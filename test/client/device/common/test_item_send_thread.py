@@ -1,13 +1,19 @@
+import json
+import threading
+import time
 import unittest
 from datetime import datetime, timezone
 from queue import Queue, Empty
 from unittest.mock import patch, MagicMock
 
-from nose.tools import eq_
+from nose.tools import eq_, ok_
 
+from buoy.client.device.common.bandwidth import BandwidthBudget
 from buoy.client.device.common.base import ItemSendThread
 from buoy.client.device.common.database import DeviceDB
+from buoy.client.device.common.metrics import MetricsRegistry
 from buoy.client.device.common.nmea0183 import WIMDA
+from buoy.client.device.common.payload import get_codec, decode_payload
 from buoy.client.notification.client.common import NoticePriorityQueue
 
 
@@ -37,15 +43,21 @@ def get_items(num=1):
 
 class FakeDeviceDB(DeviceDB):
     def __init__(self):
-        pass
+        self.tables = {WIMDA: 'pb200'}
 
 
 class FakeReponseMQTT(object):
-    def __init__(self, rc=0):
+    def __init__(self, rc=0, mid=1, published=True):
         self.rc = rc
+        self.mid = mid
+        self.published = published
+        self.timeout = None
 
-    def wait_for_publish(self):
-        pass
+    def wait_for_publish(self, timeout=None):
+        self.timeout = timeout
+
+    def is_published(self):
+        return self.published
 
 
 class FakeMQTT(object):
@@ -97,8 +109,85 @@ class TestItemSendThread(unittest.TestCase):
         items = self.thread.waiting_data()
 
         eq_(len(items), 0)
-        eq_(self.db.get_items_to_send.call_count, 2)
-        eq_(self.queue_send.get.call_count, 2)
+        # Solo el barrido inicial, después se espera en la cola
+        eq_(self.db.get_items_to_send.call_count, 1)
+        eq_(self.queue_send.get.call_count, 3)
+
+    @patch.object(ItemSendThread, 'is_active', side_effect=[True, True, False])
+    def test_queryDB_when_outboxNotifiesPendingItems(self, mock_is_active):
+        items_expected = get_items(2)
+        self.db.get_items_to_send = MagicMock(return_value=items_expected)
+        self.queue_send.get = MagicMock(side_effect=Empty())
+        # Sin barrido periódico pendiente, solo el aviso del outbox provoca la consulta
+        self.thread.backlog._next_reconcile = time.monotonic() + 300
+        self.thread.outbox.delay = 0
+        self.thread.outbox.notify(2)
+
+        items = self.thread.waiting_data()
+
+        eq_(items, items_expected)
+        eq_(self.db.get_items_to_send.call_count, 1)
+
+    def test_notifyOutbox_when_publishItemFails(self):
+        item = get_items()[0]
+        self.thread.client.publish = MagicMock(return_value=FakeReponseMQTT(rc=1))
+        self.db.set_failed = MagicMock()
+
+        self.thread.send(item)
+
+        eq_(self.thread.outbox.pending, 1)
+
+    def test_deferToOutbox_when_noBandwidthBudget(self):
+        item = get_items()[0]
+        self.thread.budget = BandwidthBudget(max_messages=1, period=10, burst_seconds=10)
+        self.thread.budget.acquire(0)
+        self.thread.client.publish = MagicMock()
+
+        self.thread.send(item)
+
+        eq_(self.thread.client.publish.call_count, 0)
+        eq_(self.thread.outbox.pending, 1)
+        eq_(len(self.thread.item_in_queue), 0)
+
+    @patch.object(ItemSendThread, 'is_active', side_effect=[True, False])
+    def test_notQueryDB_when_backlogIsOverBudget(self, mock_is_active):
+        self.db.get_items_to_send = MagicMock(return_value=get_items(2))
+        self.queue_send.get = MagicMock(side_effect=Empty())
+        self.thread.budget = BandwidthBudget(max_messages=10, period=10, burst_seconds=10, backlog_reserve=0.5)
+        for _ in range(5):
+            self.thread.budget.acquire(0)
+
+        items = self.thread.waiting_data()
+
+        eq_(items, [])
+        eq_(self.db.get_items_to_send.call_count, 0)
+
+    @patch.object(ItemSendThread, 'is_active', side_effect=[True, False])
+    def test_notQueryDB_when_nextBatchNotFitsInBacklogBudget(self, mock_is_active):
+        self.db.get_items_to_send = MagicMock(return_value=get_items(2))
+        self.queue_send.get = MagicMock(side_effect=Empty())
+        self.thread.batch_publish = True
+        self.thread.batch_max_bytes = 1000
+        self.thread.budget = BandwidthBudget(max_bytes=2000, period=10, burst_seconds=10, backlog_reserve=0.5)
+        self.thread.budget.acquire(500)
+
+        items = self.thread.waiting_data()
+
+        eq_(items, [])
+        eq_(self.db.get_items_to_send.call_count, 0)
+
+    def test_publishRetainedState_when_budgetHasTopic(self):
+        self.thread.budget = BandwidthBudget(max_bytes=10 ** 6, period=10, topic="redmic/budget")
+        self.thread.client.publish = MagicMock()
+
+        self.thread.report_budget()
+        self.thread.report_budget()
+
+        eq_(self.thread.client.publish.call_count, 1)
+        topic, payload = self.thread.client.publish.call_args[0]
+        eq_(topic, "redmic/budget")
+        eq_(json.loads(payload)['bytes_limit'], 10 ** 6)
+        eq_(self.thread.client.publish.call_args[1], {'qos': 0, 'retain': True})
 
     def test_shouldChangeItemStatusToSended_when_publishItemOK(self):
         item = get_items()[0]
@@ -112,7 +201,7 @@ class TestItemSendThread(unittest.TestCase):
         self.thread.send(item)
 
         eq_(self.db.set_sent.call_count, 1)
-        self.db.set_sent.assert_called_with(item.id)
+        self.db.set_sent.assert_called_with(item.id, cls=WIMDA)
         eq_(self.thread.client.publish.call_count, 1)
         self.thread.client.publish.assert_called_with(self.topic, item_to_sent, qos=self.qos)
 
@@ -130,10 +219,232 @@ class TestItemSendThread(unittest.TestCase):
 
         eq_(self.db.set_sent.call_count, 0)
         eq_(self.db.set_failed.call_count, 1)
-        self.db.set_failed.assert_called_with(item.id)
+        self.db.set_failed.assert_called_with(item.id, cls=WIMDA)
         eq_(self.thread.client.publish.call_count, 1)
         self.thread.client.publish.assert_called_with(self.topic, item_to_sent, qos=self.qos)
 
+    def test_markItemAsFailed_when_ackIsNotReceivedInPublishTimeout(self):
+        item = get_items()[0]
+
+        self.db.set_sent = MagicMock()
+        self.db.set_failed = MagicMock()
+        self.thread.publish_timeout = 5
+        self.thread.client = FakeMQTT()
+        response = FakeReponseMQTT(published=False)
+        self.thread.client.publish = MagicMock(return_value=response)
+
+        self.thread.send(item)
+
+        eq_(response.timeout, 5)
+        eq_(self.db.set_sent.call_count, 0)
+        self.db.set_failed.assert_called_once_with(item.id, cls=WIMDA)
+
+    def test_markBatchAsFailed_when_ackIsNotReceivedInPublishTimeout(self):
+        items = get_items(2)
+
+        self.db.update_status = MagicMock()
+        self.thread.publish_timeout = 5
+        self.thread.client = FakeMQTT()
+        response = FakeReponseMQTT(published=False)
+        self.thread.client.publish = MagicMock(return_value=response)
+
+        self.thread.publish_and_wait(items, "[]")
+
+        eq_(response.timeout, 5)
+        self.db.update_status.assert_called_once_with([item.id for item in items], status=False, cls=WIMDA)
+
+
+class TestItemSendThreadWindow(unittest.TestCase):
+    def setUp(self):
+        self.queue_send = Queue()
+        self.db = FakeDeviceDB()
+        self.db.update_status = MagicMock()
+        self.thread = ItemSendThread(db=self.db, queue_send_data=self.queue_send, queue_notice=NoticePriorityQueue(),
+                                     topic_data="redmic/data", qos=1, max_inflight=2, publish_timeout=60)
+        self.thread.client = FakeMQTT()
+        self.mids = iter(range(1, 100))
+        self.thread.client.publish = MagicMock(side_effect=lambda *args, **kwargs: FakeReponseMQTT(
+            mid=next(self.mids)))
+        self.thread.active = True
+
+    def tearDown(self):
+        self.thread.stop()
+
+    def test_notWaitForPublish_when_windowIsNotFull(self):
+        items = get_items(2)
+        for item in items:
+            self.thread.add_item_in_queue(item)
+            self.thread.send(item)
+
+        eq_(len(self.thread.inflight), 2)
+        eq_(self.db.update_status.call_count, 0)
+
+    def test_observePublishLatency_when_brokerConfirmsMessages(self):
+        metrics = MetricsRegistry()
+        self.thread.register_metrics(metrics)
+        items = get_items(2)
+        for item in items:
+            self.thread.add_item_in_queue(item)
+            self.thread.send(item)
+
+        self.thread.on_publish(None, None, 1)
+        self.thread.process_acks()
+
+        eq_(self.thread._publish_latency.count, 1)
+        text = metrics.render()
+        ok_('buoy_inflight_messages 1\n' in text)
+        ok_('buoy_messages_published_total 2\n' in text)
+        ok_('buoy_items_sent_total 1\n' in text)
+
+    def test_markItemsSentInBulk_when_brokerConfirmsMessages(self):
+        items = get_items(2)
+        for item in items:
+            self.thread.add_item_in_queue(item)
+            self.thread.send(item)
+
+        self.thread.on_publish(None, None, 1)
+        self.thread.on_publish(None, None, 2)
+        self.thread.process_acks()
+
+        eq_(len(self.thread.inflight), 0)
+        eq_(len(self.thread.item_in_queue), 0)
+        self.db.update_status.assert_called_once_with([items[0].id, items[1].id], status=True, cls=WIMDA)
+
+    def test_markItemsFailed_when_publishTimeoutExpires(self):
+        item = get_items()[0]
+        self.thread.publish_timeout = 0
+        self.thread.send(item)
+        time.sleep(0.01)
+
+        self.thread.process_acks()
+
+        eq_(len(self.thread.inflight), 0)
+        self.db.update_status.assert_called_once_with([item.id], status=False, cls=WIMDA)
+
+    def test_waitUntilAck_when_windowIsFull(self):
+        items = get_items(3)
+        threading.Timer(0.1, self.thread.on_publish, args=(None, None, 1)).start()
+
+        for item in items:
+            self.thread.send(item)
+
+        eq_(self.thread.client.publish.call_count, 3)
+        eq_(sorted(self.thread.inflight.keys()), [2, 3])
+        self.db.update_status.assert_called_once_with([items[0].id], status=True, cls=WIMDA)
+
+
+class TestItemSendThreadBatch(unittest.TestCase):
+    def setUp(self):
+        self.db = FakeDeviceDB()
+        self.db.update_status = MagicMock()
+        self.thread = ItemSendThread(db=self.db, queue_send_data=Queue(), queue_notice=NoticePriorityQueue(),
+                                     topic_data="redmic/data", qos=1, batch_publish=True)
+        self.thread.client = FakeMQTT()
+        self.thread.client.publish = MagicMock(return_value=FakeReponseMQTT())
+        self.thread.connected_to_mqtt = True
+        self.thread.active = True
+
+    def tearDown(self):
+        self.thread.stop()
+
+    def test_publishOneArrayAndUpdateStatusOnce_when_sendBatch(self):
+        items = get_items(3)
+
+        self.thread.send_batch(items)
+
+        eq_(self.thread.client.publish.call_count, 1)
+        payload = self.thread.client.publish.call_args[0][1]
+        eq_(payload, '[' + ','.join(item.to_json() for item in items) + ']')
+        self.db.update_status.assert_called_once_with([item.id for item in items], status=True, cls=WIMDA)
+        eq_(len(self.thread.item_in_queue), 0)
+
+    def test_splitInSeveralArrays_when_payloadExceedsMaxBytes(self):
+        items = get_items(5)
+        size = len(items[0].to_json())
+        self.thread.batch_max_bytes = 2 * size + 3
+
+        groups = self.thread.pack_items(items)
+
+        eq_([len(group) for group, _ in groups], [2, 2, 1])
+        for group, payload in groups:
+            ok_(len(payload) <= self.thread.batch_max_bytes)
+            eq_(len(json.loads(payload)), len(group))
+
+    def test_publishOneBinaryMessage_when_payloadFormatIsBinary(self):
+        items = get_items(3)
+        self.thread.codec = get_codec('binary')
+
+        self.thread.send_batch(items)
+
+        eq_(self.thread.client.publish.call_count, 1)
+        payload = self.thread.client.publish.call_args[0][1]
+        eq_([data['id'] for data in decode_payload(payload)], [item.id for item in items])
+
+    def test_raiseValueError_when_compressedBatchesUseTopicData(self):
+        with self.assertRaises(ValueError):
+            ItemSendThread(db=self.db, queue_send_data=Queue(), queue_notice=NoticePriorityQueue(),
+                           topic_data="redmic/data", batch_publish=True, compression='zlib')
+
+    def test_raiseValueError_when_binaryBatchesUseTopicData(self):
+        with self.assertRaises(ValueError):
+            ItemSendThread(db=self.db, queue_send_data=Queue(), queue_notice=NoticePriorityQueue(),
+                           topic_data="redmic/data", batch_publish=True, payload_format='binary')
+
+    def test_publishLiveItemAsJSON_when_payloadFormatIsBinary(self):
+        thread = ItemSendThread(db=self.db, queue_send_data=Queue(), queue_notice=NoticePriorityQueue(),
+                                topic_data="redmic/data", qos=1, batch_publish=True, topic_batch="redmic/batch",
+                                payload_format='binary')
+        thread.client = self.thread.client
+        thread.connected_to_mqtt = True
+        item = get_items()[0]
+
+        thread.send(item)
+
+        thread.client.publish.assert_called_once_with("redmic/data", item.to_json(), qos=1)
+
+    def test_publishCompressedBatchToTopicBatch_when_classHasOwnTopic(self):
+        thread = ItemSendThread(db=self.db, queue_send_data=Queue(), queue_notice=NoticePriorityQueue(),
+                                topic_data="redmic/data", qos=1, batch_publish=True, topic_batch="redmic/batch",
+                                topics={'WIMDA': 'redmic/data/wimda'}, compression='zlib')
+        thread.client = self.thread.client
+        thread.connected_to_mqtt = True
+
+        thread.send_batch(get_items(3))
+
+        eq_(thread.client.publish.call_args[0][0], "redmic/batch")
+
+    def test_notifyOutbox_when_connectionIsLostInTheMiddleOfBatch(self):
+        items = get_items(3)
+        self.thread.batch_max_bytes = len(items[0].to_json()) + 2
+
+        def publish(*args, **kwargs):
+            self.thread.connected_to_mqtt = False
+            return FakeReponseMQTT()
+        self.thread.client.publish = MagicMock(side_effect=publish)
+
+        self.thread.send_batch(items)
+
+        eq_(self.thread.client.publish.call_count, 1)
+        eq_(self.thread.outbox.pending, 2)
+
+    def test_markAllItemsFailed_when_publishBatchFails(self):
+        items = get_items(3)
+        self.thread.client.publish = MagicMock(return_value=FakeReponseMQTT(rc=1))
+
+        self.thread.send_batch(items)
+
+        self.db.update_status.assert_called_once_with([item.id for item in items], status=False, cls=WIMDA)
+
+    def test_publishLiveItemAlone_when_itemComesFromQueue(self):
+        item = get_items()[0]
+        self.thread.queue_send_data.put_nowait(item)
+        self.db.set_sent = MagicMock()
+
+        self.thread.activity()
+
+        self.thread.client.publish.assert_called_once_with("redmic/data", item.to_json(), qos=1)
+        self.db.set_sent.assert_called_once_with(item.id, cls=WIMDA)
+
 
 if __name__ == '__main__':
     unittest.main()
@@ -0,0 +1,80 @@
+import unittest
+
+from nose.tools import eq_
+
+from buoy.client.device.common.buffer import LineBuffer
+
+
+class TestLineBuffer(unittest.TestCase):
+    def test_returnCompleteLinesAndKeepTail_when_writeDataWithSplitter(self):
+        buffer = LineBuffer(size=32)
+        buffer.write(b"hola\nadios\nby")
+
+        eq_(buffer.read_lines(), ["hola", "adios"])
+        eq_(buffer.peek(), "by")
+
+        buffer.write(b"e\n")
+
+        eq_(buffer.read_lines(), ["bye"])
+        eq_(len(buffer), 0)
+
+    def test_returnFalse_when_bufferHasNotSplitter(self):
+        buffer = LineBuffer(size=32)
+        buffer.write(b"hola")
+
+        eq_(buffer.has_line(), False)
+        eq_(buffer.read_lines(), [])
+        eq_(buffer.peek(), "hola")
+
+    def test_returnLineSplitInTwoParts_when_dataWrapsAroundEndOfBuffer(self):
+        buffer = LineBuffer(size=8)
+        buffer.write(b"12345\nab")
+        eq_(buffer.read_lines(), ["12345"])
+
+        buffer.write(b"cd\nef")
+
+        eq_(buffer.size, 8)
+        eq_(buffer.read_lines(), ["abcd"])
+        eq_(buffer.peek(), "ef")
+
+    def test_findSplitter_when_multiByteSplitterWrapsAroundEndOfBuffer(self):
+        buffer = LineBuffer(splitter=b"\r\n", size=8)
+        buffer.write(b"1234\r\nx")
+        eq_(buffer.read_lines(), ["1234"])
+
+        buffer.write(b"\r")
+        eq_(buffer.has_line(), False)
+        buffer.write(b"\n")
+
+        eq_(buffer.size, 8)
+        eq_(buffer.read_lines(), ["x"])
+
+    def test_keepPendingData_when_bufferGrowsWithDataWrapped(self):
+        buffer = LineBuffer(size=4)
+        buffer.write(b"a\nbc")
+        eq_(buffer.read_lines(), ["a"])
+        buffer.write(b"d")
+        buffer.write(b"efgh\ni")
+
+        eq_(buffer.size, 16)
+        eq_(buffer.read_lines(), ["bcdefgh"])
+        eq_(buffer.peek(), "i")
+
+    def test_replaceInvalidBytes_when_lineIsNotUtf8(self):
+        buffer = LineBuffer(size=16)
+        buffer.write(b"\xffhola\n")
+
+        eq_(buffer.read_lines(), ["�hola"])
+
+    def test_returnReceivedBytes_when_readLinesWithoutDecode(self):
+        buffer = LineBuffer(size=8)
+        buffer.write(b"\xe1bc\nde")
+        buffer.read_lines(decode=False)
+        buffer.write(b"f\xff\ngh")
+
+        eq_(buffer.read_lines(decode=False), [b"def\xff"])
+        eq_(buffer.peek(), "gh")
+
+
+if __name__ == '__main__':
+    unittest.main()
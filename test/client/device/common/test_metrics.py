@@ -0,0 +1,86 @@
+import os
+import tempfile
+import unittest
+from urllib.request import urlopen
+
+from nose.tools import eq_, ok_
+
+from buoy.client.device.common.metrics import MetricsRegistry, MetricsExporter
+
+
+class TestMetricsRegistry(unittest.TestCase):
+    def setUp(self):
+        self.registry = MetricsRegistry(labels={'device': 'PB200'})
+
+    def test_renderCounter_when_counterIsIncremented(self):
+        counter = self.registry.counter('lines_read', "Líneas leídas")
+        counter.inc()
+        counter.inc(2)
+
+        text = self.registry.render()
+
+        ok_('# TYPE buoy_lines_read counter\n' in text)
+        ok_('buoy_lines_read_total{device="PB200"} 3\n' in text)
+
+    def test_returnSameMetric_when_registerTwice(self):
+        first = self.registry.counter('items_saved')
+        second = self.registry.counter('items_saved')
+
+        ok_(first is second)
+        self.assertRaises(ValueError, self.registry.gauge, 'items_saved')
+
+    def test_renderCumulativeBuckets_when_observeHistogram(self):
+        histogram = self.registry.histogram('publish_seconds', buckets=(0.1, 1.0))
+        for value in (0.05, 0.5, 0.7, 3.0):
+            histogram.observe(value)
+
+        text = self.registry.render()
+
+        ok_('buoy_publish_seconds_bucket{device="PB200",le="0.1"} 1\n' in text)
+        ok_('buoy_publish_seconds_bucket{device="PB200",le="1.0"} 3\n' in text)
+        ok_('buoy_publish_seconds_bucket{device="PB200",le="+Inf"} 4\n' in text)
+        ok_('buoy_publish_seconds_count{device="PB200"} 4\n' in text)
+        eq_(round(histogram.sum, 6), 4.25)
+
+    def test_readValueOnRender_when_gaugeHasFunction(self):
+        queue = [1, 2]
+        self.registry.gauge('queue_size', labels={'queue': 'send_data'}, function=lambda: len(queue))
+        queue.append(3)
+
+        ok_('buoy_queue_size{device="PB200",queue="send_data"} 3\n' in self.registry.render())
+
+    def test_renderNaN_when_gaugeFunctionHasNoValue(self):
+        self.registry.gauge('clock_offset_seconds', function=lambda: None)
+
+        ok_('buoy_clock_offset_seconds{device="PB200"} NaN\n' in self.registry.render())
+
+    def test_writeFile_when_writeTextfile(self):
+        self.registry.counter('items_sent').inc(5)
+        with tempfile.TemporaryDirectory() as path:
+            textfile = os.path.join(path, 'buoy.prom')
+            self.registry.write_textfile(textfile)
+
+            with open(textfile) as fh:
+                ok_('buoy_items_sent_total{device="PB200"} 5\n' in fh.read())
+            eq_(os.listdir(path), ['buoy.prom'])
+
+
+class TestMetricsExporter(unittest.TestCase):
+    def test_serveMetrics_when_portIsConfigured(self):
+        registry = MetricsRegistry()
+        registry.counter('items_sent').inc()
+        exporter = MetricsExporter(registry, port=0)
+        exporter.start()
+        try:
+            url = 'http://127.0.0.1:%i/metrics' % (exporter.server.server_port,)
+            with urlopen(url, timeout=5) as response:
+                body = response.read().decode('utf-8')
+                ok_(response.headers['Content-Type'].startswith('text/plain; version=0.0.4'))
+        finally:
+            exporter.stop()
+
+        ok_('buoy_items_sent_total 1\n' in body)
+
+
+if __name__ == '__main__':
+    unittest.main()
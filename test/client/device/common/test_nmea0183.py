@@ -0,0 +1,127 @@
+import unittest
+from datetime import datetime, timezone
+
+from nose.tools import eq_
+
+from buoy.client.device.common.nmea0183 import WIMDA, WIMWV, YXXDR, HCHDG, GPGGA, GPVTG, nmea_checksum, \
+    parse_sentence, coordinate_to_degrees
+
+LINE = "$WIMDA,30.3273,I,1.027,B,26.8,C,20.1,C,12.3,21.0,2.3,C,2.0,T,128.7,M,134.6,N,0.3,M*28"
+
+
+class TestParseSentence(unittest.TestCase):
+    def test_returnIdentifierAndFields_when_checksumIsValid(self):
+        identifier, values = parse_sentence(LINE)
+
+        eq_(identifier, "WIMDA")
+        eq_(len(values), 20)
+        eq_(values[0], "30.3273")
+        eq_(values[-1], "M")
+
+    def test_returnNone_when_checksumIsInvalid(self):
+        eq_(parse_sentence(LINE.replace("26.8", "26.9")), None)
+        eq_(parse_sentence(LINE[:-2] + "ZZ"), None)
+
+    def test_validateChecksumOnReceivedBytes_when_lineIsNotUtf8(self):
+        body = b"WIMWV,51.4,R,12.1,N,\xe1"
+        line = b"$" + body + b"*" + ("%02X" % nmea_checksum(body)).encode()
+
+        identifier, values = parse_sentence(line)
+
+        eq_(identifier, "WIMWV")
+        eq_(values[-1], "\xe1")
+        eq_(parse_sentence(line.decode('utf-8', 'replace')), None)
+
+    def test_returnNone_when_sentenceIsNotAccepted(self):
+        eq_(parse_sentence("$WIMWV,51.4,R,12.1,N,A*21", sentences={"WIMDA"}), None)
+
+    def test_acceptSentence_when_hasNotChecksum(self):
+        identifier, values = parse_sentence("$WIMWV,51.4,R,12.1,N,A")
+
+        eq_(identifier, "WIMWV")
+        eq_(values, ["51.4", "R", "12.1", "N", "A"])
+
+    def test_returnNone_when_lineIsNotSentence(self):
+        eq_(parse_sentence("garbage"), None)
+        eq_(parse_sentence("$WIMDA"), None)
+
+    def test_calculateXorOfAllBytes_when_calculateChecksum(self):
+        eq_(nmea_checksum(b"GPGGA,"), 0x47 ^ 0x50 ^ 0x47 ^ 0x47 ^ 0x41 ^ 0x2C)
+        eq_(nmea_checksum(b""), 0)
+
+
+class TestWIMDAFromSentence(unittest.TestCase):
+    def test_createItem_when_sentenceIsComplete(self):
+        date = datetime.now(tz=timezone.utc)
+        _, values = parse_sentence(LINE)
+
+        item = WIMDA.from_sentence(date, values)
+
+        eq_(item, WIMDA(date=date, press_inch='30.3273', press_mbar='1027.0', air_temp='26.8', water_temp='20.1',
+                        rel_humidity='12.3', abs_humidity='21.0', dew_point='2.3', wind_dir_true='2.0',
+                        wind_dir_magnetic='128.7', wind_knots='134.6', wind_meters='0.3'))
+
+    def test_leaveFieldsEmpty_when_sentenceIsTruncated(self):
+        item = WIMDA.from_sentence(datetime.now(tz=timezone.utc), ["30.3273", "I", "", "B"])
+
+        eq_(item.press_inch, 30.3273)
+        eq_(item.press_mbar, None)
+        eq_(item.wind_meters, None)
+
+
+class TestSentencesFromSentence(unittest.TestCase):
+    def setUp(self):
+        self.date = datetime.now(tz=timezone.utc)
+
+    def parse(self, cls, line):
+        return cls.from_sentence(self.date, parse_sentence(line)[1])
+
+    def test_createWindItem_when_parseWIMWV(self):
+        item = self.parse(WIMWV, "$WIMWV,51.4,R,12.1,N,A*21")
+
+        eq_(item, WIMWV(date=self.date, wind_angle='51.4', reference='R', wind_speed='12.1', speed_unit='N'))
+
+    def test_returnNone_when_WIMWVIsNotValid(self):
+        eq_(WIMWV.from_sentence(self.date, ["51.4", "R", "12.1", "N", "V"]), None)
+
+    def test_createAttitudeItem_when_parseYXXDR(self):
+        item = self.parse(YXXDR, "$YXXDR,A,-2.3,D,PTCH,A,-4.9,D,ROLL*51")
+
+        eq_(item.pitch, -2.3)
+        eq_(item.roll, -4.9)
+
+    def test_returnNone_when_YXXDRHasNotPitchOrRoll(self):
+        eq_(YXXDR.from_sentence(self.date, ["C", "21.5", "C", "TEMP"]), None)
+
+    def test_negativeWestValues_when_parseHCHDG(self):
+        item = self.parse(HCHDG, "$HCHDG,125.3,0.0,E,5.3,W*53")
+
+        eq_(item, HCHDG(date=self.date, heading='125.3', deviation='0.0', variation='-5.3'))
+
+    def test_convertCoordinatesToDegrees_when_parseGPGGA(self):
+        item = self.parse(GPGGA, "$GPGGA,101848.00,2807.9710,N,01524.6215,W,1,8,1.0,3.2,M,,,,*11")
+
+        eq_(item.latitude, 28.132850)
+        eq_(item.longitude, -15.410358)
+        eq_(item.fix_quality, 1)
+        eq_(item.num_satellites, 8)
+        eq_(item.hdop, 1.0)
+        eq_(item.altitude, 3.2)
+
+    def test_returnNone_when_GPGGAHasNotPosition(self):
+        eq_(GPGGA.from_sentence(self.date, ["101848.00", "", "", "", "", "0", "0"]), None)
+
+    def test_createVelocityItem_when_parseGPVTG(self):
+        item = self.parse(GPVTG, "$GPVTG,125.3,T,130.6,M,0.1,N,0.2,K,A*21")
+
+        eq_(item, GPVTG(date=self.date, course_true='125.3', course_magnetic='130.6', speed_knots='0.1',
+                        speed_kmh='0.2'))
+
+    def test_returnNone_when_coordinateIsNotValid(self):
+        eq_(coordinate_to_degrees("", "N"), None)
+        eq_(coordinate_to_degrees("28x7.97", "N"), None)
+
+
+
+if __name__ == '__main__':
+    unittest.main()
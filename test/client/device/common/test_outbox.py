@@ -0,0 +1,37 @@
+import unittest
+from unittest.mock import patch
+
+from nose.tools import eq_
+
+from buoy.client.device.common.outbox import Outbox
+
+
+class TestOutbox(unittest.TestCase):
+    @patch('buoy.client.device.common.outbox.time.monotonic', side_effect=[0, 1, 20, 31])
+    def test_groupNotifications_when_theyAreClose(self, mock_monotonic):
+        outbox = Outbox(delay=30, resolution=5)
+        outbox.notify()
+        outbox.notify(2)
+        outbox.notify()
+
+        eq_(len(outbox._pending), 2)
+        eq_(outbox.take(), 3)
+        eq_(outbox.pending, 1)
+
+    @patch('buoy.client.device.common.outbox.time.monotonic', side_effect=[0, 10])
+    def test_returnZero_when_notificationsAreNotVisibleYet(self, mock_monotonic):
+        outbox = Outbox(delay=30)
+        outbox.notify()
+
+        eq_(outbox.take(), 0)
+        eq_(outbox.pending, 1)
+
+    def test_ignoreNotification_when_numIsZero(self):
+        outbox = Outbox()
+        outbox.notify(0)
+
+        eq_(outbox.pending, 0)
+
+
+if __name__ == '__main__':
+    unittest.main()
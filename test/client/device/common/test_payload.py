@@ -0,0 +1,95 @@
+import unittest
+from datetime import datetime, timezone
+
+from nose.tools import eq_, ok_
+
+from buoy.client.device.common.nmea0183 import WIMDA, WIMWV, GPGGA
+from buoy.client.device.common.payload import get_codec, decode_payload, BINARY_HEADER, BINARY_MAGIC
+from buoy.client.device.currentmeter.item import ACMPlusItem
+
+DATE = datetime(2017, 11, 29, 10, 18, 48, 123000, tzinfo=timezone.utc)
+
+
+def get_wimda(id=1):
+    return WIMDA(id=id, date=DATE, press_inch='30.327', press_mbar='1027.0', air_temp='26.8', water_temp='20.1',
+                 rel_humidity='12.3', abs_humidity='21.0', dew_point='2.3', wind_dir_true='2.0',
+                 wind_dir_magnetic='128.7', wind_knots='134.6', wind_meters='0.3')
+
+
+def encode(codec, item):
+    return codec.join([item], [codec.record(item)])
+
+
+class TestBinaryCodec(unittest.TestCase):
+    def setUp(self):
+        self.codec = get_codec('binary')
+
+    def test_decodeSameValuesAsJSON_when_encodeItem(self):
+        item = get_wimda()
+
+        payload = encode(self.codec, item)
+
+        eq_(payload[0], BINARY_MAGIC)
+        eq_(decode_payload(payload), [item.to_dict()])
+        ok_(len(payload) < len(item.to_json()) / 3)
+
+    def test_omitFields_when_valueIsNone(self):
+        item = WIMWV(date=DATE, wind_angle='51.4', reference='R')
+
+        eq_(decode_payload(encode(self.codec, item)),
+            [{'date': '2017-11-29T10:18:48.123+00:00', 'wind_angle': 51.4, 'reference': 'R'}])
+
+    def test_keepPrecision_when_fieldIsDouble(self):
+        item = GPGGA(date=DATE, latitude=28.132850, longitude=-15.410358, fix_quality='1', num_satellites='8')
+
+        data = decode_payload(encode(self.codec, item))[0]
+
+        eq_(data['latitude'], 28.132850)
+        eq_(data['longitude'], -15.410358)
+        eq_(data['num_satellites'], 8)
+
+    def test_omitFields_when_valueIsOutOfRange(self):
+        item = WIMDA(date=DATE, air_temp='1e39', water_temp='20.1')
+        gps = GPGGA(date=DATE, latitude=28.13285, longitude=-15.410358, num_satellites='70000')
+
+        eq_(decode_payload(encode(self.codec, item)),
+            [{'date': '2017-11-29T10:18:48.123+00:00', 'water_temp': 20.1}])
+        ok_('num_satellites' not in decode_payload(encode(self.codec, gps))[0])
+
+    def test_sendJSON_when_encodeSingleItem(self):
+        item = get_wimda()
+
+        eq_(self.codec.encode(item), item.to_json())
+
+    def test_decodeAllItems_when_joinRecords(self):
+        items = [ACMPlusItem(id=i, date=DATE, vx='-0.61', vy='-73.51', water_temp='24.37') for i in range(3)]
+
+        payload = self.codec.join(items, [self.codec.record(item) for item in items])
+
+        eq_([data['id'] for data in decode_payload(payload)], [0, 1, 2])
+
+    def test_raiseValueError_when_schemaVersionIsUnknown(self):
+        payload = bytearray(encode(self.codec, get_wimda()))
+        payload[2] = 99
+
+        with self.assertRaises(ValueError):
+            decode_payload(bytes(payload))
+
+
+class TestDecodePayload(unittest.TestCase):
+    def test_returnList_when_payloadIsJSON(self):
+        item = get_wimda()
+
+        eq_(decode_payload(item.to_json()), [item.to_dict()])
+        eq_(decode_payload('[' + item.to_json() + ']'), [item.to_dict()])
+
+    def test_raiseValueError_when_formatIsUnknown(self):
+        with self.assertRaises(ValueError):
+            decode_payload(BINARY_HEADER.pack(0x00, 1, 1, 0))
+
+        with self.assertRaises(ValueError):
+            get_codec('xml')
+
+
+if __name__ == '__main__':
+    unittest.main()
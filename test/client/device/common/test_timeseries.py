@@ -0,0 +1,108 @@
+import random
+import unittest
+from datetime import datetime, timezone, timedelta
+
+from nose.tools import eq_, ok_
+
+from buoy.client.device.common.nmea0183 import WIMDA, WIMWV, GPGGA
+from buoy.client.device.common.payload import get_codec, decode_payload, TIMESERIES_MAGIC
+from buoy.client.device.common.timeseries import BitWriter, BitReader
+from buoy.client.device.currentmeter.item import ACMPlusItem
+
+START = datetime(2017, 11, 29, tzinfo=timezone.utc)
+
+
+def random_value(rnd, previous, step, decimals=2):
+    """ Paseo aleatorio con la resolución del dispositivo, con huecos y saltos ocasionales """
+    choice = rnd.random()
+    if choice < 0.05:
+        return None
+    elif choice < 0.08:
+        return round(rnd.uniform(-1000, 1000), decimals)
+
+    return round((previous or 0) + rnd.uniform(-step, step), decimals)
+
+
+def random_items(rnd, cls, num):
+    items, values, date, item_id = [], {}, START, rnd.randint(0, 2 ** 40)
+    for _ in range(num):
+        # Cadencia de 1 s con retrasos de lectura y algún hueco largo
+        date += timedelta(milliseconds=rnd.choice([1000, 1000, 1000, 998, 1003, 60000, 250]))
+        item_id += rnd.choice([1, 1, 1, 2, 500])
+        data = {}
+        for name in cls.fields[2:]:
+            if cls.wire_types.get(name) == 'c':
+                data[name] = rnd.choice(['R', 'T', None])
+            elif cls.wire_types.get(name) == 'h':
+                data[name] = rnd.choice([0, 1, 2, 8, None])
+            else:
+                value = random_value(rnd, values.get(name), 0.5, decimals=rnd.choice([1, 2, 6]))
+                # La velocidad y la dirección del ACMPlus se calculan a partir de vx y vy, que siempre llegan
+                if value is None and name in ('vx', 'vy'):
+                    value = values.get(name) or 0.0
+                values[name] = data[name] = value
+        items.append(cls(id=item_id, date=date, **data))
+
+    return items
+
+
+def join(codec, items):
+    return codec.join(items, [codec.record(item) for item in items])
+
+
+class TestTimeSeriesCodec(unittest.TestCase):
+    def setUp(self):
+        self.codec = get_codec('timeseries')
+        self.binary = get_codec('binary')
+
+    def test_decodeSameAsBinary_when_encodeRandomSeries(self):
+        rnd = random.Random(20171129)
+        for cls in (WIMDA, ACMPlusItem, WIMWV, GPGGA):
+            for num in (1, 2, 3, 17, 200):
+                items = random_items(rnd, cls, num)
+
+                payload = join(self.codec, items)
+
+                eq_(payload[0], TIMESERIES_MAGIC)
+                eq_(decode_payload(payload), decode_payload(join(self.binary, items)))
+
+    def test_writeOneBitPerValue_when_valuesDoNotChange(self):
+        items = [WIMDA(id=i, date=START + timedelta(seconds=i), air_temp='20.1', press_inch='30.327')
+                 for i in range(100)]
+
+        payload = join(self.codec, items)
+
+        ok_(len(payload) < len(join(self.binary, items)) / 10)
+
+    def test_adaptBatchLimit_when_seriesAreSmaller(self):
+        eq_(self.codec.batch_limit(1000), 1000)
+
+        join(self.codec, random_items(random.Random(1), WIMDA, 100))
+
+        ok_(self.codec.batch_limit(1000) > 1000)
+
+    def test_sendJSON_when_encodeSingleItem(self):
+        item = random_items(random.Random(2), ACMPlusItem, 1)[0]
+
+        eq_(self.codec.encode(item), item.to_json())
+
+
+class TestBitStream(unittest.TestCase):
+    def test_readSameBits_when_writeValues(self):
+        rnd = random.Random(7)
+        values = [(rnd.getrandbits(bits), bits) for bits in (rnd.randint(1, 64) for _ in range(500))]
+        out = BitWriter()
+        for value, bits in values:
+            out.write(value, bits)
+
+        bits_in = BitReader(out.to_bytes())
+
+        eq_([bits_in.read(bits) for _, bits in values], [value for value, _ in values])
+
+    def test_raiseValueError_when_payloadIsTruncated(self):
+        with self.assertRaises(ValueError):
+            BitReader(b'\x01').read(9)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,94 @@
+import unittest
+from datetime import datetime, timezone
+from queue import Queue
+from unittest.mock import MagicMock, patch
+
+from nose.tools import eq_, ok_
+
+from buoy.client.device.common.base import DeviceReader
+from buoy.client.device.common.metrics import MetricsRegistry
+from buoy.client.device.common.nmea0183 import WIMDA
+from buoy.client.device.common.tracing import Tracer, STAGE_ENQUEUED, STAGE_COMMITTED, STAGE_PUBLISHED, \
+    STAGE_ACKED, format_trace
+
+
+class WIMDAReaderMock(DeviceReader):
+    def parser(self, data):
+        return WIMDA(date=datetime.now(tz=timezone.utc), air_temp=data)
+
+
+class TestTracer(unittest.TestCase):
+    def setUp(self):
+        self.metrics = MetricsRegistry()
+        self.tracer = Tracer(self.metrics, enabled=True)
+
+    def stage(self, name):
+        return self.metrics.histogram('stage_seconds', labels={'stage': name})
+
+    @patch('buoy.client.device.common.tracing.time.monotonic', return_value=10.0)
+    def test_observeEveryStage_when_itemIsAcked(self, mock_monotonic):
+        item = WIMDA()
+        self.tracer.start(item, received=9.5)
+        for stage, instant in ((STAGE_ENQUEUED, 10.0), (STAGE_COMMITTED, 10.2), (STAGE_PUBLISHED, 10.3),
+                               (STAGE_ACKED, 11.0)):
+            mock_monotonic.return_value = instant
+            self.tracer.mark(item, stage)
+
+        eq_(self.stage('parsed').sum, 0.5)
+        eq_(round(self.stage('committed').sum, 6), 0.2)
+        eq_(round(self.stage('acked').sum, 6), 0.7)
+        eq_(self.metrics.histogram('end_to_end_seconds').sum, 1.5)
+        eq_(item._trace, None)
+
+    @patch('buoy.client.device.common.tracing.time.monotonic', return_value=10.0)
+    def test_measureFromLastStage_when_stageIsSkipped(self, mock_monotonic):
+        item = WIMDA()
+        self.tracer.start(item, received=10.0)
+        mock_monotonic.return_value = 10.4
+        self.tracer.mark(item, STAGE_COMMITTED)
+
+        eq_(round(self.stage('committed').sum, 6), 0.4)
+        eq_(self.stage('enqueued').count, 0)
+
+    def test_ignoreItem_when_itemIsNotTraced(self):
+        item = WIMDA()
+
+        self.tracer.mark(item, STAGE_PUBLISHED)
+
+        eq_(self.stage('published').count, 0)
+
+    def test_notTrace_when_tracerIsDisabled(self):
+        item = WIMDA()
+
+        Tracer(self.metrics).start(item)
+
+        eq_(item._trace, None)
+
+    def test_keepTraceOutOfFields_when_itemIsTraced(self):
+        item = WIMDA(air_temp='26.8')
+        self.tracer.start(item)
+
+        ok_('trace' not in WIMDA.fields)
+        ok_('trace' not in item.to_json())
+
+    def test_formatStagesFromArrival_when_logTrace(self):
+        eq_(format_trace([1.0, 1.001, 1.002, None, 1.5, 2.0]),
+            "parsed +1.0 ms, enqueued +2.0 ms, published +500.0 ms, acked +1000.0 ms")
+
+
+class TestReaderTracing(unittest.TestCase):
+    def test_traceReceivedParsedAndEnqueued_when_processLine(self):
+        metrics = MetricsRegistry()
+        reader = WIMDAReaderMock(device=MagicMock(), queue_save_data=Queue(), queue_notice=Queue(),
+                                 metrics=metrics, tracer=Tracer(metrics, enabled=True))
+
+        reader.feed(b"26.8\n")
+
+        item = reader.queue_save_data.get_nowait()
+        trace = item._trace
+        ok_(trace[0] == reader.received_at <= trace[1] <= trace[2])
+        eq_(metrics.histogram('stage_seconds', labels={'stage': 'enqueued'}).count, 1)
+
+
+if __name__ == '__main__':
+    unittest.main()
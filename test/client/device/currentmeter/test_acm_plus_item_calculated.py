@@ -1,7 +1,6 @@
 import json
 import unittest
 from datetime import datetime
-from decimal import *
 
 from nose.tools import eq_, ok_
 
@@ -20,7 +19,7 @@ class TestACMlusItemCalculate(unittest.TestCase):
         item = ACMPlusItem(vx=data['vx'], vy=data['vy'])
 
         for key, value in data.items():
-            eq_(round(getattr(item, key), 2), round(Decimal(value), 2))
+            eq_(round(getattr(item, key), 2), round(value, 2))
 
     def test_calculate_properties_value_zero(self):
         data = {
@@ -33,7 +32,7 @@ class TestACMlusItemCalculate(unittest.TestCase):
         item = ACMPlusItem(vx=data['vx'], vy=data['vy'])
 
         for key, value in data.items():
-            eq_(round(getattr(item, key), 2), round(Decimal(value), 2))
+            eq_(round(getattr(item, key), 2), round(value, 2))
 
 
 class TestACMPlusItem(unittest.TestCase):
@@ -58,8 +57,8 @@ class TestACMPlusItem(unittest.TestCase):
             value = getattr(item, name)
             if type(value) is datetime:
                 eq_(True, True)
-            elif type(value) is Decimal:
-                eq_(value, Decimal(self.data[name]))
+            elif type(value) is float:
+                eq_(value, float(self.data[name]))
             else:
                 eq_(value, self.data[name])
 
@@ -88,7 +87,7 @@ class TestACMPlusItem(unittest.TestCase):
         item = ACMPlusItem(**a)
 
         eq_(item.id, 2)
-        eq_(item.water_temp, Decimal(20.1))
+        eq_(item.water_temp, 20.1)
 
 
 if __name__ == '__main__':
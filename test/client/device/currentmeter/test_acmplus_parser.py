@@ -1,5 +1,5 @@
 import unittest
-from datetime import datetime, timezone
+from datetime import datetime, timezone, timedelta
 from decimal import Decimal
 from queue import Queue
 from unittest.mock import patch
@@ -32,6 +32,31 @@ class TestACMPlusReader(unittest.TestCase):
             else:
                 eq_(getattr(item, key), value)
 
+    @patch('buoy.client.device.common.base.Device')
+    def test_useDeviceClock_when_timestampIsDevice(self, mock_device):
+        reader = ACMPlusReader(device=mock_device, queue_save_data=Queue(), queue_notice=Queue(), timestamp='device')
+        reader.arrival = datetime(2017, 11, 29, 10, 18, 50, 300000, tzinfo=timezone.utc)
+
+        item = reader.parser("-0.61, -73.51, 10:18:48, 11-29-2017, 24.37")
+
+        eq_(item.date, datetime(2017, 11, 29, 10, 18, 48, tzinfo=timezone.utc))
+        eq_(round(reader.clock.offset, 3), -2.3)
+
+    @patch('buoy.client.device.common.base.Device')
+    def test_useArrivalTime_when_timestampIsArrival(self, mock_device):
+        reader = ACMPlusReader(device=mock_device, queue_save_data=Queue(), queue_notice=Queue(),
+                               timestamp='arrival')
+        reader.arrival = datetime.now(tz=timezone.utc) - timedelta(seconds=1)
+
+        item = reader.parser("-0.61, -73.51, 10:18:48, 11-29-2017, 24.37")
+
+        eq_(item.date, reader.arrival)
+
+    @patch('buoy.client.device.common.base.Device')
+    def test_raiseValueError_when_timestampModeIsUnknown(self, mock_device):
+        with self.assertRaises(ValueError):
+            ACMPlusReader(device=mock_device, queue_save_data=Queue(), queue_notice=Queue(), timestamp='gps')
+
     def test_convertToJson(self):
         matching = {
             'vx': 50,
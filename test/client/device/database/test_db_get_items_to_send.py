@@ -50,6 +50,44 @@ class BaseDBGetItemsTests(unittest.TestCase):
         eq_(len(rows), 15)
         ok_(all(a.id <= b.id for a, b in zip(rows[:-1], rows[1:])))
 
+    def test_should_returnAllItemsOnce_when_getItemsToSendByPages(self):
+        db_conf = prepare_db()
+        apply_sql_file('test/support/data/data_example.sql')
+
+        dev_db = self.db_cls(
+            db_config=db_conf,
+            db_tablename=self.db_tablename,
+            cls_item=self.item_class
+        )
+
+        expected = [row.id for row in dev_db.get_items_to_send(size=1000)]
+        ids = []
+        page = dev_db.get_items_to_send(size=4)
+        while page:
+            ids += [row.id for row in page]
+            page = dev_db.get_items_to_send(size=4, after=(page[-1].date, page[-1].id))
+
+        eq_(ids, expected)
+
+    def test_should_returnNewestFirst_when_getNewestItemsToSendByPages(self):
+        db_conf = prepare_db()
+        apply_sql_file('test/support/data/data_example.sql')
+
+        dev_db = self.db_cls(
+            db_config=db_conf,
+            db_tablename=self.db_tablename,
+            cls_item=self.item_class
+        )
+
+        expected = [row.id for row in reversed(dev_db.get_items_to_send(size=1000))]
+        ids = []
+        page = dev_db.get_newest_items_to_send(size=4)
+        while page:
+            ids += [row.id for row in page]
+            page = dev_db.get_newest_items_to_send(size=4, after=(page[-1].date, page[-1].id))
+
+        eq_(ids, expected)
+
     def test_should_returnZeroItems_when_getItemsToSend(self):
         db_conf = prepare_db()
         apply_sql_file('test/support/data/data_not_send.sql')
@@ -0,0 +1,110 @@
+import threading
+import unittest
+from datetime import datetime, timezone
+from unittest.mock import patch, MagicMock
+
+from nose.tools import eq_
+from psycopg2 import DatabaseError, OperationalError
+
+from buoy.client.device.common.database import DeviceDB
+from buoy.client.device.common.nmea0183 import WIMDA
+
+
+class FakePool(object):
+    def __init__(self, *args, **kwargs):
+        self.connections = {}
+        self.closed_connections = []
+        self.returned_connections = []
+        self.closed = False
+
+    def getconn(self, key=None):
+        if key not in self.connections:
+            self.connections[key] = MagicMock(closed=0)
+        return self.connections[key]
+
+    def putconn(self, conn, key=None, close=False):
+        (self.closed_connections if close else self.returned_connections).append(conn)
+        del self.connections[key]
+
+
+@patch('buoy.client.device.common.database.ThreadedConnectionPool', side_effect=FakePool)
+class TestDeviceDBPool(unittest.TestCase):
+    def test_useDifferentConnection_when_callFromDifferentThreads(self, mock_pool):
+        db = DeviceDB(db_config={'pool_max': 2}, db_tablename='pb200', cls_item=WIMDA)
+        connections = []
+
+        thread = threading.Thread(target=lambda: connections.append(db.connection))
+        thread.start()
+        thread.join()
+        connections.append(db.connection)
+
+        eq_(len(connections), 2)
+        eq_(connections[0] is connections[1], False)
+        eq_(db.connection is connections[1], True)
+
+    def test_returnConnectionToPool_when_threadReleasesIt(self, mock_pool):
+        db = DeviceDB(db_config={'pool_max': 2}, db_tablename='pb200', cls_item=WIMDA)
+        connections = []
+
+        def run():
+            connections.append(db.connection)
+            db.release_connection()
+            db.release_connection()
+
+        for _ in range(3):
+            thread = threading.Thread(target=run)
+            thread.start()
+            thread.join()
+
+        eq_(db.pool.connections, {})
+        eq_(db.pool.returned_connections, connections)
+
+    def test_passConnectionParamsWithoutPoolParams_when_createPool(self, mock_pool):
+        DeviceDB(db_config={'pool_min': 2, 'pool_max': 3, 'host': 'localhost'}, db_tablename='pb200', cls_item=WIMDA)
+
+        mock_pool.assert_called_once_with(2, 3, host='localhost')
+
+    def test_reconnect_when_connectionIsClosed(self, mock_pool):
+        db = DeviceDB(db_config={}, db_tablename='pb200', cls_item=WIMDA)
+        first = db.connection
+        first.closed = 2
+
+        eq_(db.connection is first, False)
+        eq_(db.pool.closed_connections, [first])
+
+    def test_retryWithNewConnection_when_serverHasRestarted(self, mock_pool):
+        db = DeviceDB(db_config={}, db_tablename='pb200', cls_item=WIMDA)
+        first = db.connection
+        first.cursor.side_effect = OperationalError("server closed the connection unexpectedly")
+
+        db.update_status([1, 2])
+
+        second = db.connection
+        eq_(second is first, False)
+        eq_(second.commit.call_count, 1)
+        eq_(first.rollback.call_count, 0)
+
+    def test_rollback_when_queryFails(self, mock_pool):
+        db = DeviceDB(db_config={}, db_tablename='pb200', cls_item=WIMDA)
+        connection = db.connection
+        cursor = connection.cursor.return_value.__enter__.return_value
+        cursor.execute.side_effect = ValueError()
+
+        self.assertRaises(ValueError, db.update_status, [1])
+        eq_(connection.rollback.call_count, 1)
+        eq_(connection.commit.call_count, 0)
+
+    @patch('buoy.client.device.common.database.execute_values', return_value=[(1,), (2,)])
+    def test_itemsWithoutId_when_commitFails(self, mock_execute_values, mock_pool):
+        db = DeviceDB(db_config={}, db_tablename='pb200', cls_item=WIMDA)
+        db.connection.commit.side_effect = DatabaseError()
+        items = [WIMDA(date=datetime.now(tz=timezone.utc), air_temp='26.8') for _ in range(2)]
+
+        db.save_many(items)
+
+        eq_(mock_execute_values.call_count, 1)
+        eq_([item.id for item in items], [None, None])
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -68,6 +68,22 @@ class BaseDBTests(unittest.TestCase):
 
         eq_(row['id'], item.id)
 
+    def test_add_items_in_db_in_one_transaction(self):
+        items_to_insert = [self.item_class(**self.data) for _ in range(3)]
+
+        dev_db = DeviceDB(
+            db_config=db_conf,
+            db_tablename=self.db_tablename,
+            cls_item=self.item_class
+        )
+
+        items = dev_db.save_many(items_to_insert)
+
+        rows = apply_sql_clause("""SELECT * FROM %s ORDER BY id""" % (self.db_tablename,))
+
+        eq_(len(rows), 3)
+        eq_([row['id'] for row in rows], [item.id for item in items])
+
 
 class TestACMPlus(BaseDBTests):
     item_class = ACMPlusItem
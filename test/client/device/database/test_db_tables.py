@@ -0,0 +1,43 @@
+import unittest
+from datetime import datetime, timezone
+from unittest.mock import patch
+
+from nose.tools import eq_
+
+from buoy.client.device.common.database import DeviceDB
+from buoy.client.device.common.nmea0183 import WIMDA, WIMWV
+from buoy.client.device.weatherstation.sentences import get_tables
+
+
+class TestDeviceDBTables(unittest.TestCase):
+    def setUp(self):
+        patcher = patch('buoy.client.device.common.database.ThreadedConnectionPool')
+        patcher.start()
+        self.addCleanup(patcher.stop)
+        self.db = DeviceDB(db_config={}, db_tablename='pb200', cls_item=WIMDA, tables=get_tables(['WIMDA', 'WIMWV']))
+
+    def test_useTableOfClass_when_getSQL(self):
+        eq_(self.db.get_sql(WIMWV).tablename, 'pb200_wind')
+        eq_(self.db.get_sql(WIMDA).tablename, 'pb200')
+        eq_(self.db.get_sql().tablename, 'pb200')
+
+    def test_startWithMainClass_when_getClasses(self):
+        eq_(self.db.classes, [WIMDA, WIMWV])
+
+    @patch('buoy.client.device.common.database.execute_values')
+    def test_insertOnceByClass_when_saveItemsOfSeveralSentences(self, mock_execute_values):
+        mock_execute_values.side_effect = lambda cur, sql, values, **kwargs: [(i,) for i in range(len(values))]
+        date = datetime.now(tz=timezone.utc)
+        items = [WIMDA(date=date, air_temp='26.8'), WIMWV(date=date, wind_angle='51.4', reference='R'),
+                 WIMDA(date=date, air_temp='26.9')]
+
+        self.db.save_many(items)
+
+        eq_(mock_execute_values.call_count, 2)
+        tables = [call[0][1].split('(')[0] for call in mock_execute_values.call_args_list]
+        eq_(tables, ['INSERT INTO pb200', 'INSERT INTO pb200_wind'])
+        eq_([len(call[0][2]) for call in mock_execute_values.call_args_list], [2, 1])
+
+
+if __name__ == '__main__':
+    unittest.main()
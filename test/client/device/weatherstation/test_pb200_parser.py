@@ -1,11 +1,15 @@
 import unittest
 from datetime import datetime, timezone
 from queue import Queue
-from unittest.mock import patch
+from unittest.mock import patch, MagicMock
 
-from nose.tools import ok_
+from nose.tools import ok_, eq_
 
-from buoy.client.device.weatherstation.pb200 import PB200Reader, WIMDA
+from buoy.client.device.common.nmea0183 import WIMDA, WIMWV, YXXDR, HCHDG, GPGGA, GPVTG
+from buoy.client.device.weatherstation.pb200 import PB200Reader
+from buoy.client.device.weatherstation.sentences import get_sentences, get_tables
+
+STREAM_FILE = 'test/support/data/pb200_stream.nmea'
 
 
 class TestACMPlusReader(unittest.TestCase):
@@ -44,6 +48,42 @@ class TestACMPlusReader(unittest.TestCase):
 
         ok_(item == item_expected)
 
+    @patch('buoy.client.device.common.base.Device')
+    def test_should_returnItemOfEachSentence_when_parseStream(self, mock_device):
+        reader = PB200Reader(device=mock_device, queue_save_data=Queue(), queue_notice=Queue())
+        with open(STREAM_FILE) as fh:
+            lines = fh.read().splitlines()[:9]
+
+        items = [reader.parser(line) for line in lines]
+
+        eq_([type(item) for item in items if item],
+            [GPGGA, GPVTG, HCHDG, WIMWV, WIMWV, YXXDR, WIMDA])
+
+    @patch('buoy.client.device.common.base.Device')
+    def test_should_discardSentence_when_isNotConfigured(self, mock_device):
+        reader = PB200Reader(device=mock_device, queue_save_data=Queue(), queue_notice=Queue(), sentences=['WIMDA'])
+
+        eq_(reader.parser("$WIMWV,51.4,R,12.1,N,A*21"), None)
+
+    @patch('buoy.client.device.common.base.Device')
+    def test_passReceivedBytesToParser_when_processData(self, mock_device):
+        queue = Queue()
+        reader = PB200Reader(device=mock_device, queue_save_data=queue, queue_notice=Queue())
+        reader.parser = MagicMock(return_value=None)
+
+        reader.feed(b"$WIMWV,51.4,R,12.1,N,A*21\r\n")
+
+        reader.parser.assert_called_once_with(b"$WIMWV,51.4,R,12.1,N,A*21")
+
+
+class TestSentences(unittest.TestCase):
+    def test_raiseValueError_when_sentenceIsNotRegistered(self):
+        with self.assertRaises(ValueError):
+            get_sentences(['GPXXX'])
+
+    def test_returnTableOfEachSentence_when_getTables(self):
+        eq_(get_tables(['WIMDA', 'GPGGA']), {WIMDA: 'pb200', GPGGA: 'pb200_position'})
+
 
 if __name__ == '__main__':
     unittest.main()
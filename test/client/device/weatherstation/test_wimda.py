@@ -1,12 +1,10 @@
 import json
 import unittest
 from datetime import datetime
-from decimal import Decimal
 
-import pynmea2
 from nose.tools import eq_, ok_
 
-from buoy.client.device.weatherstation.pb200 import WIMDA
+from buoy.client.device.common.nmea0183 import WIMDA
 
 
 class TestProtocolNMEA0183(unittest.TestCase):
@@ -35,8 +33,8 @@ class TestProtocolNMEA0183(unittest.TestCase):
             value = getattr(item_expected, name)
             if type(value) is datetime:
                 eq_(True, True)
-            elif type(value) is Decimal:
-                eq_(value, Decimal(self.data[name]))
+            elif type(value) is float:
+                eq_(value, float(self.data[name]))
             else:
                 eq_(value, self.data[name])
 
@@ -44,14 +42,14 @@ class TestProtocolNMEA0183(unittest.TestCase):
         item_expected = WIMDA(**self.data)
 
         press_bar = '1.027'
-        mda = pynmea2.MDA('WI', 'MDA', (
+        values = [
             self.data['press_inch'], 'I', press_bar, 'B',
             self.data['air_temp'], 'C', self.data['water_temp'], 'C', self.data['rel_humidity'],
             self.data['abs_humidity'], self.data['dew_point'], 'C', self.data['wind_dir_true'], 'T',
             self.data['wind_dir_magnetic'], 'M', self.data['wind_knots'], 'N',
-            self.data['wind_meters'], 'M'))
+            self.data['wind_meters'], 'M']
 
-        item = WIMDA.from_nmea(self.data['date'], mda)
+        item = WIMDA.from_sentence(self.data['date'], values)
 
         eq_(item, item_expected)
 
@@ -94,7 +92,7 @@ class TestProtocolNMEA0183(unittest.TestCase):
         item = WIMDA(**a)
 
         eq_(item.id, 2)
-        eq_(item.wind_knots, Decimal(134.6))
+        eq_(item.wind_knots, 134.6)
 
 
 if __name__ == '__main__':
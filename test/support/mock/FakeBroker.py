@@ -0,0 +1,267 @@
+"""
+Broker MQTT 3.1.1 mínimo en el propio proceso, para medir el envío sin un broker real. Atiende CONNECT,
+PUBLISH (QoS 0, 1 y 2), SUBSCRIBE, PINGREQ y DISCONNECT, y emula una red móvil: latencia de las
+confirmaciones, pérdida de mensajes y desconexiones forzadas.
+
+    broker = FakeBroker(ack_latency=0.15, loss=0.01)
+    broker.start()
+    ... ItemSendThread(broker_url='127.0.0.1', broker_port=broker.port, ...)
+    broker.stop()
+"""
+import heapq
+import logging
+import random
+import select
+import socket
+import struct
+import time
+from threading import Thread, Event, Lock, Condition
+
+logger = logging.getLogger(__name__)
+
+CONNECT, CONNACK, PUBLISH, PUBACK, PUBREC, PUBREL, PUBCOMP, SUBSCRIBE, SUBACK, UNSUBSCRIBE, UNSUBACK, \
+    PINGREQ, PINGRESP, DISCONNECT = range(1, 15)
+
+CONNACK_ACCEPTED = 0
+CONNACK_REFUSED_PROTOCOL = 1
+PROTOCOL_LEVEL_311 = 4
+
+
+def encode_length(length: int) -> bytes:
+    """ Longitud restante del paquete en el formato de longitud variable de MQTT """
+    data = bytearray()
+    while True:
+        byte, length = length % 128, length // 128
+        data.append(byte | 0x80 if length else byte)
+        if not length:
+            return bytes(data)
+
+
+def packet(packet_type: int, body: bytes = b'', flags: int = 0) -> bytes:
+    return bytes([packet_type << 4 | flags]) + encode_length(len(body)) + body
+
+
+class BrokerConnection(object):
+    """
+    Conexión de un cliente. Las respuestas se escriben desde un hilo propio cuando vence su latencia,
+    de forma que la lectura de paquetes no se detiene mientras se esperan las confirmaciones.
+    """
+
+    def __init__(self, broker, sock: socket.socket):
+        self.broker = broker
+        self.sock = sock
+        self.client_id = None
+        self.closed = False
+        self._buffer = b''
+        self._responses = []
+        self._sequence = 0
+        self._condition = Condition()
+        self._writer = Thread(target=self._write_responses, daemon=True)
+        self._writer.start()
+
+    def respond(self, data: bytes, latency: float = 0):
+        with self._condition:
+            self._sequence += 1
+            heapq.heappush(self._responses, (time.monotonic() + latency, self._sequence, data))
+            self._condition.notify()
+
+    def _write_responses(self):
+        while True:
+            with self._condition:
+                while not self.closed and (not self._responses or self._responses[0][0] > time.monotonic()):
+                    self._condition.wait(self._responses[0][0] - time.monotonic() if self._responses else None)
+                if self.closed:
+                    return
+                _, _, data = heapq.heappop(self._responses)
+            try:
+                self.sock.sendall(data)
+            except OSError:
+                return
+
+    def feed(self, data: bytes):
+        """ Añade los bytes recibidos y procesa los paquetes completos """
+        self._buffer += data
+        while len(self._buffer) >= 2:
+            length, multiplier, pos = 0, 1, 1
+            while True:
+                if pos >= len(self._buffer):
+                    return
+                byte = self._buffer[pos]
+                length += (byte & 0x7F) * multiplier
+                multiplier *= 128
+                pos += 1
+                if not byte & 0x80:
+                    break
+            if len(self._buffer) < pos + length:
+                return
+
+            header, body = self._buffer[0], self._buffer[pos:pos + length]
+            self._buffer = self._buffer[pos + length:]
+            self.handle(header >> 4, header & 0x0F, body)
+
+    def handle(self, packet_type: int, flags: int, body: bytes):
+        broker = self.broker
+        if packet_type == CONNECT:
+            name_length = struct.unpack('!H', body[:2])[0]
+            level = body[2 + name_length]
+            client_id_length = struct.unpack('!H', body[6 + name_length:8 + name_length])[0]
+            self.client_id = body[8 + name_length:8 + name_length + client_id_length].decode()
+            rc = CONNACK_ACCEPTED if level == PROTOCOL_LEVEL_311 else CONNACK_REFUSED_PROTOCOL
+            broker.connections += 1
+            self.respond(packet(CONNACK, bytes([0, rc])), broker.latency())
+        elif packet_type == PUBLISH:
+            qos = flags >> 1 & 0x03
+            topic_length = struct.unpack('!H', body[:2])[0]
+            topic = body[2:2 + topic_length].decode()
+            pos = 2 + topic_length
+            packet_id = body[pos:pos + 2] if qos else None
+            payload = body[pos + 2:] if qos else body[pos:]
+            if broker.random.random() < broker.loss:
+                # Mensaje perdido en la red: ni se entrega ni se confirma
+                broker.lost += 1
+                return
+            broker.deliver(topic, payload, retain=bool(flags & 0x01))
+            if qos == 1:
+                self.respond(packet(PUBACK, packet_id), broker.latency())
+            elif qos == 2:
+                self.respond(packet(PUBREC, packet_id), broker.latency())
+        elif packet_type == PUBREL:
+            self.respond(packet(PUBCOMP, body[:2]), broker.latency())
+        elif packet_type == SUBSCRIBE:
+            # Se conceden los QoS pedidos, los mensajes no se reenvían a los suscriptores
+            pos, granted = 2, bytearray()
+            while pos < len(body):
+                topic_length = struct.unpack('!H', body[pos:pos + 2])[0]
+                pos += 2 + topic_length
+                granted.append(body[pos] & 0x03)
+                pos += 1
+            self.respond(packet(SUBACK, body[:2] + bytes(granted)), broker.latency())
+        elif packet_type == UNSUBSCRIBE:
+            self.respond(packet(UNSUBACK, body[:2]), broker.latency())
+        elif packet_type == PINGREQ:
+            self.respond(packet(PINGRESP), broker.latency())
+        elif packet_type == DISCONNECT:
+            self.close()
+
+    def close(self):
+        with self._condition:
+            self.closed = True
+            self._condition.notify()
+        try:
+            self.sock.shutdown(socket.SHUT_RDWR)
+        except OSError:
+            pass
+        self.sock.close()
+
+
+class FakeBroker(object):
+    """
+    Broker MQTT 3.1.1 en un hilo, escuchando en address:port (port 0 elige un puerto libre)
+
+    :param ack_latency: Segundos hasta enviar cada respuesta (CONNACK, PUBACK, PINGRESP...)
+    :param ack_jitter: Variación aleatoria de la latencia, en segundos
+    :param loss: Probabilidad de perder un PUBLISH, que no se confirma
+    :param disconnect_every: Segundos entre desconexiones forzadas de los clientes, None para no desconectar
+    :param keep_messages: Guarda los mensajes recibidos en messages
+    """
+
+    def __init__(self, **kwargs):
+        self.address = kwargs.pop('address', '127.0.0.1')
+        self.port = kwargs.pop('port', 0)
+        self.ack_latency = kwargs.pop('ack_latency', 0)
+        self.ack_jitter = kwargs.pop('ack_jitter', 0)
+        self.loss = kwargs.pop('loss', 0)
+        self.disconnect_every = kwargs.pop('disconnect_every', None)
+        self.keep_messages = kwargs.pop('keep_messages', False)
+        self.random = random.Random(kwargs.pop('seed', None))
+
+        self.messages = []
+        self.retained = {}
+        self.published = 0
+        self.published_bytes = 0
+        self.lost = 0
+        self.connections = 0
+        self.disconnections = 0
+        self._clients = {}
+        self._lock = Lock()
+        self._server = None
+        self._thread = None
+        self._stop_event = Event()
+        self._disconnect_event = Event()
+
+    def latency(self) -> float:
+        return max(self.ack_latency + self.random.uniform(-self.ack_jitter, self.ack_jitter), 0)
+
+    def deliver(self, topic: str, payload: bytes, retain: bool = False):
+        with self._lock:
+            self.published += 1
+            self.published_bytes += len(payload)
+            if retain:
+                self.retained[topic] = payload
+            if self.keep_messages:
+                self.messages.append((topic, payload))
+
+    def start(self) -> int:
+        """ Empieza a escuchar y retorna el puerto """
+        self._server = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
+        self._server.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEADDR, 1)
+        self._server.bind((self.address, self.port))
+        self._server.listen()
+        self.port = self._server.getsockname()[1]
+        self._stop_event.clear()
+        self._thread = Thread(target=self.run, name='FakeBroker', daemon=True)
+        self._thread.start()
+        logger.info("Fake broker listening on %s:%i", self.address, self.port)
+
+        return self.port
+
+    def stop(self):
+        self._stop_event.set()
+        if self._thread:
+            self._thread.join()
+        self._close_clients()
+        self._server.close()
+
+    def disconnect_clients(self):
+        """ Cierra las conexiones de todos los clientes, como una caída de la red """
+        self._disconnect_event.set()
+
+    def _close_clients(self):
+        logger.info("Closing connection of %i clients", len(self._clients))
+        for connection in list(self._clients.values()):
+            connection.close()
+            self.disconnections += 1
+        self._clients.clear()
+
+    @property
+    def num_clients(self) -> int:
+        return len(self._clients)
+
+    def run(self):
+        next_disconnect = time.monotonic() + self.disconnect_every if self.disconnect_every else None
+        while not self._stop_event.is_set():
+            if next_disconnect and time.monotonic() >= next_disconnect:
+                self._disconnect_event.set()
+                next_disconnect = time.monotonic() + self.disconnect_every
+            if self._disconnect_event.is_set():
+                self._disconnect_event.clear()
+                self._close_clients()
+
+            readable, _, _ = select.select([self._server] + list(self._clients), [], [], 0.1)
+            for sock in readable:
+                if sock is self._server:
+                    client, _ = self._server.accept()
+                    client.setsockopt(socket.IPPROTO_TCP, socket.TCP_NODELAY, 1)
+                    self._clients[client] = BrokerConnection(self, client)
+                    continue
+
+                connection = self._clients.get(sock)
+                try:
+                    data = sock.recv(65536)
+                except OSError:
+                    data = b''
+                if data:
+                    connection.feed(data)
+                if not data or connection.closed:
+                    connection.close()
+                    self._clients.pop(sock, None)
@@ -0,0 +1,297 @@
+"""
+Emuladores del ACMPlus y del PB200 sobre un pseudo-terminal (pty), para pruebas de carga y de larga
+duración con los demonios reales. El extremo esclavo del pty se comporta como un puerto serie, basta con
+apuntar serial_config.port a su ruta (o al enlace fijo indicado con link, que sobrevive a las desconexiones).
+
+    python -m test.support.mock.InstrumentEmulator acmplus --rate 100 --link /tmp/acmplus
+    python -m test.support.mock.InstrumentEmulator pb200 --rate 10 --garbage 0.01 --disconnect-every 300
+"""
+import argparse
+import errno
+import logging
+import os
+import pty
+import random
+import select
+import signal
+import sys
+import time
+import tty
+from datetime import datetime, timezone
+from threading import Thread, Event
+from typing import List
+
+from buoy.client.device.common.nmea0183 import nmea_checksum
+
+logger = logging.getLogger(__name__)
+
+PB200_STREAM_FILE = 'test/support/data/pb200_stream.nmea'
+
+
+class InstrumentEmulator(object):
+    """
+    Emulador de un instrumento: escribe registros en el extremo maestro del pty a rate registros por
+    segundo y atiende los comandos que recibe (terminados en \\r).
+
+    :param rate: Registros por segundo (1 es la cadencia normal de los instrumentos)
+    :param jitter: Variación aleatoria del intervalo entre registros, en fracción del intervalo
+    :param garbage: Probabilidad de escribir bytes basura antes de un registro
+    :param split: Probabilidad de partir un registro en dos escrituras separadas split_delay segundos
+    :param disconnect_every: Segundos entre desconexiones del puerto, None para no desconectar nunca
+    :param disconnect_time: Segundos que el puerto permanece desconectado
+    :param link: Enlace simbólico que apunta siempre al puerto activo
+    """
+    responses = {}
+
+    def __init__(self, **kwargs):
+        self.rate = kwargs.pop('rate', 1)
+        self.jitter = kwargs.pop('jitter', 0)
+        self.garbage = kwargs.pop('garbage', 0)
+        self.split = kwargs.pop('split', 0)
+        self.split_delay = kwargs.pop('split_delay', 0.01)
+        self.disconnect_every = kwargs.pop('disconnect_every', None)
+        self.disconnect_time = kwargs.pop('disconnect_time', 5)
+        self.link = kwargs.pop('link', None)
+        self.random = random.Random(kwargs.pop('seed', None))
+
+        self.commands = []
+        self.records = 0
+        self.dropped = 0
+        self.disconnections = 0
+        self._master_fd, self._slave_fd = None, None
+        self.port = None
+        self._command_buffer = b''
+        self._thread = None
+        self._stop_event = Event()
+
+    def open(self):
+        """ Crea el pty, la ruta del puerto queda en port """
+        self._master_fd, self._slave_fd = pty.openpty()
+        # Modo raw: sin eco ni traducción de fin de línea, como un puerto serie
+        tty.setraw(self._slave_fd)
+        os.set_blocking(self._master_fd, False)
+        self.port = os.ttyname(self._slave_fd)
+        if self.link:
+            tmp_link = self.link + '.tmp'
+            if os.path.lexists(tmp_link):
+                os.unlink(tmp_link)
+            os.symlink(self.port, tmp_link)
+            os.replace(tmp_link, self.link)
+        logger.info("Emulator listening on %s", self.port)
+
+        return self.port
+
+    def close(self):
+        for fd in (self._master_fd, self._slave_fd):
+            if fd is not None:
+                os.close(fd)
+        self._master_fd, self._slave_fd = None, None
+
+    def disconnect(self):
+        """ Cierra el pty como si se desconectara el instrumento, las lecturas pendientes fallan """
+        logger.info("Emulator disconnected from %s", self.port)
+        self.disconnections += 1
+        self.close()
+
+    def start(self) -> Thread:
+        if self._master_fd is None:
+            self.open()
+        self._stop_event.clear()
+        self._thread = Thread(target=self.run, name=type(self).__name__, daemon=True)
+        self._thread.start()
+
+        return self._thread
+
+    def stop(self):
+        self._stop_event.set()
+        if self._thread:
+            self._thread.join()
+        self.close()
+        if self.link and os.path.lexists(self.link):
+            os.unlink(self.link)
+
+    def run(self):
+        interval = 1 / self.rate
+        next_record = time.monotonic()
+        next_disconnect = next_record + self.disconnect_every if self.disconnect_every else None
+        while not self._stop_event.is_set():
+            now = time.monotonic()
+            if next_disconnect and now >= next_disconnect:
+                self.disconnect()
+                if self._stop_event.wait(self.disconnect_time):
+                    break
+                self.open()
+                now = time.monotonic()
+                next_record, next_disconnect = now, now + self.disconnect_every
+
+            if now >= next_record:
+                self.send_record(self.record())
+                next_record += interval * (1 + self.random.uniform(-self.jitter, self.jitter))
+                # Si el emulador se retrasa no se intenta recuperar el ritmo con ráfagas
+                next_record = max(next_record, now - interval)
+                continue
+
+            # Espera acotada para atender stop y las desconexiones con cadencias bajas
+            readable, _, _ = select.select([self._master_fd], [], [], min(next_record - now, 0.5))
+            if readable:
+                self.read_commands()
+
+    def record(self) -> bytes:
+        """ Siguiente registro del instrumento, con su fin de línea """
+        raise NotImplementedError
+
+    def send_record(self, data: bytes):
+        self.records += 1
+        if self.garbage and self.random.random() < self.garbage:
+            # Ruido en la línea: bytes aleatorios sin fin de línea, corrompen el registro que les sigue
+            self.write(bytes(self.random.randrange(32, 256) for _ in range(self.random.randint(1, 16))))
+
+        if self.split and self.random.random() < self.split:
+            middle = self.random.randint(1, len(data) - 1)
+            self.write(data[:middle])
+            self._stop_event.wait(self.split_delay)
+            data = data[middle:]
+
+        self.write(data)
+
+    def write(self, data: bytes):
+        if self._master_fd is None:
+            return
+        try:
+            os.write(self._master_fd, data)
+        except OSError as ex:
+            # Nadie lee el puerto y se ha llenado el buffer del pty, como en un puerto serie se pierden los datos
+            if ex.errno not in (errno.EAGAIN, errno.EIO):
+                raise
+            self.dropped += 1
+
+    def read_commands(self):
+        try:
+            self._command_buffer += os.read(self._master_fd, 1024)
+        except OSError as ex:
+            # EIO: no hay ningún proceso con el puerto abierto
+            if ex.errno not in (errno.EAGAIN, errno.EIO):
+                raise
+            return
+
+        *commands, self._command_buffer = self._command_buffer.split(b'\r')
+        for command in commands:
+            command = command.strip()
+            if command:
+                self.commands.append(command.decode(errors='replace'))
+                logger.info("Command received: %s", command)
+                if command in self.responses:
+                    self.write(self.responses[command])
+
+
+class ACMPlusEmulator(InstrumentEmulator):
+    """
+    Correntímetro ACMPlus: una línea por registro con velocidad (vx, vy), hora, fecha y temperatura del
+    agua, con la hora del sistema en UTC. Responde al comando MODE que envía ACMPlus.configure con su eco.
+    """
+    responses = {b'MODE': b'MODE\r\n'}
+
+    def __init__(self, **kwargs):
+        super(ACMPlusEmulator, self).__init__(**kwargs)
+        self.vx, self.vy, self.water_temp = -0.61, -73.51, 24.37
+
+    def record(self) -> bytes:
+        self.vx = min(max(self.vx + self.random.uniform(-0.5, 0.5), -150), 150)
+        self.vy = min(max(self.vy + self.random.uniform(-0.5, 0.5), -150), 150)
+        self.water_temp = min(max(self.water_temp + self.random.uniform(-0.01, 0.01), 10), 30)
+        now = datetime.now(tz=timezone.utc)
+
+        return ("%8.2f, %7.2f, %s, %6.2f\r\n" % (self.vx, self.vy, now.strftime("%H:%M:%S, %m-%d-%Y"),
+                                                 self.water_temp)).encode()
+
+
+class PB200Emulator(InstrumentEmulator):
+    """
+    Estación meteorológica PB200: cada registro es un ciclo completo de sentencias NMEA 0183 del flujo
+    de ejemplo, con la hora y la fecha actuales en $GPGGA y $GPZDA y la suma de control recalculada.
+    """
+
+    def __init__(self, **kwargs):
+        stream_file = kwargs.pop('stream_file', PB200_STREAM_FILE)
+        super(PB200Emulator, self).__init__(**kwargs)
+        self.cycles = self.load_cycles(stream_file)
+        self._index = 0
+
+    @staticmethod
+    def load_cycles(path: str) -> List[List[List[str]]]:
+        """ Agrupa las sentencias del fichero en ciclos, cada ciclo empieza con $GPGGA """
+        cycles = []
+        with open(path, 'r', newline='') as fh:
+            for line in fh.read().split('\n'):
+                line = line.strip()
+                if not line.startswith('$'):
+                    continue
+                fields = line[1:line.find('*')].split(',')
+                if fields[0] == 'GPGGA' or not cycles:
+                    cycles.append([])
+                cycles[-1].append(fields)
+
+        return cycles
+
+    def record(self) -> bytes:
+        cycle = self.cycles[self._index]
+        self._index = (self._index + 1) % len(self.cycles)
+        now = datetime.now(tz=timezone.utc)
+        hour = now.strftime("%H%M%S.") + "%02i" % (now.microsecond // 10000,)
+
+        sentences = []
+        for fields in cycle:
+            fields = list(fields)
+            if fields[0] == 'GPGGA':
+                fields[1] = hour
+            elif fields[0] == 'GPZDA':
+                fields[1:5] = [hour, now.strftime("%d"), now.strftime("%m"), now.strftime("%Y")]
+            body = ','.join(fields).encode()
+            sentences.append(b'$%s*%02X\r\n' % (body, nmea_checksum(body)))
+
+        return b''.join(sentences)
+
+
+EMULATORS = {
+    'acmplus': ACMPlusEmulator,
+    'pb200': PB200Emulator
+}
+
+
+def parse_args(args: List[str] = None):
+    parser = argparse.ArgumentParser(prog='python -m test.support.mock.InstrumentEmulator',
+                                     description="Emula un instrumento en un pseudo-terminal")
+    parser.add_argument('instrument', choices=sorted(EMULATORS))
+    parser.add_argument('--rate', type=float, default=1, help="Registros por segundo")
+    parser.add_argument('--jitter', type=float, default=0, help="Variación del intervalo, en fracción del intervalo")
+    parser.add_argument('--garbage', type=float, default=0, help="Probabilidad de bytes basura antes de un registro")
+    parser.add_argument('--split', type=float, default=0, help="Probabilidad de partir un registro en dos escrituras")
+    parser.add_argument('--disconnect-every', type=float, help="Segundos entre desconexiones")
+    parser.add_argument('--disconnect-time', type=float, default=5, help="Segundos desconectado")
+    parser.add_argument('--link', help="Enlace simbólico al puerto activo, para usar en serial_config.port")
+    parser.add_argument('--seed', type=int)
+
+    return parser.parse_args(args)
+
+
+def main(args: List[str] = None):
+    logging.basicConfig(level=logging.INFO)
+    options = vars(parse_args(args))
+    emulator = EMULATORS[options.pop('instrument')](**options)
+    print(emulator.open(), flush=True)
+
+    stop = Event()
+    signal.signal(signal.SIGTERM, lambda *_: stop.set())
+    emulator.start()
+    try:
+        while not stop.wait(60):
+            logger.info("Records: %i, dropped: %i, disconnections: %i, commands: %i", emulator.records,
+                        emulator.dropped, emulator.disconnections, len(emulator.commands))
+    except KeyboardInterrupt:
+        pass
+    finally:
+        emulator.stop()
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,91 @@
+import fcntl
+import os
+import struct
+import termios
+import time
+from threading import Thread
+from typing import Iterable
+
+
+class ReplaySerial(object):
+    """
+    Puerto serie simulado sobre un pipe: tiene descriptor real, por lo que funciona con la lectura en
+    modo select y con el bucle asyncio. Los datos se entregan con replay, desde otro hilo, en trozos
+    de chunk_size bytes y a lines_per_second líneas por segundo (sin límite si es None).
+    """
+
+    def __init__(self, **kwargs):
+        self._read_fd, self._write_fd = os.pipe()
+        self.is_open = True
+        self.written = []
+        self._feeder = None
+
+    def fileno(self) -> int:
+        return self._read_fd
+
+    @property
+    def in_waiting(self) -> int:
+        if not self.is_open:
+            return 0
+        return struct.unpack('I', fcntl.ioctl(self._read_fd, termios.FIONREAD, b'\0\0\0\0'))[0]
+
+    def read(self, size: int = 1) -> bytes:
+        if not self.is_open:
+            raise OSError("Port closed")
+        if not size:
+            return b''
+
+        data = os.read(self._read_fd, size)
+        if not data:
+            # Fin de los datos, como un dispositivo desconectado
+            self.is_open = False
+            raise OSError("Device disconnected")
+
+        return data
+
+    def write(self, data: bytes) -> int:
+        self.written.append(data)
+        return len(data)
+
+    def replay(self, lines: Iterable[bytes], lines_per_second: float = None, chunk_size: int = 64,
+               close: bool = False) -> Thread:
+        """ Escribe las líneas en el pipe desde un hilo, close cierra el pipe al terminar """
+        self._feeder = Thread(target=self._feed, args=(lines, lines_per_second, chunk_size, close), daemon=True)
+        self._feeder.start()
+
+        return self._feeder
+
+    def _feed(self, lines, lines_per_second, chunk_size, close):
+        interval = 1 / lines_per_second if lines_per_second else 0
+        deadline = time.monotonic()
+        pending = b''
+        try:
+            for line in lines:
+                pending += line
+                if interval:
+                    deadline += interval
+                    delay = deadline - time.monotonic()
+                    if delay > 0:
+                        time.sleep(delay)
+                while len(pending) >= chunk_size or (interval and pending):
+                    os.write(self._write_fd, pending[:chunk_size])
+                    pending = pending[chunk_size:]
+            if pending:
+                os.write(self._write_fd, pending)
+        except OSError:
+            return
+
+        if close:
+            self._close_write()
+
+    def _close_write(self):
+        if self._write_fd is not None:
+            os.close(self._write_fd)
+            self._write_fd = None
+
+    def close(self):
+        self.is_open = False
+        self._close_write()
+        if self._read_fd is not None:
+            os.close(self._read_fd)
+            self._read_fd = None